@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+
+import plot as plot_module
+from plot import AlignmentChart, BoxedPlot, Plot, RadarPlot, TrianglePlot
+from render_cache import RENDER_CACHE
+
+# Times what each plot type does for the bot (drawing with and without labels, zoomed and as contours, fits, stats,
+# radar animations, and the pickling every save and render goes through) on plots of 10 to 10,000 points, offline.
+# Every run is cold: rendered images are dropped from the caches first, and the plot is changed for the operations
+# it caches itself. Results are written as JSON (p50/p95/mean latency and the peak Python memory of one run per case),
+# and --baseline compares them with an earlier run so a slowdown fails before it's deployed.
+
+SIZES = [10, 100, 1000, 10000]
+
+# Radar animations are a frame per person, so they're only run up to this many points by default.
+MAX_GIF_POINTS = 200
+
+RADAR_LABELS = [["Strength"], ["Speed"], ["Wit"], ["Charm"], ["Luck"]]
+
+
+def make_plot(kind, n, rng):
+    """
+    :return: A plot of the given kind with n points in its bounds, and a function that moves one of them.
+    """
+    if kind == "RadarPlot":
+        plot = RadarPlot("Bench", RADAR_LABELS, ("bench", 0), 0)
+
+        def move(i):
+            plot.plot_point("user" + str(i % n), [rng.uniform(0, 10) for _ in RADAR_LABELS])
+    else:
+        if kind == "Plot":
+            plot = Plot("Bench", "left", "right", "bottom", "top", -10, 10, -10, 10, ("bench", 0), 0)
+        elif kind == "BoxedPlot":
+            plot = BoxedPlot("Bench", ["a", "b", "c"], ["d", "e", "f"], ("bench", 0), 0)
+        elif kind == "AlignmentChart":
+            plot = AlignmentChart("Bench", ["cell " + str(i) for i in range(9)], ("bench", 0), 0)
+        else:
+            plot = TrianglePlot("Bench", "left", "right", "top", ("bench", 0), 0)
+
+        def random_point():
+            if kind != "TrianglePlot":
+                return rng.uniform(-9, 9), rng.uniform(-9, 9)
+            # Uniform in the triangle (0, 0), (5, 10), (10, 0), kept off the edges.
+            a, b = rng.random(), rng.random()
+            if a + b > 1:
+                a, b = 1 - a, 1 - b
+            return 0.5 + 9 * a + 4.5 * b, 9 * b + 0.1
+
+        def move(i):
+            plot.plot_point("user" + str(i % n), *random_point())
+
+    for i in range(n):
+        move(i)
+    return plot, move
+
+
+def get_cases(kind, n, max_gif_points):
+    """
+    :return: A list of (operation name, function of the plot, whether it has to be changed before each run).
+    """
+    if kind == "RadarPlot":
+        cases = [("generate_plot", lambda p: p.generate_plot(), False),
+                 ("pickle", lambda p: pickle.loads(pickle.dumps(p)), False)]
+        if n <= max_gif_points:
+            cases.append(("radar_gif", lambda p: p.generate_plot(toggle_labels=False), False))
+        return cases
+
+    return [("generate_plot", lambda p: p.generate_plot(), False),
+            ("generate_plot_no_labels", lambda p: p.generate_plot(toggle_labels=False), False),
+            ("generate_plot_zoom", lambda p: p.generate_plot(zoom_x_min=0, zoom_y_min=0, zoom_x_max=5, zoom_y_max=5),
+             False),
+            ("generate_plot_contour", lambda p: p.generate_plot(contour=True), False),
+            ("generate_plot_density", lambda p: p.generate_plot(contour=True, density=True), False),
+            ("polyfit", lambda p: p.polyfit(2), True),
+            ("generate_stats", lambda p: p.generate_stats(), True),
+            ("pickle", lambda p: pickle.loads(pickle.dumps(p)), False)]
+
+
+def clear_caches():
+    RENDER_CACHE.clear()
+    plot_module.FRAMES.clear()
+
+
+def percentile(times, q):
+    return float(np.percentile(times, q))
+
+
+def run_case(plot, move, operation, change, runs):
+    """
+    Time an operation cold, then run it once more under tracemalloc for its peak memory.
+    :return: A dictionary of the results, in milliseconds and kilobytes.
+    """
+    times = []
+    for i in range(runs + 1):
+        clear_caches()
+        if change:
+            move(i)
+        start = time.perf_counter()
+        result = operation(plot)
+        elapsed = time.perf_counter() - start
+        if isinstance(result, tuple) and result[0] == 1:
+            raise RuntimeError(result[1])
+        # The first run pays for one-off setup such as imports and backgrounds.
+        if i > 0:
+            times.append(elapsed * 1000)
+
+    clear_caches()
+    if change:
+        move(runs + 1)
+    tracemalloc.start()
+    operation(plot)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"runs": runs,
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+            "mean_ms": round(float(np.mean(times)), 3),
+            "peak_kb": round(peak / 1024, 1)}
+
+
+def compare(results, baseline, max_ratio):
+    """
+    :return: A list of messages for the cases whose p50 is more than max_ratio times the baseline's.
+    """
+    old = {(r["plot"], r["points"], r["operation"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        before = old.get((r["plot"], r["points"], r["operation"]))
+        # Differences of a millisecond or so are noise.
+        if before is not None and r["p50_ms"] > max_ratio * before["p50_ms"] and r["p50_ms"] - before["p50_ms"] > 1:
+            regressions.append("%s with %d points, %s: p50 %.3f ms, was %.3f ms" %
+                               (r["plot"], r["points"], r["operation"], r["p50_ms"], before["p50_ms"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every plot type's renders, fits, stats and pickling.")
+    parser.add_argument("--plots", nargs="+", default=["Plot", "BoxedPlot", "AlignmentChart", "TrianglePlot",
+                                                       "RadarPlot"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--operations", nargs="+", default=None, help="Only run these operations.")
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--max-gif-points", type=int, default=MAX_GIF_POINTS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=None, help="Write the JSON here instead of to stdout.")
+    parser.add_argument("--baseline", default=None, help="JSON from an earlier run to compare with.")
+    parser.add_argument("--max-ratio", type=float, default=1.5,
+                        help="Fail if a p50 is more than this many times the baseline's.")
+    args = parser.parse_args()
+
+    results = []
+    for kind in args.plots:
+        for n in args.sizes:
+            rng = random.Random(args.seed)
+            plot, move = make_plot(kind, n, rng)
+            for operation, function, change in get_cases(kind, n, args.max_gif_points):
+                if args.operations is not None and operation not in args.operations:
+                    continue
+                result = dict(plot=kind, points=n, operation=operation,
+                              **run_case(plot, move, function, change, args.runs))
+                results.append(result)
+                print("%-15s %6d  %-24s p50 %9.3f ms  p95 %9.3f ms  peak %9.1f KB" %
+                      (kind, n, operation, result["p50_ms"], result["p95_ms"], result["peak_kb"]), file=sys.stderr)
+
+    report = {"python": platform.python_version(),
+              "numpy": np.__version__,
+              "machine": platform.machine(),
+              "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              "results": results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.max_ratio)
+        for message in regressions:
+            print("REGRESSION: " + message, file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
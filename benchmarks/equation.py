@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from equation import FULL_FORMAT, LEGEND_FORMAT, to_latex, to_plain
+
+# Checks the equation formatter against the sympy printing it replaced, on random fits and on the cases that sympy
+# prints specially (coefficients that round to zero, a lone constant, a positive constant minus one term, very small
+# and very large coefficients), and compares how long each takes. Needs sympy installed.
+
+EDGE_CASES = [
+    [0], [-0.0004], [5], [-2], [0, 0, 0], [0, 1], [0, -1], [0, 0, -1], [2, -1], [-2, 1], [2, 0, -1], [-2, 0, 1],
+    [1.5, -2.25, 0.001], [-0.0004, 1, 0], [3.14159, 0, -0.5, 2.0], [1e7, -12345.6789], [1e16, 1], [1e16],
+    [0.00001, 1], [0.000012, 1], [0.000001], [-0.00001], [0, -0.00001], [1, -0.00001], [0, 0, 0.000001, 0.5],
+    [0.0005, 0.0015, 0.0025], [-0.0005, -1], [99999.9995, 1], [123456789012345.678, -1],
+]
+
+
+def random_coefficients(rng):
+    coefficients = []
+    for _ in range(rng.randint(1, 7)):
+        kind = rng.random()
+        if kind < 0.15:
+            coefficients.append(0.0)
+        elif kind < 0.3:
+            coefficients.append(rng.choice([-1, 1]) * rng.randint(0, 20) / rng.choice([1, 2, 4, 1000]))
+        else:
+            coefficients.append(rng.choice([-1, 1]) * 10 ** rng.uniform(-8, 17))
+    return coefficients
+
+
+def with_sympy(coefficients, fmt):
+    from sympy import S, symbols, printing
+
+    x = symbols('x')
+    poly = sum(S(fmt.format(v)) * x ** i for i, v in enumerate(coefficients))
+    return printing.latex(poly), str(poly)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the equation formatter against sympy and time both.")
+    parser.add_argument("-n", "--cases", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = EDGE_CASES + [random_coefficients(rng) for _ in range(args.cases)]
+
+    mismatches = 0
+    for coefficients in cases:
+        for fmt in (LEGEND_FORMAT, FULL_FORMAT):
+            expected = with_sympy(coefficients, fmt)
+            actual = (to_latex(coefficients, fmt), to_plain(coefficients, fmt))
+            if actual != expected:
+                mismatches += 1
+                if mismatches <= 10:
+                    print("MISMATCH %r %s\n  sympy: %r\n  ours:  %r" % (coefficients, fmt, expected, actual))
+    print("Checked %d polynomials in both formats, %d mismatches." % (len(cases), mismatches))
+
+    sample = [random_coefficients(rng) for _ in range(200)]
+    ours = min(timeit.repeat(lambda: [to_latex(c) for c in sample], number=5, repeat=3)) / (5 * len(sample))
+    theirs = min(timeit.repeat(lambda: [with_sympy(c, LEGEND_FORMAT) for c in sample], number=1, repeat=3)) / \
+        len(sample)
+    print("Per equation: %.1f us, sympy %.1f us." % (ours * 1e6, theirs * 1e6))
+
+    if mismatches > 0:
+        sys.exit(1)
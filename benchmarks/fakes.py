@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import itertools
+import threading
+import time
+
+# Stand-ins for the parts of python-telegram-bot the handlers use, so they can be driven in-process without a token or
+# network access. FakeBot records every call instead of making it and answers with FakeMessages that carry a message
+# ID and a file_id, like the real API does, so the file_id and message edit caches behave as they do in production.
+
+
+class FakeUser:
+    def __init__(self, id, username=None, first_name=None, last_name=None):
+        self.id = id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+
+class FakeChat:
+    def __init__(self, id):
+        self.id = id
+
+
+class FakePhotoSize:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class FakeMessage:
+    def __init__(self, message_id, chat, from_user=None, text=None, photo=None, animation=None):
+        self.message_id = message_id
+        self.chat = chat
+        self.chat_id = chat.id
+        self.from_user = from_user
+        self.text = text
+        self.photo = photo or []
+        self.animation = animation
+        self.document = None
+
+
+class FakeCallbackQuery:
+    def __init__(self, id, from_user, message, data):
+        self.id = id
+        self.from_user = from_user
+        self.message = message
+        self.data = data
+
+
+class FakeUpdate:
+    def __init__(self, message=None, callback_query=None):
+        self.message = message
+        self.callback_query = callback_query
+        self.effective_chat = (message or callback_query.message).chat
+        self.effective_user = message.from_user if message is not None else callback_query.from_user
+
+
+class FakeBot:
+    def __init__(self, delay=0):
+        """
+        :param delay: Seconds each call takes, to stand in for the round trip to Telegram.
+        """
+        self.delay = delay
+        # (time, method, chat ID, text or None) for every call.
+        self.calls = []
+        self.__lock = threading.Lock()
+        self.__ids = itertools.count(1)
+
+    def __record(self, method, chat_id, text=None):
+        if self.delay > 0:
+            time.sleep(self.delay)
+        with self.__lock:
+            self.calls.append((time.perf_counter(), method, chat_id, text))
+            return next(self.__ids)
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        return FakeMessage(self.__record("send_message", chat_id, text), FakeChat(chat_id), text=text)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        if hasattr(photo, "read"):
+            photo.read()
+        message_id = self.__record("send_photo", chat_id)
+        return FakeMessage(message_id, FakeChat(chat_id), photo=[FakePhotoSize("photo-" + str(message_id))])
+
+    def send_animation(self, chat_id, animation, **kwargs):
+        if hasattr(animation, "read"):
+            animation.read()
+        message_id = self.__record("send_animation", chat_id)
+        return FakeMessage(message_id, FakeChat(chat_id), animation=FakePhotoSize("animation-" + str(message_id)))
+
+    def edit_message_media(self, chat_id, message_id, media, **kwargs):
+        self.__record("edit_message_media", chat_id)
+        return FakeMessage(message_id, FakeChat(chat_id), photo=[FakePhotoSize("photo-" + str(message_id))])
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        self.__record("edit_message_text", chat_id, text)
+        return FakeMessage(message_id, FakeChat(chat_id), text=text)
+
+    def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        self.__record("answer_callback_query", None, text)
+        return True
+
+    def get_counts(self):
+        """
+        :return: A dictionary from each method to how many times it was called.
+        """
+        with self.__lock:
+            counts = {}
+            for _, method, _, _ in self.calls:
+                counts[method] = counts.get(method, 0) + 1
+            return counts
+
+
+def make_update(chat_id, user, text=None, message_id=0):
+    """
+    :return: A FakeUpdate for a message from a user in a chat.
+    """
+    return FakeUpdate(message=FakeMessage(message_id, FakeChat(chat_id), from_user=user, text=text))
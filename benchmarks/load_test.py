@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+
+from fakes import FakeBot, FakeUser, make_update
+
+# Replays a mix of commands from many synthetic chats and users against the real handlers in telegram_bot, with a
+# FakeBot in place of Telegram, to measure how many updates the bot gets through per second and per CPU second and
+# how long handlers take when renders, sends and persistence are all busy at once. The render pool, outbound queue
+# and persistence are the real ones (the outbound queue's rate limits are lifted unless --rate-limits is given, since
+# nothing is actually sent), and the persistence is flushed on a timer alongside the handlers, as a deploy would.
+#
+# Like python-telegram-bot's dispatcher, each thread runs its updates one at a time; with --threads above 1, the chats
+# are split between the threads so a chat's updates still never run at once. Results are written as JSON.
+
+# Relative weights of the actions in the mix. A plotme burst is several users plotting themselves in a row, as happens
+# when a plot is posted, and a bet is /setupbet, a few /bet and /completebet.
+MIX = {"plotme_burst": 6, "showplot": 3, "plotcrowdsource": 2, "plotstats": 1, "polyfitplot": 1, "bet": 1}
+
+# Command -> (handler, whether it takes args).
+HANDLERS = {"createplot": ("create_plot_handler", True),
+            "plotme": ("plot_me_handler", True),
+            "showplot": ("show_plot_handler", True),
+            "plotcrowdsource": ("plot_crowdsource_handler", True),
+            "crowdsourceconsent": ("crowdsource_consent_handler", True),
+            "plotstats": ("get_plot_stats_handler", True),
+            "polyfitplot": ("polyfit_plot_handler", True),
+            "setupbet": ("setup_bet_handler", True),
+            "bet": ("my_bet_handler", True),
+            "completebet": ("complete_bet_handler", False)}
+
+
+def coordinate(rng):
+    return "%.2f" % rng.uniform(-9.5, 9.5)
+
+
+def make_chats(chats, users):
+    """
+    :return: A dictionary from chat ID to the users in it. Chat IDs are negative, like Telegram's group IDs.
+    """
+    return {-1000 - i: [FakeUser(i * 1000 + j, username="user%d_%d" % (i, j)) for j in range(users)]
+            for i in range(chats)}
+
+
+def make_setup(members):
+    """
+    :return: The (chat ID, user, command, args) that create each chat's plot, plot everyone on it and have them
+    consent to being crowdsourced.
+    """
+    rng = random.Random(0)
+    updates = []
+    for chat_id, users in members.items():
+        updates.append((chat_id, users[0], "createplot", ["-t", "Load", "test"]))
+        for user in users:
+            updates.append((chat_id, user, "plotme", ["1", coordinate(rng), coordinate(rng)]))
+            updates.append((chat_id, user, "crowdsourceconsent", ["1"]))
+    return updates
+
+
+def make_workload(members, count, burst, seed):
+    """
+    :return: count (chat ID, user, command, args) drawn from MIX, in the order they arrive.
+    """
+    rng = random.Random(seed)
+    actions = sorted(MIX)
+    weights = [MIX[a] for a in actions]
+    chat_ids = sorted(members)
+    updates = []
+    while len(updates) < count:
+        chat_id = rng.choice(chat_ids)
+        users = members[chat_id]
+        action = rng.choices(actions, weights)[0]
+        if action == "plotme_burst":
+            for user in rng.sample(users, min(burst, len(users))):
+                updates.append((chat_id, user, "plotme", ["1", coordinate(rng), coordinate(rng)]))
+        elif action == "showplot":
+            updates.append((chat_id, rng.choice(users), "showplot", ["1"]))
+        elif action == "plotcrowdsource":
+            user, target = rng.sample(users, 2)
+            updates.append((chat_id, user, "plotcrowdsource", ["1", target.username, coordinate(rng),
+                                                                coordinate(rng)]))
+        elif action == "plotstats":
+            updates.append((chat_id, rng.choice(users), "plotstats", ["1"]))
+        elif action == "polyfitplot":
+            updates.append((chat_id, rng.choice(users), "polyfitplot", ["1", str(rng.randint(1, 3))]))
+        else:
+            updates.append((chat_id, users[0], "setupbet", ["1", str(rng.randint(1, 3))]))
+            for user in rng.sample(users, min(3, len(users))):
+                updates.append((chat_id, user, "bet", ["%.3f" % rng.random()]))
+            updates.append((chat_id, users[0], "completebet", []))
+    return updates[:count]
+
+
+class Dispatcher:
+    def __init__(self, tb, bot, chat_data):
+        self.tb = tb
+        self.bot = bot
+        self.chat_data = chat_data
+        # Wrapped the way the bot registers them, so the bot's own stats are collected too.
+        self.handlers = {command: tb.METRICS.instrument(command, getattr(tb, handler))
+                         for command, (handler, _) in HANDLERS.items()}
+        # Command -> the seconds each of its updates took.
+        self.latencies = {}
+        self.errors = []
+        self.__lock = threading.Lock()
+
+    def handle(self, chat_id, user, command, args):
+        handler, takes_args = self.handlers[command], HANDLERS[command][1]
+        update = make_update(chat_id, user, text="/" + command + " " + " ".join(args))
+        chat_data = self.chat_data.setdefault(chat_id, {})
+        start = time.perf_counter()
+        try:
+            if takes_args:
+                handler(self.bot, update, chat_data, list(args))
+            else:
+                handler(self.bot, update, chat_data)
+            # What the dispatcher does after every update.
+            self.tb.pp.update_chat_data(chat_id, chat_data)
+        except Exception as e:
+            with self.__lock:
+                self.errors.append("%s in chat %d: %r" % (command, chat_id, e))
+        elapsed = time.perf_counter() - start
+        with self.__lock:
+            self.latencies.setdefault(command, []).append(elapsed)
+
+    def run(self, updates, threads):
+        """
+        Handle the updates on the given number of threads, each taking every update from its share of the chats in
+        order.
+        """
+        shards = [[] for _ in range(threads)]
+        chat_ids = sorted(set(u[0] for u in updates))
+        shard_of = {chat_id: i % threads for i, chat_id in enumerate(chat_ids)}
+        for update in updates:
+            shards[shard_of[update[0]]].append(update)
+        workers = [threading.Thread(target=lambda shard=shard: [self.handle(*u) for u in shard])
+                   for shard in shards]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+
+class Flusher:
+    def __init__(self, persistence, interval):
+        self.persistence = persistence
+        self.interval = interval
+        self.latencies = []
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def __run(self):
+        while not self.__stop.wait(self.interval):
+            start = time.perf_counter()
+            self.persistence.flush()
+            self.latencies.append(time.perf_counter() - start)
+
+    def start(self):
+        if self.interval > 0:
+            self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+
+def drain(tb):
+    """
+    Send every debounced plot now and wait until every render and message has gone out.
+    """
+    tb.flush_pending_plots()
+    idle = 0
+    while idle < 3:
+        idle = idle + 1 if tb.RENDER_POOL.get_pending() == 0 and tb.OUTBOUND.get_depth() == 0 else 0
+        time.sleep(0.02)
+
+
+def summarize(times):
+    times = np.array(times) * 1000
+    return {"count": len(times),
+            "p50_ms": round(float(np.percentile(times, 50)), 3),
+            "p95_ms": round(float(np.percentile(times, 95)), 3),
+            "p99_ms": round(float(np.percentile(times, 99)), 3),
+            "max_ms": round(float(times.max()), 3)}
+
+
+def get_cpu_seconds():
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the bot's handlers with fake chats, users and Telegram.")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--users", type=int, default=15, help="Users per chat.")
+    parser.add_argument("-n", "--updates", type=int, default=2000)
+    parser.add_argument("--burst", type=int, default=8, help="Users plotting themselves in a row in a burst.")
+    parser.add_argument("--threads", type=int, default=1, help="Threads handling updates.")
+    parser.add_argument("--render-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--outbound-workers", type=int, default=4)
+    parser.add_argument("--debounce", type=float, default=3, help="PLOT_DEBOUNCE_SECONDS.")
+    parser.add_argument("--persistence", choices=["journal", "sqlite"], default="journal")
+    parser.add_argument("--flush-interval", type=float, default=1, help="Seconds between flushes; 0 for none.")
+    parser.add_argument("--api-delay", type=float, default=0, help="Seconds each fake Bot API call takes.")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the outbound queue's Telegram rate limits.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=None, help="Write the JSON here instead of to stdout.")
+    parser.add_argument("--max-p95-ms", type=float, default=None,
+                        help="Fail if any command's p95 handler latency is more than this.")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output is not None else None
+
+    os.environ["PLOT_DEBOUNCE_SECONDS"] = str(args.debounce)
+    os.environ["RENDER_WORKERS"] = str(args.render_workers)
+    os.environ["OUTBOUND_WORKERS"] = str(args.outbound_workers)
+    os.environ["PERSISTENCE"] = args.persistence
+
+    # telegram_bot reads its token from, and keeps its database in, the working directory.
+    cwd = tempfile.mkdtemp()
+    try:
+        os.chdir(cwd)
+        with open("api_key.txt", "w") as f:
+            f.write("0:load-test\n")
+
+        import telegram_bot as tb
+        from outbound import OutboundQueue
+
+        if not args.rate_limits:
+            tb.OUTBOUND.shutdown()
+            tb.OUTBOUND = OutboundQueue(workers=args.outbound_workers, global_rate=1e9, private_rate=1e9,
+                                        group_rate=1e9, burst=10 ** 9)
+
+        bot = FakeBot(delay=args.api_delay)
+        members = make_chats(args.chats, args.users)
+        dispatcher = Dispatcher(tb, bot, {})
+        dispatcher.run(make_setup(members), args.threads)
+        drain(tb)
+        setup_errors = list(dispatcher.errors)
+        dispatcher.latencies.clear()
+        dispatcher.errors.clear()
+        calls_before = len(bot.calls)
+
+        workload = make_workload(members, args.updates, args.burst, args.seed)
+        flusher = Flusher(tb.pp, args.flush_interval)
+        cpu_start = get_cpu_seconds()
+        start = time.perf_counter()
+        flusher.start()
+        dispatcher.run(workload, args.threads)
+        dispatched = time.perf_counter() - start
+        drain(tb)
+        flusher.stop()
+        elapsed = time.perf_counter() - start
+
+        outbound = tb.OUTBOUND.get_stats()
+        bot_stats = tb.METRICS.to_lines()
+        tb.RENDER_POOL.shutdown()
+        tb.OUTBOUND.shutdown()
+        # Render workers' CPU time only counts once they've exited and been waited for.
+        for process in multiprocessing.active_children():
+            process.join(10)
+        cpu = get_cpu_seconds() - cpu_start
+        tb.pp.flush()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(cwd, ignore_errors=True)
+
+    counts = {}
+    for _, method, _, _ in bot.calls[calls_before:]:
+        counts[method] = counts.get(method, 0) + 1
+    report = {"python": platform.python_version(),
+              "machine": platform.machine(),
+              "cpus": os.cpu_count(),
+              "config": vars(args),
+              "updates": len(workload),
+              "dispatch_seconds": round(dispatched, 3),
+              "wall_seconds": round(elapsed, 3),
+              "cpu_seconds": round(cpu, 3),
+              "updates_per_second": round(len(workload) / elapsed, 1),
+              "updates_per_cpu_second": round(len(workload) / cpu, 1) if cpu > 0 else None,
+              "handlers": {command: summarize(times) for command, times in sorted(dispatcher.latencies.items())},
+              "flushes": summarize(flusher.latencies) if flusher.latencies else None,
+              "bot_calls": counts,
+              "outbound": outbound,
+              "bot_stats": bot_stats,
+              "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              "errors": setup_errors + dispatcher.errors}
+
+    print("%d updates in %.2f s (%.2f s to dispatch): %.1f updates/s, %.1f per CPU second" %
+          (len(workload), elapsed, dispatched, report["updates_per_second"], report["updates_per_cpu_second"] or 0),
+          file=sys.stderr)
+    for command, stats in report["handlers"].items():
+        print("%-20s %6d  p50 %9.3f ms  p95 %9.3f ms  p99 %9.3f ms" %
+              (command, stats["count"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]), file=sys.stderr)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    failed = False
+    for error in report["errors"][:10]:
+        print("ERROR: " + error, file=sys.stderr)
+        failed = True
+    if args.max_p95_ms is not None:
+        for command, stats in report["handlers"].items():
+            if stats["p95_ms"] > args.max_p95_ms:
+                print("FAIL: %s p95 %.3f ms" % (command, stats["p95_ms"]), file=sys.stderr)
+                failed = True
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import argparse
+import os
+import random
+import sys
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+
+from stats import describe, to_text
+
+# Checks the /plotstats table against what pandas' describe printed before, on random plots of different sizes and
+# scales (including empty plots, single points and repeated values), and compares how long each takes. Needs pandas
+# installed.
+
+
+def random_points(rng):
+    n = rng.choice([0, 1, 2, 3, 5, 10, 100, 1000])
+    kind = rng.random()
+    if kind < 0.2:
+        X = [float(rng.randint(-10, 10)) for _ in range(n)]
+        Y = [float(rng.randint(-10, 10)) for _ in range(n)]
+    elif kind < 0.3:
+        X = [2.0] * n
+        Y = [rng.choice([0.0, -3.5])] * n
+    else:
+        scale = 10 ** rng.uniform(-8, 10)
+        X = [rng.uniform(-1, 1) * scale for _ in range(n)]
+        Y = [rng.gauss(0, 1) * 10 ** rng.uniform(-3, 3) for _ in range(n)]
+    return np.array(X, dtype=np.float64), np.array(Y, dtype=np.float64)
+
+
+def with_pandas(X, Y):
+    import pandas as pd
+
+    points_dict = {"Names": pd.Series(np.asarray(["p" + str(i) for i in range(len(X))], dtype=str)),
+                   "X": pd.Series(X),
+                   "Y": pd.Series(Y)}
+    return str(pd.DataFrame(points_dict).describe())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check /plotstats against pandas' describe and time both.")
+    parser.add_argument("-n", "--cases", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    rng = random.Random(args.seed)
+    mismatches = 0
+    for _ in range(args.cases):
+        X, Y = random_points(rng)
+        expected = with_pandas(X, Y)
+        actual = to_text(describe(X, Y)).split("\n\n")[0]
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print("MISMATCH for %d points:\n%s\n--- pandas:\n%s" % (len(X), actual, expected))
+    print("Checked %d plots, %d mismatches." % (args.cases, mismatches))
+
+    import pandas as pd
+    for n in [10, 1000, 100000]:
+        X = np.array([rng.uniform(-10, 10) for _ in range(n)])
+        Y = np.array([rng.uniform(-10, 10) for _ in range(n)])
+        ours = min(timeit.repeat(lambda: to_text(describe(X, Y)), number=10, repeat=3)) / 10
+        theirs = min(timeit.repeat(lambda: with_pandas(X, Y), number=3, repeat=3)) / 3
+        print("%6d points: %.3f ms, pandas %.3f ms." % (n, ours * 1e3, theirs * 1e3))
+
+    # The skew, covariance and correlation are new, so they're checked against pandas' own.
+    X, Y = np.arange(50.0) ** 1.5, np.sin(np.arange(50.0))
+    summary = describe(X, Y)
+    frame = pd.DataFrame({"X": X, "Y": Y})
+    print("skew %r / %r, cov %r / %r, corr %r / %r" % (summary["skew"], tuple(float(v) for v in frame.skew()),
+                                                      summary["cov"], float(frame.cov().iloc[0, 1]),
+                                                      summary["corr"], float(frame.corr().iloc[0, 1])))
+
+    if mismatches > 0:
+        sys.exit(1)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import argparse
+import os
+import resource
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from plot import Plot
+from render_cache import RENDER_CACHE
+
+# Renders a lot of distinct plots back to back and checks the process's resident memory levels off instead of
+# growing with every render, which is what happened when figures were left in pyplot's registry.
+
+
+def get_rss():
+    """
+    :return: The current resident set size of this process in bytes.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError):
+        # No procfs (e.g. macOS), so fall back to the peak, which still catches steady growth.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def render(i):
+    plot = Plot("Plot " + str(i), "left", "right", "bottom", "top", -10, 10, -10, 10, ("bench", 0), i)
+    for j in range(10):
+        plot.plot_point("user" + str(j), (i + j) % 21 - 10, (i * j) % 21 - 10)
+    plot.generate_plot()
+    plot.polyfit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that rendering plots doesn't leak memory.")
+    parser.add_argument("-n", "--renders", type=int, default=10000)
+    parser.add_argument("-w", "--warmup", type=int, default=200)
+    parser.add_argument("--max-growth-mb", type=float, default=20.0)
+    args = parser.parse_args()
+
+    for i in range(args.warmup):
+        render(i)
+        RENDER_CACHE.clear()
+    baseline = get_rss()
+
+    for i in range(args.renders):
+        render(args.warmup + i)
+        # Cached images are meant to stick around, so keep them out of the measurement.
+        RENDER_CACHE.clear()
+        if (i + 1) % 1000 == 0:
+            print("%d renders: %.1f MB (+%.1f MB)" % (i + 1, get_rss() / 2 ** 20, (get_rss() - baseline) / 2 ** 20))
+
+    growth = (get_rss() - baseline) / 2 ** 20
+    print("RSS grew %.1f MB over %d renders." % (growth, args.renders))
+    if growth > args.max_growth_mb:
+        print("FAIL: more than %.1f MB." % args.max_growth_mb)
+        sys.exit(1)
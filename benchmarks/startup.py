@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Times how long a fresh interpreter takes to import the bot, which is what a restart waits on before it can handle
+# updates, and checks the libraries that are only needed for drawing, stats and fits aren't imported by then. Also
+# reports what the first plot, stats and fit pay for loading them later.
+
+HEAVY_MODULES = ["matplotlib", "pandas", "sympy", "colorhash", "PIL"]
+
+STARTUP = """
+import sys, time
+start = time.perf_counter()
+import telegram_bot
+print(time.perf_counter() - start)
+print(",".join(m for m in %r if m in sys.modules))
+""" % HEAVY_MODULES
+
+FIRST_USE = """
+import time
+from plot import Plot
+plot = Plot("Plot", "left", "right", "bottom", "top", -10, 10, -10, 10, ("bench", 0), 0)
+for i in range(10):
+    plot.plot_point("user" + str(i), i - 5, (i * 3) % 21 - 10)
+for method, kwargs in [("generate_plot", {}), ("generate_stats", {}), ("polyfit", {"deg": 1})]:
+    start = time.perf_counter()
+    getattr(plot, method)(**kwargs)
+    print(method, time.perf_counter() - start)
+"""
+
+
+def run(code, cwd):
+    """
+    Run Python code in a fresh interpreter with the repository on its path.
+    :return: The lines it printed.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT, MPLBACKEND="Agg")
+    output = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    return output.split("\n")[:-1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how long the bot takes to start.")
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if the median import time is more than this.")
+    args = parser.parse_args()
+
+    # telegram_bot reads its token from the working directory when it's imported, so give it a dummy one.
+    cwd = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(cwd, "api_key.txt"), "w") as f:
+            f.write("0:benchmark\n")
+
+        times = []
+        loaded = set()
+        for _ in range(args.runs):
+            seconds, modules = run(STARTUP, cwd)
+            times.append(float(seconds))
+            loaded.update(m for m in modules.split(",") if m)
+
+        print("Importing telegram_bot: median %.3f s, min %.3f s, max %.3f s over %d runs." %
+              (statistics.median(times), min(times), max(times), args.runs))
+        for line in run(FIRST_USE, cwd):
+            method, seconds = line.split()
+            print("First %s: %.3f s" % (method, float(seconds)))
+    finally:
+        shutil.rmtree(cwd, ignore_errors=True)
+
+    failed = False
+    if len(loaded) > 0:
+        print("FAIL: imported at startup: " + ", ".join(sorted(loaded)))
+        failed = True
+    if args.max_seconds is not None and statistics.median(times) > args.max_seconds:
+        print("FAIL: more than %.3f s." % args.max_seconds)
+        failed = True
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import numpy as np
+
+from render_cache import RenderCache, fingerprint
+
+# Contours used to be sampled 10 times per unit of the plot's bounds, so a plot with huge bounds asked for a grid
+# with billions of cells. The grid is now a fixed number of samples per axis, which is already finer than the
+# axes are in pixels, so the cost of a contour doesn't depend on the bounds at all.
+GRID_SIZE = 200
+
+MODES = ["distance", "density"]
+
+# Triangulating the points is the expensive part of the distance field, so interpolators are kept until the points
+# change.
+INTERPOLATORS = RenderCache(max_entries=128, sizeof=lambda v: 1)
+
+# Caps how many grid-point/data-point pairs the density estimate holds in memory at once.
+KDE_CHUNK = 1 << 22
+
+
+def contour_grid(minx, maxx, miny, maxy, size=GRID_SIZE):
+    """
+    :return: The x and y sample coordinates for a contour over the given bounds.
+    """
+    return np.linspace(minx, maxx, size), np.linspace(miny, maxy, size)
+
+
+def distance_field(X, Y, center_x, center_y, xi, yi):
+    """
+    Linearly interpolate each point's distance from the center over a grid.
+    :param X: The x coordinates of the points, including the center.
+    :param Y: The y coordinates of the points, including the center.
+    :param center_x: The x coordinate of the center of the points.
+    :param center_y: The y coordinate of the center of the points.
+    :param xi: The x sample coordinates from contour_grid.
+    :param yi: The y sample coordinates from contour_grid.
+    :return: A (len(yi), len(xi)) masked array of distances, or None if the points can't be triangulated (fewer
+    than three, or all on one line).
+    """
+    from matplotlib import tri
+
+    x = np.asarray(X, dtype=float)
+    y = np.asarray(Y, dtype=float)
+    key = fingerprint(x.tobytes(), y.tobytes())
+    interpolator = INTERPOLATORS.get(key)
+    if interpolator is None:
+        try:
+            triang = tri.Triangulation(x, y)
+        except (ValueError, RuntimeError):
+            return None
+        z = np.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+        interpolator = tri.LinearTriInterpolator(triang, z)
+        INTERPOLATORS.put(key, interpolator)
+
+    Xi, Yi = np.meshgrid(xi, yi)
+    return interpolator(Xi, Yi)
+
+
+def density_field(X, Y, xi, yi):
+    """
+    Estimate the density of the points over a grid with a Gaussian kernel, using Scott's rule for the bandwidth.
+    :param X: The x coordinates of the points.
+    :param Y: The y coordinates of the points.
+    :param xi: The x sample coordinates from contour_grid.
+    :param yi: The y sample coordinates from contour_grid.
+    :return: A (len(yi), len(xi)) array of densities, or None if there are no points.
+    """
+    points = np.column_stack((np.asarray(X, dtype=float), np.asarray(Y, dtype=float)))
+    n = len(points)
+    if n == 0:
+        return None
+
+    cov = np.cov(points, rowvar=False) if n > 1 else np.zeros((2, 2))
+    cov = cov * n ** (-1.0 / 3)
+    if np.linalg.det(cov) <= 1e-12:
+        # The points are all on one line (or there's only one), so widen the kernel by a share of the grid.
+        span = max(xi[-1] - xi[0], yi[-1] - yi[0], 1e-6)
+        cov = cov + np.eye(2) * (span / 20) ** 2
+    inv_cov = np.linalg.inv(cov)
+    norm = 1 / (2 * np.pi * np.sqrt(np.linalg.det(cov)) * n)
+
+    Xi, Yi = np.meshgrid(xi, yi)
+    grid = np.column_stack((Xi.ravel(), Yi.ravel()))
+    density = np.empty(len(grid))
+    step = max(1, KDE_CHUNK // n)
+    for start in range(0, len(grid), step):
+        diff = grid[start:start + step, None, :] - points[None, :, :]
+        energy = ((diff @ inv_cov) * diff).sum(axis=2)
+        density[start:start + step] = np.exp(-0.5 * energy).sum(axis=1)
+    return (density * norm).reshape(Xi.shape)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import hashlib
+
+import numpy as np
+
+# Crowdsourced points used to be a dict of label -> {contributor id: value} that was re-averaged from scratch on
+# every render, with consent kept as a list of (id, label) pairs scanned on every contribution. The tally keeps a
+# running sum per label next to the contributions (a vector sum on radar plots), so adding, replacing or removing a
+# contribution is O(1), and the points merged with the crowdsource are cached until either side changes.
+#
+# Both classes pickle as the plain dict and list they replaced, so the pickled form and the database rows are the
+# same as before.
+
+
+class CrowdsourceTally:
+    __slots__ = ("__contributions", "__sums", "__version", "__digest", "__merged", "__merged_key")
+
+    def __init__(self, contributions=None):
+        self.__contributions = {}
+        self.__sums = {}
+        self.__version = 0
+        self.__digest = None
+        self.__merged = None
+        self.__merged_key = None
+        for label, values in (contributions or {}).items():
+            for id, value in values.items():
+                self.put(id, label, value)
+
+    def __len__(self):
+        return len(self.__contributions)
+
+    def __contains__(self, label):
+        return label in self.__contributions
+
+    def __repr__(self):
+        return "CrowdsourceTally(" + repr(self.__getstate__()) + ")"
+
+    def __getstate__(self):
+        return {label: dict(values) for label, values in self.__contributions.items()}
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __changed(self):
+        self.__version += 1
+        self.__digest = None
+
+    def items(self):
+        """
+        :return: The (label, {contributor id: value}) pairs. Treat the dicts as read-only.
+        """
+        return self.__contributions.items()
+
+    def get(self, label):
+        """
+        :return: The {contributor id: value} dict for the label, else None. Treat it as read-only.
+        """
+        return self.__contributions.get(label)
+
+    def put(self, id, label, value):
+        """
+        Add a contribution, or replace the contributor's previous one for the same label.
+        :param id: The ID of the contributor.
+        :param label: The label of the point being crowdsourced.
+        :param value: An (x, y) tuple, or a list of values on radar plots.
+        """
+        values = self.__contributions.setdefault(label, {})
+        total = self.__sums.get(label)
+        if total is None:
+            total = self.__sums[label] = np.zeros(len(value), dtype=np.float64)
+        old = values.get(id)
+        if old is not None:
+            total -= old
+        total += value
+        values[id] = value
+        self.__changed()
+
+    def remove(self, id, label):
+        """
+        Remove a contributor's contribution for a label.
+        :return: True if there was such a contribution, else False.
+        """
+        values = self.__contributions.get(label)
+        if values is None or id not in values:
+            return False
+        old = values.pop(id)
+        if len(values) == 0:
+            # Start the next sum from zero so rounding from subtractions can't build up.
+            del self.__contributions[label]
+            del self.__sums[label]
+        else:
+            self.__sums[label] -= old
+        self.__changed()
+        return True
+
+    def discard(self, label):
+        """
+        Remove every contribution for a label.
+        """
+        if self.__contributions.pop(label, None) is not None:
+            del self.__sums[label]
+            self.__changed()
+
+    def get_digest(self):
+        """
+        :return: A hash of the contributions, for render cache keys. It's kept until the tally changes.
+        """
+        if self.__digest is None:
+            self.__digest = hashlib.sha1(repr(sorted((label, sorted(values.items(), key=repr))
+                                                     for label, values in self.__contributions.items())
+                                              ).encode("utf-8")).hexdigest()
+        return self.__digest
+
+    def merge(self, points, width):
+        """
+        Average each crowdsourced label into the plotted point whose label, with its spaces removed, matches it,
+        counting the plotted point as one more contribution and giving the point the crowdsourced label. Labels that
+        aren't plotted are added as new points with the plain average and no error.
+        :param points: The plot's PointStore.
+        :param width: The number of value columns points have: 4 (x, y, err_x, err_y), or the number of labels on a
+        radar plot.
+        :return: A new list of the labels and an (n, width) array of values. The values are cached until the points
+        or the contributions change, so treat them as read-only.
+        """
+        key = (points.get_digest(), self.__version)
+        if self.__merged_key == key:
+            return list(self.__merged[0]), self.__merged[1]
+
+        labels = points.get_labels()
+        values = points.get_values()
+        values = values.copy() if len(values) > 0 else np.empty((0, width), dtype=np.float64)
+        added = []
+        for label, total in self.__sums.items():
+            count = len(self.__contributions[label])
+            index = points.find_unspaced(label)
+            if index != -1:
+                # The point takes the crowdsourced label, which has no spaces.
+                labels[index] = label
+                values[index, :len(total)] = (values[index, :len(total)] + total) / (count + 1)
+            else:
+                row = np.zeros(width, dtype=np.float64)
+                row[:len(total)] = total / count
+                labels.append(label)
+                added.append(row)
+        if len(added) > 0:
+            values = np.concatenate((values, added))
+
+        self.__merged = (labels, values)
+        self.__merged_key = key
+        return list(labels), values
+
+
+class CrowdsourceConsent:
+    __slots__ = ("__pairs", "__labels")
+
+    def __init__(self, pairs=None):
+        # (id, label) -> None in the order consent was given, and label -> how many ids have consented as it.
+        self.__pairs = {}
+        self.__labels = {}
+        for id, label in pairs or []:
+            self.add(id, label)
+
+    def __len__(self):
+        return len(self.__pairs)
+
+    def __iter__(self):
+        return iter(list(self.__pairs))
+
+    def __contains__(self, pair):
+        return pair in self.__pairs
+
+    def __repr__(self):
+        return "CrowdsourceConsent(" + repr(self.__getstate__()) + ")"
+
+    def __getstate__(self):
+        return list(self.__pairs)
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def add(self, id, label):
+        if (id, label) not in self.__pairs:
+            self.__pairs[(id, label)] = None
+            self.__labels[label] = self.__labels.get(label, 0) + 1
+
+    def remove(self, id, label):
+        """
+        :return: True if the user had consented as that label, else False.
+        """
+        if (id, label) not in self.__pairs:
+            return False
+        del self.__pairs[(id, label)]
+        self.__labels[label] -= 1
+        if self.__labels[label] == 0:
+            del self.__labels[label]
+        return True
+
+    def allows(self, label):
+        """
+        :return: Whether anyone has consented to being crowdsourced as the label.
+        """
+        return label in self.__labels
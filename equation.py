@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+# Fit equations used to be built as sympy expressions from the formatted coefficients just to print them, which took
+# milliseconds per equation and made the first fit after a restart wait on importing sympy. These functions print the
+# same text directly: each coefficient is formatted as before, read back the way sympy reads a decimal string into a
+# Float, and printed the way sympy prints that Float and the polynomial. benchmarks/equation.py checks the output
+# against sympy.
+
+# How polyfit labels the fit line, and how full_equation writes the equation out.
+LEGEND_FORMAT = "{:6.3f}"
+FULL_FORMAT = "{:f}"
+
+
+def format_number(text, full_precision=False):
+    """
+    Print a decimal string the way sympy prints the Float it parses it into.
+    :param text: A decimal string such as "{:f}".format(v).
+    :param full_precision: Whether to keep the trailing zeros of the Float's precision, as sympy's str does for an
+    expression that's only a number.
+    :return: The number, e.g. "1.5", "10000000.0" or "1.0e-6".
+    """
+    number = Decimal(text)
+    sign, digits, _ = number.as_tuple()
+    # sympy gives a string Float as many digits of precision as it has, and at least 15.
+    dps = max(15, len(digits))
+    digits = "".join(str(d) for d in digits).lstrip("0")
+    if not digits:
+        return "0.0"
+    digits = digits.ljust(dps, "0")
+
+    # Fixed point for exponents strictly between these, like mpmath, which sympy prints Floats with.
+    exponent = number.adjusted()
+    if min(-(dps // 3), -5) < exponent < dps:
+        if exponent < 0:
+            digits = "0" * -exponent + digits
+            split = 1
+        else:
+            split = exponent + 1
+        exponent = 0
+    else:
+        split = 1
+
+    digits = digits[:split] + "." + digits[split:]
+    if not full_precision:
+        digits = digits.rstrip("0")
+        if digits.endswith("."):
+            digits += "0"
+    if exponent > 0:
+        digits += "e+" + str(exponent)
+    elif exponent < 0:
+        digits += "e" + str(exponent)
+    return ("-" if sign else "") + digits
+
+
+def get_terms(coefficients, fmt):
+    """
+    :param coefficients: The polynomial's coefficients, lowest degree first, as from numpy's polyfit.
+    :param fmt: The format string each coefficient is rounded with.
+    :return: A list of (degree, is negative, formatted absolute value) for the terms that don't round to zero, in the
+    order sympy prints them.
+    """
+    terms = []
+    for degree, value in enumerate(coefficients):
+        text = fmt.format(value).strip()
+        if Decimal(text) != 0:
+            negative = text.startswith("-")
+            terms.append((degree, negative, text.lstrip("-")))
+    terms.reverse()
+
+    # sympy writes a positive constant minus one other term as "c - a x" rather than "- a x + c".
+    if len(terms) == 2 and terms[1][0] == 0 and not terms[1][1] and terms[0][1]:
+        terms.reverse()
+    return terms
+
+
+def to_latex(coefficients, fmt=LEGEND_FORMAT):
+    """
+    Write a polynomial in LaTeX, the same as sympy's printing.latex of the sum of S(fmt.format(c)) * x ** i.
+    :param coefficients: The polynomial's coefficients, lowest degree first.
+    :param fmt: The format string each coefficient is rounded with.
+    :return: The LaTeX, without surrounding $s.
+    """
+    terms = get_terms(coefficients, fmt)
+    if len(terms) == 0:
+        return "0"
+
+    if len(terms) == 1 and terms[0][0] == 0:
+        degree, negative, text = terms[0]
+        return ("-" if negative else "") + _latex_number(text)
+
+    tex = ""
+    for i, (degree, negative, text) in enumerate(terms):
+        if i == 0:
+            tex += "- " if negative else ""
+        else:
+            tex += " - " if negative else " + "
+        tex += _latex_number(text)
+        if degree == 1:
+            tex += " x"
+        elif degree > 1:
+            tex += " x^{" + str(degree) + "}"
+    return tex
+
+
+def to_plain(coefficients, fmt=FULL_FORMAT):
+    """
+    Write a polynomial as plain text, the same as sympy's str of the sum of S(fmt.format(c)) * x ** i.
+    :param coefficients: The polynomial's coefficients, lowest degree first.
+    :param fmt: The format string each coefficient is rounded with.
+    :return: The text, e.g. "0.5*x**2 - 1.25*x + 3.0".
+    """
+    terms = get_terms(coefficients, fmt)
+    if len(terms) == 0:
+        return "0"
+
+    if len(terms) == 1 and terms[0][0] == 0:
+        degree, negative, text = terms[0]
+        return format_number(("-" if negative else "") + text, full_precision=True)
+
+    out = ""
+    for i, (degree, negative, text) in enumerate(terms):
+        if i == 0:
+            out += "-" if negative else ""
+        else:
+            out += " - " if negative else " + "
+        out += format_number(text)
+        if degree == 1:
+            out += "*x"
+        elif degree > 1:
+            out += "*x**" + str(degree)
+    return out
+
+
+def _latex_number(text):
+    number = format_number(text)
+    if "e" not in number:
+        return number
+    mantissa, exponent = number.split("e")
+    return mantissa + r" \cdot 10^{" + exponent.lstrip("+") + "}"
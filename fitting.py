@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import numpy as np
+
+# /polyfitplot, /fullequation and /completebet used to refit the plot from scratch every time, even when they asked
+# for the same degree on a plot that hadn't changed. Each plot now keeps its fits keyed by degree, checked against
+# the version of its points, and the sums the least squares normal equations are built from (sums of x^k and x^k * y),
+# which are updated in O(1) when a point is added, moved or removed. A fit on a changed plot then solves a tiny
+# (deg + 1) x (deg + 1) system instead of a least squares problem over every point.
+#
+# The normal equations lose precision faster than the SVD numpy's polyfit uses, so fits of degrees above
+# MOMENT_DEGREE, or whose equations are badly conditioned (e.g. x in the thousands), are done the old way.
+
+MOMENT_DEGREE = 4
+
+# Above this condition number (after scaling the equations), the fit is done with numpy's polyfit instead.
+MAX_CONDITION = 1e10
+
+# R^2 is worked out from the sums unless the residuals or the spread of y are this small a share of the sum of y^2,
+# where the subtractions would cancel most of the digits.
+MIN_SHARE = 1e-6
+
+# The sums are rebuilt from the points after this many updates, or as many as there are points if that's more, so
+# rounding from subtractions can't build up.
+REBUILD_UPDATES = 64
+
+MAX_FITS = 16
+
+
+def get_r_squared(X, Y, p):
+    """
+    :param X: The x coordinates of the points.
+    :param Y: The y coordinates of the points.
+    :param p: The fit's coefficients, lowest degree first.
+    :return: The coefficient of determination of the fit.
+    """
+    yhat = np.poly1d(p[::-1])(X)
+    ybar = np.sum(Y) / len(Y)
+    ssres = np.sum((Y - yhat) ** 2)
+    sstot = np.sum((Y - ybar) ** 2)
+    return 1 - ssres / sstot
+
+
+class FitCache:
+    __slots__ = ("__sums", "__updates", "__fits")
+
+    def __init__(self):
+        # The sums of x^k for k up to 2 * MOMENT_DEGREE, then of x^k * y for k up to MOMENT_DEGREE, then of y^2. The
+        # first one is the number of points. None until the first fit.
+        self.__sums = None
+        self.__updates = 0
+        # Degree -> (points version, coefficients, R^2).
+        self.__fits = {}
+
+    def __update(self, point, sign):
+        if self.__sums is None or point is None:
+            return
+        x, y = point[1], point[2]
+        powers = float(x) ** np.arange(2 * MOMENT_DEGREE + 1)
+        self.__sums[:2 * MOMENT_DEGREE + 1] += sign * powers
+        self.__sums[2 * MOMENT_DEGREE + 1:-1] += sign * y * powers[:MOMENT_DEGREE + 1]
+        self.__sums[-1] += sign * y * y
+        self.__updates += 1
+
+    def put(self, old, new):
+        """
+        Update the sums for a point being added or moved.
+        :param old: The point as it was, or None if it's new.
+        :param new: The point as it is now.
+        """
+        self.__update(old, -1)
+        self.__update(new, 1)
+
+    def remove(self, old):
+        """
+        Update the sums for a point being removed.
+        :param old: The point that was removed.
+        """
+        self.__update(old, -1)
+
+    def __rebuild(self, X, Y):
+        powers = X[:, None] ** np.arange(2 * MOMENT_DEGREE + 1)
+        self.__sums = np.concatenate((powers.sum(axis=0), (powers[:, :MOMENT_DEGREE + 1] * Y[:, None]).sum(axis=0),
+                                      [np.sum(Y * Y)]))
+        self.__updates = 0
+
+    def __solve(self, X, Y, deg):
+        # Returns the coefficients and R^2 from the sums, or None if the fit should be done with numpy instead.
+        n = len(X)
+        if deg > MOMENT_DEGREE or n <= deg:
+            return None
+        if self.__sums is None or self.__sums[0] != n or self.__updates > max(REBUILD_UPDATES, n):
+            self.__rebuild(X, Y)
+
+        x_sums = self.__sums[:2 * MOMENT_DEGREE + 1]
+        xy_sums = self.__sums[2 * MOMENT_DEGREE + 1:2 * MOMENT_DEGREE + deg + 2]
+        yy_sum = self.__sums[-1]
+        gram = x_sums[np.add.outer(np.arange(deg + 1), np.arange(deg + 1))]
+
+        # Scaling every row and column to a unit diagonal makes the equations far better conditioned when the powers
+        # of x are of very different sizes.
+        scale = np.sqrt(np.diag(gram))
+        if np.any(scale == 0):
+            return None
+        scaled = gram / np.outer(scale, scale)
+        if np.linalg.cond(scaled) > MAX_CONDITION:
+            return None
+        p = np.linalg.solve(scaled, xy_sums / scale) / scale
+
+        ssres = yy_sum - 2 * p @ xy_sums + p @ gram @ p
+        sstot = yy_sum - xy_sums[0] ** 2 / n
+        if ssres < MIN_SHARE * yy_sum or sstot < MIN_SHARE * yy_sum:
+            return p, get_r_squared(X, Y, p)
+        return p, 1 - ssres / sstot
+
+    def get_fit(self, points, deg):
+        """
+        Fit a polynomial to the points by least squares, or return the fit from last time if the points haven't
+        changed since.
+        :param points: The plot's PointStore.
+        :param deg: The degree of the polynomial.
+        :return: The coefficients, lowest degree first, and the fit's R^2.
+        """
+        version = points.get_version()
+        fit = self.__fits.get(deg)
+        if fit is not None and fit[0] == version:
+            return fit[1], fit[2]
+
+        values = points.get_values()
+        X = values[:, 0]
+        Y = values[:, 1]
+        fit = self.__solve(X, Y, deg)
+        if fit is None:
+            p = np.polynomial.polynomial.polyfit(X, Y, deg)
+            fit = p, get_r_squared(X, Y, p)
+
+        if len(self.__fits) >= MAX_FITS and deg not in self.__fits:
+            self.__fits.clear()
+        self.__fits[deg] = (version,) + fit
+        return fit
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Counts and timings for each command, by the name of its alias group (e.g. "plot_me" for /plotme, /pm and /plot),
+# so it's clear which commands the bot spends its time on. Handlers are wrapped with instrument(), which records
+# how long each call took and whether it raised. Work a handler starts on other threads (renders in the render pool,
+# uploads on the outbound queue, saves) is charged to the same group: the group is kept in a thread-local while
+# the handler runs, and code that hands a function to another thread wraps it with bind() so it runs in the same
+# group. Render times are the CPU time of the render itself, measured in the worker.
+#
+# Latencies are kept in histograms with fixed buckets, so memory doesn't grow with traffic and percentiles are
+# reported as the bucket they fall in.
+
+# Upper bounds of the histogram buckets, in milliseconds. Anything slower goes in one last bucket.
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+# The group for work that didn't come from a handler, e.g. a plot sent after a restart.
+OTHER = "other"
+
+
+class Histogram:
+    __slots__ = ("__counts", "__total", "__max")
+
+    def __init__(self):
+        self.__counts = [0] * (len(BUCKETS_MS) + 1)
+        self.__total = 0.0
+        self.__max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.__counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.__total += seconds
+        self.__max = max(self.__max, ms)
+
+    def copy(self):
+        histogram = Histogram()
+        histogram.__counts = list(self.__counts)
+        histogram.__total = self.__total
+        histogram.__max = self.__max
+        return histogram
+
+    def get_count(self):
+        return sum(self.__counts)
+
+    def get_total(self):
+        """
+        :return: The sum of every value added, in seconds.
+        """
+        return self.__total
+
+    def get_max(self):
+        """
+        :return: The largest value added, in milliseconds.
+        """
+        return self.__max
+
+    def get_percentile(self, q):
+        """
+        :param q: The percentile, from 0 to 100.
+        :return: The upper bound in milliseconds of the bucket the percentile falls in, or the largest value if
+        that's lower. 0 if nothing was added.
+        """
+        count = self.get_count()
+        if count == 0:
+            return 0
+        rank = q / 100 * count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS + [self.__max], self.__counts):
+            seen += n
+            if seen >= rank and n > 0:
+                return min(bound, self.__max)
+        return self.__max
+
+    def get_counts(self):
+        """
+        :return: A list of (upper bound in milliseconds, count) for each bucket, with None for the last one's bound.
+        """
+        return list(zip(BUCKETS_MS + [None], self.__counts))
+
+
+class GroupStats:
+    __slots__ = ("calls", "errors", "latency", "renders", "saves", "uploaded")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.renders = Histogram()
+        self.saves = Histogram()
+        self.uploaded = 0
+
+    def get_cost(self):
+        """
+        :return: The seconds spent on the group's handlers, renders and saves.
+        """
+        return self.latency.get_total() + self.renders.get_total() + self.saves.get_total()
+
+
+class Metrics:
+    def __init__(self):
+        # Group name -> its GroupStats.
+        self.__groups = {}
+        self.__started = time.time()
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__logger = None
+
+    def __stats(self, name):
+        # Should be called with the lock held.
+        stats = self.__groups.get(name)
+        if stats is None:
+            stats = self.__groups[name] = GroupStats()
+        return stats
+
+    def get_group(self):
+        """
+        :return: The name of the group the current thread is working for.
+        """
+        return getattr(self.__local, "group", OTHER)
+
+    @contextmanager
+    def group(self, name):
+        """
+        Charge work done on the current thread inside the with block to a group.
+        :param name: The name of the group.
+        """
+        previous = self.get_group()
+        self.__local.group = name
+        try:
+            yield
+        finally:
+            self.__local.group = previous
+
+    def bind(self, function):
+        """
+        :param function: A function that will run on another thread, e.g. a callback.
+        :return: The function, charging its work to the group of the thread that called bind.
+        """
+        name = self.get_group()
+
+        def bound(*args, **kwargs):
+            with self.group(name):
+                return function(*args, **kwargs)
+
+        return bound
+
+    def record_call(self, name, seconds, error=False):
+        with self.__lock:
+            stats = self.__stats(name)
+            stats.calls += 1
+            stats.errors += 1 if error else 0
+            stats.latency.add(seconds)
+
+    def record_render(self, name, seconds):
+        with self.__lock:
+            self.__stats(name).renders.add(seconds)
+
+    def record_save(self, seconds):
+        name = self.get_group()
+        with self.__lock:
+            self.__stats(name).saves.add(seconds)
+
+    def record_upload(self, name, size):
+        with self.__lock:
+            self.__stats(name).uploaded += size
+
+    def instrument(self, name, handler):
+        """
+        :param name: The name of the handler's alias group.
+        :param handler: A handler function.
+        :return: The handler, recording each call's latency and errors under the group.
+        """
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = False
+            with self.group(name):
+                try:
+                    return handler(*args, **kwargs)
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    self.record_call(name, time.perf_counter() - start, error)
+
+        return wrapper
+
+    def get_summary(self):
+        """
+        :return: A list of (group name, calls, errors, latency Histogram, renders Histogram, saves Histogram, bytes
+        uploaded), costliest group first. The histograms are copies.
+        """
+        with self.__lock:
+            groups = sorted(self.__groups.items(), key=lambda item: item[1].get_cost(), reverse=True)
+            return [(name, stats.calls, stats.errors, stats.latency.copy(), stats.renders.copy(), stats.saves.copy(),
+                     stats.uploaded) for name, stats in groups]
+
+    def to_lines(self, extra=None):
+        """
+        :param extra: An optional line to add after the header, e.g. the outbound queue's stats.
+        :return: The stats as lines of text, one per group, costliest first, after a header.
+        """
+        uptime = time.time() - self.__started
+        summary = self.get_summary()
+        lines = ["Up %s; %d updates, %d errors." % (format_seconds(uptime), sum(s[1] for s in summary),
+                                                     sum(s[2] for s in summary))]
+        if extra is not None:
+            lines.append(extra)
+        for name, calls, errors, latency, renders, saves, uploaded in summary:
+            text = "%s: %d calls, %d errors, p50 %s, p95 %s, max %s" % (
+                name, calls, errors, format_ms(latency.get_percentile(50)), format_ms(latency.get_percentile(95)),
+                format_ms(latency.get_max()))
+            if renders.get_count() > 0:
+                text += "; %d renders, %s CPU, p95 %s" % (renders.get_count(), format_seconds(renders.get_total()),
+                                                          format_ms(renders.get_percentile(95)))
+            if saves.get_count() > 0:
+                text += "; saving %s" % format_seconds(saves.get_total())
+            if uploaded > 0:
+                text += "; uploaded %.1f KB" % (uploaded / 1024)
+            lines.append(text)
+        return lines
+
+    def start_logging(self, interval, extra=None):
+        """
+        Log a one-line summary every interval seconds on a background thread.
+        :param interval: Seconds between log lines. 0 or less logs nothing.
+        :param extra: An optional function returning a string to add to each line.
+        """
+        if interval <= 0 or self.__logger is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    logging.getLogger(__name__).info(self.to_line(extra() if extra is not None else None))
+                except Exception:
+                    logging.getLogger(__name__).exception("Logging the bot's stats failed.")
+
+        self.__logger = threading.Thread(target=run, name="metrics-logger", daemon=True)
+        self.__logger.start()
+
+    def to_line(self, extra=None):
+        """
+        :param extra: An optional string to add after the totals.
+        :return: The stats on one line: the totals, then each group's calls, errors, p95 and render CPU time.
+        """
+        summary = self.get_summary()
+        parts = ["%d updates, %d errors" % (sum(s[1] for s in summary), sum(s[2] for s in summary))]
+        if extra is not None:
+            parts.append(extra.rstrip("."))
+        parts += ["%s %d/%d p95 %s render %s" % (name, calls, errors, format_ms(latency.get_percentile(95)),
+                                                   format_seconds(renders.get_total()))
+                  for name, calls, errors, latency, renders, _, _ in summary]
+        return "; ".join(parts)
+
+
+def format_ms(ms):
+    return "%.0f ms" % ms if ms >= 10 else "%.1f ms" % ms
+
+
+def format_seconds(seconds):
+    if seconds < 1:
+        return format_ms(seconds * 1000)
+    if seconds < 60:
+        return "%.1f s" % seconds
+    if seconds < 3600:
+        return "%.1f min" % (seconds / 60)
+    return "%.1f h" % (seconds / 3600)
+
+
+METRICS = Metrics()
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import argparse
+
+from persistence import migrate_pickle_to_sqlite
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the bot's pickle database into a SQLite database.")
+    parser.add_argument("pickle_file", nargs="?", default="plotyourselfbot")
+    parser.add_argument("sqlite_file", nargs="?", default="plotyourselfbot.sqlite3")
+    parsed = parser.parse_args()
+
+    count = migrate_pickle_to_sqlite(parsed.pickle_file, parsed.sqlite_file)
+    print("Migrated " + str(count) + " chats from " + parsed.pickle_file + " to " + parsed.sqlite_file + ".")
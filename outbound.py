@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from metrics import METRICS
+
+# Messages used to be sent straight from the handlers, so a burst of commands ran into Telegram's flood control and
+# the RetryAfter errors ended up in the error handler with the reply lost. Every outgoing message now goes through
+# this queue, which paces sends with token buckets (one per chat and one for the whole bot), waits out RetryAfter
+# and sends the message again.
+#
+# Each chat's messages are sent one at a time in the order they were queued, so replies can't overtake each other.
+# Between chats, replies to commands go before bulk messages such as bet histories sent by DM.
+
+PRIORITY_REPLY = 0
+PRIORITY_BULK = 1
+
+# Telegram allows about 30 messages a second overall, one a second in a private chat and 20 a minute in a group.
+GLOBAL_RATE = 30.0
+PRIVATE_CHAT_RATE = 1.0
+GROUP_CHAT_RATE = 20.0 / 60
+CHAT_BURST = 3
+
+# How many times a send that failed on the network (rather than on flood control) is tried before giving up.
+MAX_ATTEMPTS = 3
+
+# A warning is logged each time the queue grows past another multiple of this.
+DEPTH_WARNING = 100
+
+
+class TokenBucket:
+    __slots__ = ("__rate", "__capacity", "__tokens", "__updated")
+
+    def __init__(self, rate, capacity):
+        self.__rate = rate
+        self.__capacity = capacity
+        self.__tokens = float(capacity)
+        self.__updated = time.monotonic()
+
+    def __refill(self, now):
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__rate)
+        self.__updated = now
+
+    def get_delay(self, now):
+        """
+        :return: How many seconds until a token is available, 0 if one is available now.
+        """
+        self.__refill(now)
+        return 0 if self.__tokens >= 1 else (1 - self.__tokens) / self.__rate
+
+    def is_full(self, now):
+        self.__refill(now)
+        return self.__tokens >= self.__capacity
+
+    def take(self, now):
+        self.__refill(now)
+        self.__tokens -= 1
+
+
+class OutboundQueue:
+    def __init__(self, workers=4, global_rate=GLOBAL_RATE, private_rate=PRIVATE_CHAT_RATE,
+                 group_rate=GROUP_CHAT_RATE, burst=CHAT_BURST):
+        self.__private_rate = private_rate
+        self.__group_rate = group_rate
+        self.__burst = burst
+        self.__global = TokenBucket(global_rate, max(1, int(global_rate)))
+        # Chat ID -> a deque of queued jobs, only for chats with messages waiting.
+        self.__chats = {}
+        # Chat ID -> its token bucket, and the time flood control said to wait until for chats told to wait.
+        self.__buckets = {}
+        self.__paused = {}
+        # Chats with a message being sent right now.
+        self.__sending = set()
+        self.__seq = itertools.count()
+        self.__depth = 0
+        self.__max_depth = 0
+        self.__sent = 0
+        self.__retried = 0
+        self.__failed = 0
+        self.__warned_depth = 0
+        self.__stopping = False
+        self.__cond = threading.Condition()
+        self.__threads = [threading.Thread(target=self.__run, name="outbound-" + str(i), daemon=True)
+                          for i in range(max(1, workers))]
+        for thread in self.__threads:
+            thread.start()
+
+    def __bucket(self, chat_id, now):
+        bucket = self.__buckets.get(chat_id)
+        if bucket is None:
+            if len(self.__buckets) > 1000 + len(self.__chats):
+                # Buckets that have filled back up are the same as new ones, so they can go.
+                self.__buckets = {c: b for c, b in self.__buckets.items() if c in self.__chats or not b.is_full(now)}
+            # Private chats have positive IDs and groups negative ones.
+            rate = self.__private_rate if chat_id > 0 else self.__group_rate
+            bucket = self.__buckets[chat_id] = TokenBucket(rate, self.__burst)
+        return bucket
+
+    def __next_job(self):
+        # Called with the lock held. Picks the most urgent job whose chat isn't already sending, isn't paused and has
+        # a token, or returns how long to wait before checking again.
+        now = time.monotonic()
+        wait = None
+        best = None
+        for chat_id, jobs in self.__chats.items():
+            if chat_id in self.__sending:
+                continue
+            delay = max(self.__paused.get(chat_id, now) - now, self.__bucket(chat_id, now).get_delay(now))
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            if best is None or jobs[0][:2] < self.__chats[best][0][:2]:
+                best = chat_id
+
+        if best is None:
+            return None, wait
+        delay = self.__global.get_delay(now)
+        if delay > 0:
+            return None, delay
+
+        self.__paused.pop(best, None)
+        self.__global.take(now)
+        self.__bucket(best, now).take(now)
+        jobs = self.__chats[best]
+        job = jobs.popleft()
+        if len(jobs) == 0:
+            del self.__chats[best]
+        self.__depth -= 1
+        self.__sending.add(best)
+        return (best, job), None
+
+    def __requeue(self, chat_id, job, delay):
+        # Called with the lock held. Puts a job back at the front of its chat and holds the chat for the delay.
+        self.__chats.setdefault(chat_id, deque()).appendleft(job)
+        self.__depth += 1
+        self.__paused[chat_id] = time.monotonic() + delay
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while True:
+                    picked, wait = self.__next_job()
+                    if picked is not None:
+                        break
+                    if self.__stopping and self.__depth == 0:
+                        return
+                    self.__cond.wait(wait)
+            chat_id, job = picked
+            priority, seq, send, callback, on_error, attempts = job
+
+            error = None
+            try:
+                result = send()
+            except RetryAfter as e:
+                with self.__cond:
+                    self.__retried += 1
+                    self.__requeue(chat_id, job, e.retry_after)
+                logging.getLogger(__name__).warning("Flood control for chat %s, retrying in %s s.", chat_id,
+                                                    e.retry_after)
+            except NetworkError as e:
+                # BadRequest is a NetworkError too but would only fail again, and a timeout may still have been
+                # delivered, so neither is sent again.
+                if not isinstance(e, (BadRequest, TimedOut)) and attempts + 1 < MAX_ATTEMPTS:
+                    with self.__cond:
+                        self.__retried += 1
+                        self.__requeue(chat_id, (priority, seq, send, callback, on_error, attempts + 1),
+                                       2 ** attempts)
+                else:
+                    error = e
+            except Exception as e:
+                error = e
+            else:
+                with self.__cond:
+                    self.__sent += 1
+                if callback is not None:
+                    self.__call(callback, result, chat_id)
+
+            if error is not None:
+                with self.__cond:
+                    self.__failed += 1
+                if on_error is not None:
+                    self.__call(on_error, error, chat_id)
+                else:
+                    logging.getLogger(__name__).warning("Sending to chat %s failed: %s", chat_id, error)
+
+            with self.__cond:
+                self.__sending.discard(chat_id)
+                self.__cond.notify_all()
+
+    def __call(self, callback, value, chat_id):
+        try:
+            callback(value)
+        except Exception:
+            logging.getLogger(__name__).exception("A send callback for chat %s failed.", chat_id)
+
+    def submit(self, chat_id, send, priority=PRIORITY_REPLY, callback=None, on_error=None):
+        """
+        Queue a message to be sent.
+        :param chat_id: The ID of the chat the message goes to. Messages for one chat are sent in submission order.
+        :param send: A function that makes the Bot API call and returns its result.
+        :param priority: PRIORITY_REPLY or PRIORITY_BULK.
+        :param callback: Called with the result of send once it succeeds, e.g. the sent message.
+        :param on_error: Called with the exception if the send fails for anything other than flood control. Without
+        it, failures are logged.
+        """
+        # What the send costs, and anything its callbacks queue, is charged to the command that queued it.
+        send = METRICS.bind(send)
+        callback = METRICS.bind(callback) if callback is not None else None
+        on_error = METRICS.bind(on_error) if on_error is not None else None
+        with self.__cond:
+            self.__chats.setdefault(chat_id, deque()).append((priority, next(self.__seq), send, callback, on_error, 0))
+            self.__depth += 1
+            self.__max_depth = max(self.__max_depth, self.__depth)
+            if self.__depth >= self.__warned_depth + DEPTH_WARNING:
+                self.__warned_depth = self.__depth - self.__depth % DEPTH_WARNING
+                logging.getLogger(__name__).warning("%d messages are waiting to be sent.", self.__depth)
+            elif self.__depth < self.__warned_depth:
+                self.__warned_depth = self.__depth - self.__depth % DEPTH_WARNING
+            self.__cond.notify()
+
+    def get_depth(self):
+        """
+        :return: The number of messages waiting to be sent.
+        """
+        with self.__cond:
+            return self.__depth
+
+    def get_stats(self):
+        """
+        :return: A dictionary with the current and largest queue depth, the number of chats with messages waiting
+        and counts of messages sent, retried and failed.
+        """
+        with self.__cond:
+            return {"depth": self.__depth,
+                    "max_depth": self.__max_depth,
+                    "chats": len(self.__chats),
+                    "sent": self.__sent,
+                    "retried": self.__retried,
+                    "failed": self.__failed}
+
+    def shutdown(self, timeout=10):
+        """
+        Send what's left in the queue, waiting at most timeout seconds, and stop the workers.
+        """
+        with self.__cond:
+            self.__stopping = True
+            self.__cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.__threads:
+            thread.join(max(0, deadline - time.monotonic()))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import uuid
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from render_cache import RenderCache
+
+# Long listings (bet histories, plot lists, who's plotted) used to be sent either as one message per entry, which ran
+# into rate limits, or as one unbounded message, which Telegram rejects past 4096 characters. pack fills each message
+# as close to the limit as it can without splitting an entry, and outputs that still need more than MAX_PAGES
+# messages are sent as one message with buttons to page through them.
+
+# Telegram's limit, counted in UTF-16 code units, which is how it counts characters.
+MESSAGE_LIMIT = 4096
+MAX_PAGES = 3
+
+# Callback data of the page buttons: "page <token> <page index>".
+CALLBACK_PREFIX = "page"
+
+
+def get_length(text):
+    """
+    :return: The length of the text as Telegram counts it.
+    """
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_block(block, limit=MESSAGE_LIMIT):
+    """
+    Split a block that's too long for one message at line breaks, and lines that are too long anywhere.
+    :return: A list of pieces that each fit in a message.
+    """
+    if get_length(block) <= limit:
+        return [block]
+
+    pieces = []
+    piece = ""
+    for line in block.splitlines(True):
+        while get_length(line) > limit:
+            # Cut the line at the most characters that fit, which is fewer than limit if it has wide characters.
+            cut = limit
+            while get_length(line[:cut]) > limit:
+                # A character is at most two code units, so at least half the excess has to go.
+                cut -= (get_length(line[:cut]) - limit + 1) // 2
+            if piece:
+                pieces.append(piece)
+                piece = ""
+            pieces.append(line[:cut])
+            line = line[cut:]
+        if get_length(piece) + get_length(line) > limit:
+            pieces.append(piece)
+            piece = ""
+        piece += line
+    if piece:
+        pieces.append(piece)
+    return pieces
+
+
+def pack(blocks, limit=MESSAGE_LIMIT):
+    """
+    Pack blocks of text into as few messages as possible, keeping each block in one message unless it doesn't fit
+    in one on its own.
+    :param blocks: The blocks of text in order, e.g. a header and then one per entry, with their own line breaks.
+    :param limit: The most characters a message can have.
+    :return: A list of message texts.
+    """
+    pages = []
+    page = ""
+    length = 0
+    for block in blocks:
+        for piece in split_block(block, limit):
+            piece_length = get_length(piece)
+            if length + piece_length > limit:
+                pages.append(page)
+                page = ""
+                length = 0
+            page += piece
+            length += piece_length
+    if page.strip():
+        pages.append(page)
+    return pages
+
+
+class Pager:
+    def __init__(self, max_entries=1024, max_pages=MAX_PAGES):
+        # Token -> the pages of an output sent with page buttons. Kept in memory, so buttons stop working after a
+        # restart or once the output ages out.
+        self.__outputs = RenderCache(max_entries=max_entries, sizeof=lambda v: 1)
+        self.__max_pages = max_pages
+
+    def paginate(self, pages):
+        """
+        :param pages: A list of message texts, e.g. from pack.
+        :return: A list of (text, reply_markup) messages to send: the pages themselves if there are at most
+        max_pages of them, else the first page with buttons to page through the rest.
+        """
+        if len(pages) <= self.__max_pages:
+            return [(page, None) for page in pages]
+        # Random rather than counted, so a button from before a restart can't open a newer output.
+        token = uuid.uuid4().hex[:16]
+        self.__outputs.put(token, pages)
+        return [(pages[0], self.get_markup(token, 0, len(pages)))]
+
+    def get_page(self, data):
+        """
+        :param data: The callback data of a page button.
+        :return: The (text, reply_markup) of the page the button goes to, or None if the output has expired.
+        """
+        _, token, index = data.split(" ")
+        pages = self.__outputs.get(token)
+        index = int(index)
+        if pages is None or not 0 <= index < len(pages):
+            return None
+        return pages[index], self.get_markup(token, index, len(pages))
+
+    def get_markup(self, token, index, count):
+        """
+        :return: The buttons for page index of count: previous, where this page is, and next.
+        """
+        def button(text, target):
+            return InlineKeyboardButton(text, callback_data=" ".join((CALLBACK_PREFIX, token, str(target))))
+
+        buttons = [button(str(index + 1) + "/" + str(count), index)]
+        if index > 0:
+            buttons.insert(0, button("« Prev", index - 1))
+        if index < count - 1:
+            buttons.append(button("Next »", index + 1))
+        return InlineKeyboardMarkup([buttons])
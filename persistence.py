@@ -0,0 +1,901 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import defaultdict, OrderedDict
+
+from telegram.ext import BasePersistence
+
+# A missing value in a recorded path means the entry was deleted.
+_MISSING = object()
+
+
+def lookup_path(data, path):
+    """
+    Walk a tuple of keys down a nested dictionary.
+    :param data: The dictionary to search.
+    :param path: A tuple of keys.
+    :return: The value at the end of the path, or _MISSING if any key along the way doesn't exist.
+    """
+    value = data
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
+
+
+def apply_entry(data, entry):
+    """
+    Apply one journal entry to a loaded database.
+    :param data: A dictionary in the PicklePersistence single file format.
+    :param entry: A tuple of (op, scope, key, path, value) where op is "set" or "delete".
+    """
+    op, scope, key, path, value = entry
+
+    if scope == "bot_data":
+        container = data["bot_data"]
+        path = (key,) + tuple(path) if key is not None else tuple(path)
+        if len(path) == 0:
+            data["bot_data"] = value if op == "set" else {}
+            return
+    else:
+        container = data[scope]
+        path = (key,) + tuple(path)
+
+    for k in path[:-1]:
+        if not isinstance(container.get(k), dict):
+            container[k] = {}
+        container = container[k]
+
+    if op == "set":
+        container[path[-1]] = value
+    else:
+        container.pop(path[-1], None)
+
+
+def empty_database():
+    return {"conversations": {}, "user_data": defaultdict(dict), "chat_data": defaultdict(dict), "bot_data": {}}
+
+
+def load_snapshot(filename):
+    """
+    Load a database written by PicklePersistence (single file) or by JournalPersistence compaction.
+    :param filename: The path to the pickle file.
+    :return: A dictionary in the PicklePersistence single file format.
+    """
+    try:
+        with open(filename, "rb") as f:
+            data = pickle.load(f)
+    except IOError:
+        return empty_database()
+    except pickle.UnpicklingError:
+        raise TypeError("File {} does not contain valid pickle data".format(filename))
+    except Exception:
+        raise TypeError("Something went wrong unpickling {}".format(filename))
+
+    return {"conversations": data.get("conversations", {}),
+            "user_data": defaultdict(dict, data.get("user_data", {})),
+            "chat_data": defaultdict(dict, data.get("chat_data", {})),
+            "bot_data": data.get("bot_data", {})}
+
+
+def replay_journal(data, filename):
+    """
+    Apply every entry of a journal file to a loaded database. A torn entry at the end of the file (from a crash
+    mid-write) is cut off so that later appends start from a clean offset.
+    :param data: A dictionary in the PicklePersistence single file format.
+    :param filename: The path to the journal file.
+    :return: The number of entries applied.
+    """
+    if not os.path.exists(filename):
+        return 0
+
+    count = 0
+    good_offset = 0
+    with open(filename, "rb") as f:
+        while True:
+            try:
+                entry = pickle.load(f)
+            except EOFError:
+                break
+            except Exception:
+                logging.getLogger(__name__).warning("Discarding torn journal tail in %s at offset %d",
+                                                    filename, good_offset)
+                break
+            apply_entry(data, entry)
+            good_offset = f.tell()
+            count += 1
+
+    if os.path.getsize(filename) != good_offset:
+        with open(filename, "r+b") as f:
+            f.truncate(good_offset)
+    return count
+
+
+def write_snapshot(data, filename):
+    """
+    Atomically replace a snapshot file with the given database.
+    :param data: A dictionary in the PicklePersistence single file format.
+    :param filename: The path to the pickle file.
+    """
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+        pickle.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+class JournalPersistence(BasePersistence):
+    """
+    A persistence class that keeps the database in the PicklePersistence single file format, but saves each
+    change by appending it to a journal instead of re-pickling everything. The journal is replayed at startup and
+    merged back into the snapshot by a background thread once it grows past compact_bytes. Compaction works only
+    on the files on disk, so it never touches objects the handlers are mutating. If a compaction fails, the journal
+    isn't rotated again until its segment is merged, which is retried at most every compact_retry_seconds.
+    """
+
+    def __init__(self, filename,
+                 store_user_data=True,
+                 store_chat_data=True,
+                 store_bot_data=True,
+                 compact_bytes=8 * 1024 * 1024,
+                 compact_retry_seconds=60):
+        super().__init__(store_user_data=store_user_data,
+                         store_chat_data=store_chat_data,
+                         store_bot_data=store_bot_data)
+        self.filename = filename
+        self.journal_filename = filename + ".journal"
+        self.compacting_filename = filename + ".journal.compacting"
+        self.compact_bytes = compact_bytes
+        self.compact_retry_seconds = compact_retry_seconds
+        self.user_data = None
+        self.chat_data = None
+        self.bot_data = None
+        self.conversations = None
+        self.__journal = None
+        self.__lock = threading.Lock()
+        self.__compactor = None
+        # When the last compaction failed, from time.monotonic(), or None.
+        self.__compact_failed_at = None
+
+    def __load(self):
+        if self.chat_data is not None:
+            return
+
+        data = load_snapshot(self.filename)
+        # A leftover compacting segment means a compaction was interrupted; it's older than the live journal.
+        replay_journal(data, self.compacting_filename)
+        replay_journal(data, self.journal_filename)
+
+        self.conversations = data["conversations"]
+        self.user_data = data["user_data"]
+        self.chat_data = data["chat_data"]
+        self.bot_data = data["bot_data"]
+
+        self.__journal = open(self.journal_filename, "ab")
+        if os.path.exists(self.compacting_filename):
+            self.__start_compaction(rotate=False)
+
+    def __append(self, entry):
+        self.__load()
+        with self.__lock:
+            pickle.dump(entry, self.__journal)
+            self.__journal.flush()
+            should_compact = self.__journal.tell() >= self.compact_bytes
+        if should_compact:
+            self.__start_compaction()
+
+    def __start_compaction(self, rotate=True):
+        with self.__lock:
+            if self.__compactor is not None and self.__compactor.is_alive():
+                return
+            if rotate and os.path.exists(self.compacting_filename):
+                # An earlier compaction failed and left its segment behind, and the live journal keeps growing
+                # until that segment is merged, so retry it instead of rotating.
+                if self.__compact_failed_at is not None and \
+                        time.monotonic() - self.__compact_failed_at < self.compact_retry_seconds:
+                    return
+                logging.getLogger(__name__).error("Journal compaction is stuck on %s; the journal is %d bytes. "
+                                                  "Retrying.", self.compacting_filename, self.__journal.tell())
+                rotate = False
+            if rotate:
+                self.__journal.close()
+                os.replace(self.journal_filename, self.compacting_filename)
+                self.__journal = open(self.journal_filename, "ab")
+            self.__compactor = threading.Thread(target=self.compact, name="journal-compactor", daemon=True)
+            self.__compactor.start()
+
+    def compact(self):
+        """
+        Merge the rotated journal segment into the snapshot file.
+        """
+        if not os.path.exists(self.compacting_filename):
+            return
+        try:
+            data = load_snapshot(self.filename)
+            replay_journal(data, self.compacting_filename)
+            write_snapshot(data, self.filename)
+            os.remove(self.compacting_filename)
+            self.__compact_failed_at = None
+        except Exception:
+            self.__compact_failed_at = time.monotonic()
+            logging.getLogger(__name__).exception("Journal compaction failed; it will be retried.")
+
+    def record(self, chat_id, chat_data, *paths):
+        """
+        Append the current value of each path in a chat's data to the journal.
+        :param chat_id: The ID of the chat.
+        :param chat_data: The dictionary of data for the chat.
+        :param paths: Tuples of keys into chat_data, e.g. ("plots", 3). A path that no longer exists is recorded
+        as a deletion. With no paths, the whole chat is recorded.
+        """
+        if not self.store_chat_data:
+            return
+        self.__load()
+        self.chat_data[chat_id] = chat_data
+
+        if len(paths) == 0:
+            self.__append(("set", "chat_data", chat_id, (), chat_data))
+            return
+
+        for path in paths:
+            value = lookup_path(chat_data, path)
+            if value is _MISSING:
+                self.__append(("delete", "chat_data", chat_id, tuple(path), None))
+            else:
+                self.__append(("set", "chat_data", chat_id, tuple(path), value))
+
+    def get_user_data(self):
+        self.__load()
+        return self.user_data
+
+    def get_chat_data(self):
+        self.__load()
+        return self.chat_data
+
+    def get_bot_data(self):
+        self.__load()
+        return self.bot_data
+
+    def get_conversations(self, name):
+        self.__load()
+        return self.conversations.get(name, {}).copy()
+
+    def update_conversation(self, name, key, new_state):
+        self.__load()
+        if self.conversations.setdefault(name, {}).get(key) == new_state:
+            return
+        self.conversations[name][key] = new_state
+        self.__append(("set", "conversations", name, (key,), new_state))
+
+    def update_user_data(self, user_id, data):
+        self.__load()
+        if self.user_data.get(user_id) == data:
+            return
+        self.user_data[user_id] = data
+        self.__append(("set", "user_data", user_id, (), data))
+
+    def update_chat_data(self, chat_id, data):
+        # Handlers mutate chat_data in place and record their own changes, so there is nothing to compare here.
+        self.__load()
+        self.chat_data[chat_id] = data
+
+    def update_bot_data(self, data):
+        self.__load()
+        if self.bot_data == data:
+            return
+        self.bot_data = data
+        self.__append(("set", "bot_data", None, (), data))
+
+    def flush(self):
+        if self.__journal is None:
+            return
+        with self.__lock:
+            self.__journal.flush()
+            os.fsync(self.__journal.fileno())
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plots (
+    chat_id INTEGER NOT NULL,
+    plot_id NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT,
+    creator_name TEXT,
+    creator_id INTEGER,
+    custompoints INTEGER,
+    last_modified TEXT,
+    layout BLOB NOT NULL,
+    PRIMARY KEY (chat_id, plot_id)
+);
+CREATE TABLE IF NOT EXISTS points (
+    chat_id INTEGER NOT NULL,
+    plot_id NOT NULL,
+    slot INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    x REAL,
+    y REAL,
+    err_x REAL,
+    err_y REAL,
+    vals TEXT,
+    PRIMARY KEY (chat_id, plot_id, slot)
+);
+CREATE TABLE IF NOT EXISTS crowdsourced_points (
+    chat_id INTEGER NOT NULL,
+    plot_id NOT NULL,
+    label TEXT NOT NULL,
+    contributor_id INTEGER NOT NULL,
+    x REAL,
+    y REAL,
+    vals TEXT,
+    PRIMARY KEY (chat_id, plot_id, label, contributor_id)
+);
+CREATE TABLE IF NOT EXISTS crowdsource_consent (
+    chat_id INTEGER NOT NULL,
+    plot_id NOT NULL,
+    slot INTEGER NOT NULL,
+    user_id INTEGER,
+    label TEXT,
+    PRIMARY KEY (chat_id, plot_id, slot)
+);
+CREATE TABLE IF NOT EXISTS archived (
+    chat_id INTEGER NOT NULL,
+    plot_id NOT NULL,
+    PRIMARY KEY (chat_id, plot_id)
+);
+CREATE TABLE IF NOT EXISTS current_bets (
+    chat_id INTEGER PRIMARY KEY,
+    plot_id,
+    degree INTEGER,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS current_bet_entries (
+    chat_id INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    username TEXT,
+    user_id INTEGER,
+    value REAL,
+    PRIMARY KEY (chat_id, slot)
+);
+CREATE TABLE IF NOT EXISTS bets (
+    chat_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    plot_id,
+    degree INTEGER,
+    winner TEXT,
+    winner_id INTEGER,
+    winner_value REAL,
+    actual_value REAL,
+    PRIMARY KEY (chat_id, created_at)
+);
+CREATE TABLE IF NOT EXISTS bet_entries (
+    chat_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    username TEXT,
+    user_id INTEGER,
+    value REAL,
+    PRIMARY KEY (chat_id, created_at, slot)
+);
+CREATE TABLE IF NOT EXISTS user_bet_stats (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    total_wins INTEGER,
+    total_bets INTEGER,
+    avg_diff REAL,
+    win_avg_diff REAL,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS user_bet_wins (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    created_at TEXT,
+    PRIMARY KEY (chat_id, user_id, slot)
+);
+CREATE TABLE IF NOT EXISTS user_bets (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    plot_id,
+    degree INTEGER,
+    bet REAL,
+    PRIMARY KEY (chat_id, user_id, created_at)
+);
+CREATE TABLE IF NOT EXISTS scoreboard (
+    chat_id INTEGER NOT NULL,
+    username TEXT,
+    user_id INTEGER,
+    wins INTEGER,
+    avg_diff REAL,
+    PRIMARY KEY (chat_id, username, user_id)
+);
+CREATE TABLE IF NOT EXISTS chat_extras (
+    chat_id INTEGER NOT NULL,
+    key BLOB NOT NULL,
+    value BLOB,
+    PRIMARY KEY (chat_id, key)
+);
+CREATE TABLE IF NOT EXISTS misc (
+    scope TEXT NOT NULL,
+    key BLOB NOT NULL,
+    value BLOB,
+    PRIMARY KEY (scope, key)
+);
+"""
+
+# Tables holding one row per (chat, plot) entry that get rewritten together.
+_PLOT_TABLES = ["plots", "points", "crowdsourced_points", "crowdsource_consent"]
+
+# Keys of chat_data that have their own tables. Anything else is pickled whole into chat_extras.
+_NORMALIZED_KEYS = ["plots", "archived", "current_bet", "all_bets", "all_user_bet_data", "scoreboard",
+                    "scoreboard_avg"]
+
+# Everything under the whole section rather than one entry of it.
+_ALL = object()
+
+
+def _plot_classes():
+    from plot import Plot, BoxedPlot, AlignmentChart, TrianglePlot, RadarPlot
+    return {cls.__name__: cls for cls in [Plot, BoxedPlot, AlignmentChart, TrianglePlot, RadarPlot]}
+
+
+def get_plot_state(plot):
+    """
+    Get the attributes of a plot object without their name-mangling prefix.
+    :param plot: A plot object.
+    :return: A tuple of the class name and a dictionary of attribute names to values.
+    """
+    kind = type(plot).__name__
+    prefix = "_" + kind + "__"
+    return kind, {(k[len(prefix):] if k.startswith(prefix) else k): v for k, v in plot.__getstate__().items()}
+
+
+def make_plot(kind, state):
+    """
+    Rebuild a plot object from the attributes returned by get_plot_state.
+    :param kind: The class name of the plot.
+    :param state: A dictionary of attribute names to values.
+    :return: A plot object.
+    """
+    cls = _plot_classes()[kind]
+    plot = cls.__new__(cls)
+    prefix = "_" + kind + "__"
+    # The same path unpickling takes, so any upgrades the class makes to old state apply here too.
+    plot.__setstate__({prefix + k: v for k, v in state.items()})
+    return plot
+
+
+class LazyChatData(defaultdict):
+    """
+    The chat_data mapping handed to the dispatcher. A chat's data is read from the database the first time the
+    dispatcher asks for it, so startup doesn't load chats that never send another update.
+    """
+
+    def __init__(self, loader):
+        super().__init__(dict)
+        self.__loader = loader
+
+    def __missing__(self, chat_id):
+        data = self.__loader(chat_id)
+        self[chat_id] = data
+        return data
+
+    def __reduce__(self):
+        return defaultdict, (dict, dict(self))
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    A persistence class that stores plots, points, crowdsourced points, archives, bets and scoreboards in
+    normalized SQLite tables. Each chat's data is loaded the first time an update arrives from it. Like
+    JournalPersistence, handlers save their changes with record().
+    """
+
+    def __init__(self, filename,
+                 store_user_data=True,
+                 store_chat_data=True,
+                 store_bot_data=True):
+        super().__init__(store_user_data=store_user_data,
+                         store_chat_data=store_chat_data,
+                         store_bot_data=store_bot_data)
+        import sqlite3
+
+        self.filename = filename
+        self.__conn = sqlite3.connect(filename, check_same_thread=False)
+        self.__conn.executescript(SQLITE_SCHEMA)
+        self.__lock = threading.RLock()
+        self.chat_data = LazyChatData(self.load_chat)
+        self.user_data = None
+        self.bot_data = None
+        self.conversations = None
+
+    def __misc(self, scope):
+        with self.__lock:
+            rows = self.__conn.execute("SELECT key, value FROM misc WHERE scope = ?", (scope,)).fetchall()
+        return {pickle.loads(k): pickle.loads(v) for (k, v) in rows}
+
+    def __put_misc(self, scope, key, value):
+        with self.__lock, self.__conn:
+            self.__conn.execute("INSERT OR REPLACE INTO misc (scope, key, value) VALUES (?, ?, ?)",
+                                (scope, pickle.dumps(key), pickle.dumps(value)))
+
+    def load_chat(self, chat_id):
+        """
+        Read one chat's data out of the database.
+        :param chat_id: The ID of the chat.
+        :return: The dictionary of data for the chat, in the shape the handlers expect.
+        """
+        import datetime
+
+        with self.__lock:
+            q = lambda sql: self.__conn.execute(sql, (chat_id,)).fetchall()
+            plot_rows = q("SELECT plot_id, kind, name, creator_name, creator_id, custompoints, last_modified, layout "
+                          "FROM plots WHERE chat_id = ?")
+            point_rows = q("SELECT plot_id, label, x, y, err_x, err_y, vals FROM points WHERE chat_id = ? "
+                           "ORDER BY plot_id, slot")
+            crowd_rows = q("SELECT plot_id, label, contributor_id, x, y, vals FROM crowdsourced_points "
+                           "WHERE chat_id = ? ORDER BY rowid")
+            consent_rows = q("SELECT plot_id, user_id, label FROM crowdsource_consent WHERE chat_id = ? "
+                             "ORDER BY plot_id, slot")
+            archived_rows = q("SELECT plot_id FROM archived WHERE chat_id = ?")
+            current_rows = q("SELECT plot_id, degree, created_at FROM current_bets WHERE chat_id = ?")
+            current_entry_rows = q("SELECT username, user_id, value FROM current_bet_entries WHERE chat_id = ? "
+                                   "ORDER BY slot")
+            bet_rows = q("SELECT created_at, plot_id, degree, winner, winner_id, winner_value, actual_value "
+                         "FROM bets WHERE chat_id = ? ORDER BY rowid")
+            bet_entry_rows = q("SELECT created_at, username, user_id, value FROM bet_entries WHERE chat_id = ? "
+                               "ORDER BY created_at, slot")
+            stat_rows = q("SELECT user_id, total_wins, total_bets, avg_diff, win_avg_diff FROM user_bet_stats "
+                          "WHERE chat_id = ?")
+            win_rows = q("SELECT user_id, created_at FROM user_bet_wins WHERE chat_id = ? ORDER BY user_id, slot")
+            user_bet_rows = q("SELECT user_id, created_at, plot_id, degree, bet FROM user_bets WHERE chat_id = ? "
+                              "ORDER BY rowid")
+            score_rows = q("SELECT username, user_id, wins, avg_diff FROM scoreboard WHERE chat_id = ?")
+            extra_rows = q("SELECT key, value FROM chat_extras WHERE chat_id = ?")
+
+        chat_data = {}
+
+        if len(plot_rows) > 0:
+            states = {}
+            for (plot_id, kind, name, creator_name, creator_id, custompoints, last_modified, layout) in plot_rows:
+                state = pickle.loads(layout)
+                state["id"] = plot_id
+                state["name"] = name
+                state["createdby"] = (creator_name, creator_id) if creator_id is not None else creator_name
+                if custompoints is not None:
+                    state["custompoints"] = bool(custompoints)
+                state["last_modified"] = datetime.datetime.fromisoformat(last_modified) \
+                    if last_modified is not None else None
+                state["points"] = []
+                state["crowdsourced_points"] = {}
+                state["crowdsourceable"] = []
+                states[plot_id] = (kind, state)
+            for (plot_id, label, x, y, err_x, err_y, vals) in point_rows:
+                if vals is not None:
+                    states[plot_id][1]["points"].append((label, json.loads(vals)))
+                else:
+                    states[plot_id][1]["points"].append((label, x, y, err_x, err_y))
+            for (plot_id, label, contributor_id, x, y, vals) in crowd_rows:
+                value = json.loads(vals) if vals is not None else (x, y)
+                states[plot_id][1]["crowdsourced_points"].setdefault(label, {})[contributor_id] = value
+            for (plot_id, user_id, label) in consent_rows:
+                states[plot_id][1]["crowdsourceable"].append((user_id, label))
+            chat_data["plots"] = {plot_id: make_plot(kind, state) for plot_id, (kind, state) in states.items()}
+
+        if len(archived_rows) > 0:
+            # Only whether a plot is archived is kept; the plot itself is in the full plot list.
+            chat_data["archived"] = {plot_id: True for (plot_id,) in archived_rows}
+
+        for (plot_id, degree, created_at) in current_rows:
+            chat_data["current_bet"] = {"plot_id": plot_id,
+                                        "degree": degree,
+                                        "bets": OrderedDict(((username, user_id), value)
+                                                            for (username, user_id, value) in current_entry_rows),
+                                        "created_at": created_at}
+
+        if len(bet_rows) > 0:
+            entries = {}
+            for (created_at, username, user_id, value) in bet_entry_rows:
+                entries.setdefault(created_at, OrderedDict())[(username, user_id)] = value
+            chat_data["all_bets"] = {}
+            for (created_at, plot_id, degree, winner, winner_id, winner_value, actual_value) in bet_rows:
+                chat_data["all_bets"][created_at] = {"plot_id": plot_id,
+                                                     "degree": degree,
+                                                     "bets": entries.get(created_at, OrderedDict()),
+                                                     "created_at": created_at,
+                                                     "winner": winner,
+                                                     "winner_id": winner_id,
+                                                     "winner_value": winner_value,
+                                                     "actual_value": actual_value}
+
+        if len(stat_rows) > 0:
+            chat_data["all_user_bet_data"] = {}
+            for (user_id, total_wins, total_bets, avg_diff, win_avg_diff) in stat_rows:
+                chat_data["all_user_bet_data"][user_id] = {"total_wins": total_wins,
+                                                           "win_keys": [],
+                                                           "total_bets": total_bets,
+                                                           "avg_diff": avg_diff,
+                                                           "win_avg_diff": win_avg_diff,
+                                                           "bets": {}}
+            for (user_id, created_at) in win_rows:
+                chat_data["all_user_bet_data"][user_id]["win_keys"].append(created_at)
+            for (user_id, created_at, plot_id, degree, bet) in user_bet_rows:
+                chat_data["all_user_bet_data"][user_id]["bets"][created_at] = {"plot_id": plot_id,
+                                                                              "degree": degree,
+                                                                              "bet": bet}
+
+        for (username, user_id, wins, avg_diff) in score_rows:
+            if wins is not None:
+                chat_data.setdefault("scoreboard", {})[(username, user_id)] = wins
+            if avg_diff is not None:
+                chat_data.setdefault("scoreboard_avg", {})[(username, user_id)] = avg_diff
+
+        for (key, value) in extra_rows:
+            chat_data[pickle.loads(key)] = pickle.loads(value)
+
+        return chat_data
+
+    def __delete(self, cur, tables, chat_id, where="", params=()):
+        for table in tables:
+            cur.execute("DELETE FROM " + table + " WHERE chat_id = ?" + where, (chat_id,) + tuple(params))
+
+    def __write_plot(self, cur, chat_id, plot_id, plot):
+        self.__delete(cur, _PLOT_TABLES, chat_id, " AND plot_id = ?", (plot_id,))
+        if plot is None:
+            return
+
+        kind, state = get_plot_state(plot)
+        points = state.pop("points", [])
+        crowdsourced = state.pop("crowdsourced_points", {})
+        consent = state.pop("crowdsourceable", [])
+        creator = state.pop("createdby", None)
+        custompoints = state.pop("custompoints", None)
+        last_modified = state.pop("last_modified", None)
+        name = state.pop("name", None)
+        state.pop("id", None)
+
+        creator_name, creator_id = creator if isinstance(creator, tuple) else (creator, None)
+        cur.execute("INSERT INTO plots (chat_id, plot_id, kind, name, creator_name, creator_id, custompoints, "
+                    "last_modified, layout) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (chat_id, plot_id, kind, name, creator_name, creator_id,
+                     int(custompoints) if custompoints is not None else None,
+                     last_modified.isoformat() if last_modified is not None else None,
+                     pickle.dumps(state)))
+
+        for slot, p in enumerate(points):
+            if len(p) == 2:
+                cur.execute("INSERT INTO points (chat_id, plot_id, slot, label, vals) VALUES (?, ?, ?, ?, ?)",
+                            (chat_id, plot_id, slot, p[0], json.dumps(list(p[1]))))
+            else:
+                cur.execute("INSERT INTO points (chat_id, plot_id, slot, label, x, y, err_x, err_y) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (chat_id, plot_id, slot) + tuple(p))
+
+        for label, contributions in (crowdsourced or {}).items():
+            for contributor_id, value in contributions.items():
+                if kind == "RadarPlot":
+                    cur.execute("INSERT INTO crowdsourced_points (chat_id, plot_id, label, contributor_id, vals) "
+                                "VALUES (?, ?, ?, ?, ?)",
+                                (chat_id, plot_id, label, contributor_id, json.dumps(list(value))))
+                else:
+                    cur.execute("INSERT INTO crowdsourced_points (chat_id, plot_id, label, contributor_id, x, y) "
+                                "VALUES (?, ?, ?, ?, ?, ?)", (chat_id, plot_id, label, contributor_id) + tuple(value))
+
+        for slot, (user_id, label) in enumerate(consent or []):
+            cur.execute("INSERT INTO crowdsource_consent (chat_id, plot_id, slot, user_id, label) "
+                        "VALUES (?, ?, ?, ?, ?)", (chat_id, plot_id, slot, user_id, label))
+
+    def __write_current_bet(self, cur, chat_id, bet):
+        self.__delete(cur, ["current_bets", "current_bet_entries"], chat_id)
+        if not isinstance(bet, dict):
+            return
+        cur.execute("INSERT INTO current_bets (chat_id, plot_id, degree, created_at) VALUES (?, ?, ?, ?)",
+                    (chat_id, bet.get("plot_id"), bet.get("degree"), bet.get("created_at")))
+        for slot, ((username, user_id), value) in enumerate((bet.get("bets") or {}).items()):
+            cur.execute("INSERT INTO current_bet_entries (chat_id, slot, username, user_id, value) "
+                        "VALUES (?, ?, ?, ?, ?)", (chat_id, slot, username, user_id, value))
+
+    def __write_bet(self, cur, chat_id, created_at, bet):
+        self.__delete(cur, ["bets", "bet_entries"], chat_id, " AND created_at = ?", (created_at,))
+        if bet is None:
+            return
+        cur.execute("INSERT INTO bets (chat_id, created_at, plot_id, degree, winner, winner_id, winner_value, "
+                    "actual_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (chat_id, created_at, bet.get("plot_id"), bet.get("degree"), bet.get("winner"),
+                     bet.get("winner_id"), bet.get("winner_value"), bet.get("actual_value")))
+        for slot, ((username, user_id), value) in enumerate((bet.get("bets") or {}).items()):
+            cur.execute("INSERT INTO bet_entries (chat_id, created_at, slot, username, user_id, value) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", (chat_id, created_at, slot, username, user_id, value))
+
+    def __write_user_bet_data(self, cur, chat_id, user_id, data):
+        self.__delete(cur, ["user_bet_stats", "user_bet_wins", "user_bets"], chat_id, " AND user_id = ?", (user_id,))
+        if data is None:
+            return
+        cur.execute("INSERT INTO user_bet_stats (chat_id, user_id, total_wins, total_bets, avg_diff, win_avg_diff) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (chat_id, user_id, data.get("total_wins"), data.get("total_bets"), data.get("avg_diff"),
+                     data.get("win_avg_diff")))
+        for slot, created_at in enumerate(data.get("win_keys", [])):
+            cur.execute("INSERT INTO user_bet_wins (chat_id, user_id, slot, created_at) VALUES (?, ?, ?, ?)",
+                        (chat_id, user_id, slot, created_at))
+        for created_at, bet in data.get("bets", {}).items():
+            cur.execute("INSERT INTO user_bets (chat_id, user_id, created_at, plot_id, degree, bet) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (chat_id, user_id, created_at, bet.get("plot_id"), bet.get("degree"), bet.get("bet")))
+
+    def __write_score(self, cur, chat_id, chat_data, key):
+        username, user_id = key
+        self.__delete(cur, ["scoreboard"], chat_id, " AND username IS ? AND user_id IS ?", (username, user_id))
+        wins = (chat_data.get("scoreboard") or {}).get(key)
+        avg_diff = (chat_data.get("scoreboard_avg") or {}).get(key)
+        if wins is None and avg_diff is None:
+            return
+        cur.execute("INSERT INTO scoreboard (chat_id, username, user_id, wins, avg_diff) VALUES (?, ?, ?, ?, ?)",
+                    (chat_id, username, user_id, wins, avg_diff))
+
+    def __write_section(self, cur, chat_id, chat_data, top, sub=_ALL):
+        value = chat_data.get(top)
+
+        if top == "plots":
+            if sub is _ALL:
+                self.__delete(cur, _PLOT_TABLES, chat_id)
+                for plot_id, plot in (value or {}).items():
+                    self.__write_plot(cur, chat_id, plot_id, plot)
+            else:
+                self.__write_plot(cur, chat_id, sub, (value or {}).get(sub))
+        elif top == "archived":
+            keys = list((value or {}).keys()) if sub is _ALL else [sub]
+            if sub is _ALL:
+                self.__delete(cur, ["archived"], chat_id)
+            for plot_id in keys:
+                self.__delete(cur, ["archived"], chat_id, " AND plot_id = ?", (plot_id,))
+                if value is not None and plot_id in value:
+                    cur.execute("INSERT INTO archived (chat_id, plot_id) VALUES (?, ?)", (chat_id, plot_id))
+        elif top == "current_bet":
+            self.__write_current_bet(cur, chat_id, value)
+        elif top == "all_bets":
+            if sub is _ALL:
+                self.__delete(cur, ["bets", "bet_entries"], chat_id)
+                for created_at, bet in (value or {}).items():
+                    self.__write_bet(cur, chat_id, created_at, bet)
+            else:
+                self.__write_bet(cur, chat_id, sub, (value or {}).get(sub))
+        elif top == "all_user_bet_data":
+            if sub is _ALL:
+                self.__delete(cur, ["user_bet_stats", "user_bet_wins", "user_bets"], chat_id)
+                for user_id, data in (value or {}).items():
+                    self.__write_user_bet_data(cur, chat_id, user_id, data)
+            else:
+                self.__write_user_bet_data(cur, chat_id, sub, (value or {}).get(sub))
+        elif top in ["scoreboard", "scoreboard_avg"]:
+            if sub is _ALL:
+                self.__delete(cur, ["scoreboard"], chat_id)
+                keys = set((chat_data.get("scoreboard") or {}).keys()) | \
+                    set((chat_data.get("scoreboard_avg") or {}).keys())
+                for key in keys:
+                    self.__write_score(cur, chat_id, chat_data, key)
+            else:
+                self.__write_score(cur, chat_id, chat_data, sub)
+        else:
+            self.__delete(cur, ["chat_extras"], chat_id, " AND key = ?", (pickle.dumps(top),))
+            if top in chat_data:
+                cur.execute("INSERT INTO chat_extras (chat_id, key, value) VALUES (?, ?, ?)",
+                            (chat_id, pickle.dumps(top), pickle.dumps(value)))
+
+    def write_chat(self, chat_id, chat_data):
+        """
+        Replace everything stored for a chat with the given data.
+        :param chat_id: The ID of the chat.
+        :param chat_data: The dictionary of data for the chat.
+        """
+        with self.__lock, self.__conn:
+            cur = self.__conn.cursor()
+            self.__delete(cur, ["chat_extras"], chat_id)
+            for top in set(_NORMALIZED_KEYS) | set(chat_data.keys()):
+                self.__write_section(cur, chat_id, chat_data, top)
+
+    def record(self, chat_id, chat_data, *paths):
+        """
+        Write the current value of each path in a chat's data to the database.
+        :param chat_id: The ID of the chat.
+        :param chat_data: The dictionary of data for the chat.
+        :param paths: Tuples of keys into chat_data, e.g. ("plots", 3). A path that no longer exists is deleted.
+        With no paths, the whole chat is written.
+        """
+        if not self.store_chat_data:
+            return
+        self.chat_data[chat_id] = chat_data
+
+        if len(paths) == 0:
+            self.write_chat(chat_id, chat_data)
+            return
+
+        with self.__lock, self.__conn:
+            cur = self.__conn.cursor()
+            for path in paths:
+                if len(path) >= 2 and path[0] in _NORMALIZED_KEYS:
+                    self.__write_section(cur, chat_id, chat_data, path[0], path[1])
+                else:
+                    self.__write_section(cur, chat_id, chat_data, path[0])
+
+    def get_user_data(self):
+        if self.user_data is None:
+            self.user_data = defaultdict(dict, self.__misc("user_data"))
+        return self.user_data
+
+    def get_chat_data(self):
+        return self.chat_data
+
+    def get_bot_data(self):
+        if self.bot_data is None:
+            self.bot_data = self.__misc("bot_data").get(None, {})
+        return self.bot_data
+
+    def get_conversations(self, name):
+        if self.conversations is None:
+            self.conversations = self.__misc("conversations")
+        return self.conversations.get(name, {}).copy()
+
+    def update_conversation(self, name, key, new_state):
+        self.get_conversations(name)
+        if self.conversations.setdefault(name, {}).get(key) == new_state:
+            return
+        self.conversations[name][key] = new_state
+        self.__put_misc("conversations", name, self.conversations[name])
+
+    def update_user_data(self, user_id, data):
+        self.get_user_data()
+        if self.user_data.get(user_id) == data:
+            return
+        self.user_data[user_id] = data
+        self.__put_misc("user_data", user_id, data)
+
+    def update_chat_data(self, chat_id, data):
+        # Handlers record their own changes; see record().
+        self.chat_data[chat_id] = data
+
+    def update_bot_data(self, data):
+        self.get_bot_data()
+        if self.bot_data == data:
+            return
+        self.bot_data = data
+        self.__put_misc("bot_data", None, data)
+
+    def flush(self):
+        with self.__lock:
+            self.__conn.commit()
+
+
+def migrate_pickle_to_sqlite(pickle_filename, sqlite_filename):
+    """
+    Copy a PicklePersistence/JournalPersistence database, including any journal not yet compacted, into a SQLite
+    database. Plots pickled by older versions of the bot may be missing attributes; those are written with their
+    defaults and come back complete when loaded.
+    :param pickle_filename: The path to the pickle file, e.g. "plotyourselfbot".
+    :param sqlite_filename: The path to the SQLite file to write.
+    :return: The number of chats migrated.
+    """
+    data = load_snapshot(pickle_filename)
+    replay_journal(data, pickle_filename + ".journal.compacting")
+    replay_journal(data, pickle_filename + ".journal")
+
+    store = SQLitePersistence(sqlite_filename)
+    for chat_id, chat_data in data["chat_data"].items():
+        store.write_chat(chat_id, chat_data)
+
+    for user_id, user_data in data["user_data"].items():
+        store.update_user_data(user_id, user_data)
+    store.update_bot_data(data["bot_data"])
+    for name, conversation in data["conversations"].items():
+        for key, state in conversation.items():
+            store.update_conversation(name, key, state)
+    store.flush()
+    return len(data["chat_data"])
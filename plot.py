@@ -2,24 +2,245 @@
 #!/usr/bin/env python3
 from __future__ import unicode_literals
 
-import io
-
-from matplotlib import pyplot as plt
-from matplotlib import tri as tri
-from matplotlib.animation import FuncAnimation
-import matplotlib.patches as mpatches
-from colorhash import ColorHash
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
 import numpy as np
-import pandas as pd
-from sympy import S, symbols, printing
+
+from contour import contour_grid, density_field, distance_field
+from crowdsource import CrowdsourceConsent, CrowdsourceTally
+from equation import FULL_FORMAT, LEGEND_FORMAT, to_latex
+from fitting import FitCache
+from point_store import PointStore
+from render_cache import RENDER_CACHE, RenderCache, fingerprint
+from stats import describe, to_text
 
 # I think it might be more elegant to return non-null and return strings with error text if need be. Sometimes,
 # however, I'll be returning non-errors, so I might want to implement a tuple system: (err_code, data)
 # Let 0 be success and 1 be some error.
 
+# matplotlib and colorhash are imported where they're used rather than here. Together they take most
+# of a second to import, and the bot imports this module at startup to handle every command, not just the ones that
+# draw something. preload imports them ahead of time once the bot is up.
+
+
+def preload():
+    """
+    Import the libraries that drawing, stats and fits use, so the first command that needs one doesn't wait for it.
+    """
+    import matplotlib.figure
+    import matplotlib.backends.backend_agg
+    import matplotlib.patches
+    import matplotlib.tri
+    import colorhash
+
+
+def get_colors(labels):
+    """
+    :return: An RGB color for each label, from a hash of the label so a person has the same color on every plot.
+    """
+    from colorhash import ColorHash
+
+    return [tuple(c / 255 for c in ColorHash(label).rgb) for label in labels]
+
+
+# Figures are built directly on an Agg canvas rather than through pyplot, which keeps every figure in a global
+# registry until it's explicitly closed and isn't safe to share between threads.
+def new_figure(dpi=None):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def save_figure(fig):
+    """
+    Render a figure to PNG and release it.
+    :param fig: A figure from new_figure.
+    :return: A BytesIO with the PNG data, positioned at the start.
+    """
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    # Clearing drops the axes and artists now instead of waiting for the cycle collector to find them.
+    fig.clear()
+    return buffer
+
+
+def draw_points(ax, X, Y, err_X, err_Y, colors, labels, toggle_labels):
+    """
+    Draw the points of a plot, with error bars if given and labels if toggled on.
+    :return: The artists (and error bar containers) that were added to the axes.
+    """
+    artists = []
+    if err_X is not None and err_Y is not None:
+        artists.append(ax.errorbar(X, Y, xerr=err_X, yerr=err_Y, ecolor=colors, linestyle="None"))
+    artists.append(ax.scatter(X, Y, c=colors))
+    if toggle_labels:
+        for i in range(len(X)):
+            artists.append(ax.annotate(labels[i], (X[i], Y[i])))
+    return artists
+
+
+class BackgroundLayer:
+    # A fully drawn figure holding everything about a plot that doesn't depend on its points (axes, grid lines,
+    # titles, cell labels), plus a snapshot of its pixels. New images restore the snapshot and draw only the points.
+    def __init__(self, draw, projection=None, dpi=None):
+        self.__fig = new_figure(dpi=dpi)
+        self.__ax = self.__fig.add_subplot(111, projection=projection)
+        draw(self.__fig, self.__ax)
+        self.__fig.canvas.draw()
+        self.__region = self.__fig.canvas.copy_from_bbox(self.__fig.bbox)
+        self.__lock = threading.Lock()
+
+    def get_size(self):
+        return self.__fig.canvas.get_width_height()
+
+    def render(self, draw):
+        """
+        Render the background with extra artists on top.
+        :param draw: A function that adds artists to the given axes and returns them.
+        :return: The rendered RGBA pixels as a (height, width, 4) array.
+        """
+        from matplotlib.container import Container
+
+        with self.__lock:
+            canvas = self.__fig.canvas
+            canvas.restore_region(self.__region)
+            artists = draw(self.__ax)
+            try:
+                for artist in artists:
+                    for child in (artist.get_children() if isinstance(artist, Container) else [artist]):
+                        self.__ax.draw_artist(child)
+                return np.array(canvas.buffer_rgba())
+            finally:
+                for artist in artists:
+                    artist.remove()
+
+    def compose(self, draw):
+        """
+        Render an image of the background with extra artists on top.
+        :param draw: A function that adds artists to the given axes and returns them.
+        :return: A BytesIO with the PNG data, positioned at the start.
+        """
+        from matplotlib.image import imsave
+
+        buffer = BytesIO()
+        imsave(buffer, self.render(draw), format="png")
+        buffer.seek(0)
+        return buffer
+
+
+BACKGROUNDS = OrderedDict()
+BACKGROUNDS_LOCK = threading.Lock()
+MAX_BACKGROUNDS = 64
+
+
+def get_background(key, draw, projection=None, dpi=None):
+    """
+    Get the cached background layer for a key, drawing it if there isn't one.
+    :param key: A fingerprint of everything the background depends on (see background_key on the plot classes).
+    :param draw: A function that draws the background on a given figure and axes.
+    :param projection: The projection of the axes, e.g. "polar".
+    :param dpi: The resolution of the figure, else the matplotlib default.
+    :return: A BackgroundLayer.
+    """
+    with BACKGROUNDS_LOCK:
+        background = BACKGROUNDS.get(key)
+        if background is not None:
+            BACKGROUNDS.move_to_end(key)
+            return background
+
+    background = BackgroundLayer(draw, projection=projection, dpi=dpi)
+
+    with BACKGROUNDS_LOCK:
+        BACKGROUNDS[key] = background
+        while len(BACKGROUNDS) > MAX_BACKGROUNDS:
+            BACKGROUNDS.popitem(last=False)
+    return background
+
+
+# Attributes that only cache things worked out from the rest, so they're left out of the pickled state (and the
+# database) and start out empty when a plot is loaded.
+TRANSIENT_SLOTS = ("__fits", "__stats")
+
+
+def get_slot_state(obj):
+    """
+    The pickled state of a plot: a dictionary of its set attributes by their mangled names, the same as the
+    __dict__ of plots from before the classes used __slots__.
+    """
+    prefix = "_" + type(obj).__name__
+    return {prefix + name: getattr(obj, prefix + name) for name in type(obj).__slots__
+            if name not in TRANSIENT_SLOTS and hasattr(obj, prefix + name)}
+
+
+def set_slot_state(obj, state):
+    """
+    Restore a plot from get_slot_state, an old pickled __dict__, or a default (None, slots) slot state. Attributes
+    the class no longer has are dropped.
+    """
+    if isinstance(state, tuple):
+        state = dict(state[0] or {}, **(state[1] or {}))
+    prefix = "_" + type(obj).__name__
+    names = set(prefix + name for name in type(obj).__slots__)
+    for name, value in state.items():
+        if name in names:
+            setattr(obj, name, value)
+
+
+# Radar animations are one frame per person. Frames are kept as raw RGBA so a frame is only redrawn when that
+# person's values change, and the palette conversion for the GIF runs on several threads.
+ANIMATION_DPI = 90
+FRAMES = RenderCache(max_entries=1024, max_bytes=128 * 1024 * 1024)
+FRAME_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+
+
+def render_frame(key, background, draw):
+    """
+    Get the pixels of an animation frame, rendering it over the background if it isn't cached.
+    :param key: A fingerprint of the background and everything drawn on the frame.
+    :param background: The BackgroundLayer to draw on.
+    :param draw: A function that adds the frame's artists to the given axes and returns them.
+    :return: The RGBA bytes of the frame.
+    """
+    raster = FRAMES.get(key)
+    if raster is None:
+        raster = background.render(draw).tobytes()
+        FRAMES.put(key, raster)
+    return raster
+
+
+def encode_gif(frames, size, duration):
+    """
+    Encode frames into a looping GIF in memory.
+    :param frames: A list of RGBA bytes, one per frame.
+    :param size: The (width, height) of the frames.
+    :param duration: How long each frame is shown, in milliseconds.
+    :return: The GIF data.
+    """
+    from PIL import Image
+
+    def to_palette(raster):
+        return Image.frombuffer("RGBA", size, raster, "raw", "RGBA", 0, 1).convert("RGB").quantize(
+            method=Image.FASTOCTREE)
+
+    images = list(FRAME_POOL.map(to_palette, frames))
+    buffer = BytesIO()
+    images[0].save(buffer, format="GIF", save_all=True, append_images=images[1:], duration=duration, loop=0)
+    return buffer.getvalue()
+
+
 class Plot:
+    __slots__ = ("__name", "__xaxisleft", "__xaxisright", "__yaxisbottom", "__yaxistop", "__minx", "__maxx", "__miny",
+                 "__maxy", "__points", "__fits", "__stats", "__crowdsourced_points", "__crowdsourceable",
+                 "__createdby", "__custompoints", "__id", "__last_modified")
+
     def __init__(self, name, xaxisleft, xaxisright, yaxisbottom, yaxistop, minx, maxx, miny, maxy, createdby, id, custompoints=False):
         self.__name = name
         self.__xaxisleft = xaxisleft
@@ -30,14 +251,35 @@ class Plot:
         self.__maxx = maxx
         self.__miny = miny
         self.__maxy = maxy
-        self.__points = []
-        self.__crowdsourced_points = {}
-        self.__crowdsourceable = []
+        self.__points = PointStore()
+        self.__fits = FitCache()
+        self.__stats = None
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
         self.__createdby = createdby
         self.__custompoints = custompoints
         self.__id = id
         self.__last_modified = None
 
+    def __getstate__(self):
+        return get_slot_state(self)
+
+    def __setstate__(self, state):
+        # Plots from before crowdsourcing was added don't have the crowdsource attributes at all.
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
+        self.__fits = FitCache()
+        self.__stats = None
+        set_slot_state(self, state)
+        # Plots saved before points were kept in a PointStore have a plain list of tuples, and plots saved before
+        # the crowdsource was tallied have a plain dict and list.
+        if not isinstance(self.__points, PointStore):
+            self.__points = PointStore(self.__points)
+        if not isinstance(self.__crowdsourced_points, CrowdsourceTally):
+            self.__crowdsourced_points = CrowdsourceTally(self.__crowdsourced_points)
+        if not isinstance(self.__crowdsourceable, CrowdsourceConsent):
+            self.__crowdsourceable = CrowdsourceConsent(self.__crowdsourceable)
+
     def __check_bounds(self, x, y):
         if (self.__minx is not None and x < self.__minx) or (self.__maxx is not None and x > self.__maxx) or \
                 (self.__miny is not None and y < self.__miny) or (self.__maxy is not None and y > self.__maxy):
@@ -52,174 +294,192 @@ class Plot:
                    "y : [" + str(self.__miny if self.__miny is not None else "_") + ", " + \
                    str(self.__maxy if self.__maxy is not None else "_") + "]"
 
-        for i in range(len(self.__points)):
-            if self.__points[i][0] == label:
-                self.__points[i] = (label, x, y, err_x, err_y)
-                return 0, ""
-
-        self.__points.append((label if label is not None else "", x, y, err_x, err_y))
+        point = (label if label is not None else "", x, y, err_x, err_y)
+        self.__fits.put(self.__points.get(point[0]), point)
+        self.__points.put(point)
 
         return 0, ""
 
     def remove_point(self, label):
-        if label not in [t[0] for t in self.__points]:
+        point = self.__points.get(label)
+        if point is None:
             return 1, "Error: You haven't plotted yourself in this plot."
-        self.__points.remove(next(p for p in self.__points if p[0] == label))
-        if self.__crowdsourced_points.get(label) is not None:
-            del self.__crowdsourced_points[label]
+        self.__points.remove(label)
+        self.__fits.remove(point)
+        self.__crowdsourced_points.discard(label)
 
         return 0, ""
 
-    def generate_plot(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False):
-        updated_points = self.update_points_with_crowdsource()
+    def background_key(self, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None):
+        return fingerprint("Plot", self.__id, self.__name, self.__xaxisleft, self.__xaxisright, self.__yaxisbottom,
+                           self.__yaxistop, self.__minx, self.__maxx, self.__miny, self.__maxy,
+                           (zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max))
 
-        X = [p[1] for p in updated_points]
-        Y = [p[2] for p in updated_points]
-        err_X = [p[3] for p in updated_points]
-        err_Y = [p[4] for p in updated_points]
-        labels = [p[0] for p in updated_points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in labels]]
+    def render_key(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False, density=False):
+        crowdsourced_points = self.__crowdsourced_points.get_digest()
+        return fingerprint(self.background_key(zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max),
+                           self.__points.get_digest(), crowdsourced_points, toggle_labels, contour, density)
 
-        fig = plt.figure()
+    def __draw_background(self, fig, ax, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None):
         if self.__minx != self.__maxx and self.__miny != self.__maxy:
-            plt.grid(True)
-        if not contour:
-            plt.errorbar(X, Y, xerr=err_X, yerr=err_Y, ecolor=colors, linestyle="None")
-        else:
-            center_x = sum(X) / len(X)
-            center_y = sum(Y) / len(Y)
-            colors.append((0, 0, 0))
-            labels.append("")
-            X.append(center_x)
-            Y.append(center_y)
-            xi = np.linspace(self.__minx, self.__maxx, 10 * (abs(self.__maxx) + abs(self.__minx)))
-            yi = np.linspace(self.__miny, self.__maxy, 10 * (abs(self.__maxy) + abs(self.__miny)))
-            z = np.sqrt((np.array(X) - center_x) ** 2 + (np.array(Y) - center_y) ** 2)
-            triang = tri.Triangulation(np.array(X), np.array(Y))
-            interpolator = tri.LinearTriInterpolator(triang, z)
-            Xi, Yi = np.meshgrid(xi, yi)
-            zi = interpolator(Xi, Yi)
-
-            plt.contour(xi, yi, zi, levels=14, linewidths=0.5, colors='k')
-            cntr = plt.contourf(xi, yi, zi, levels=14, cmap="RdBu_r")
-            fig.colorbar(cntr)
-        plt.scatter(X, Y, c=colors)
+            ax.grid(True)
 
         if self.__minx != self.__maxx:
-            plt.axhline(y=0, color='k')
+            ax.axhline(y=0, color='k')
         if self.__miny != self.__maxy:
-            plt.axvline(x=0, color='k')
-
-        if toggle_labels:
-            for i in range(len(X)):
-                plt.annotate(labels[i], (X[i], Y[i]))
+            ax.axvline(x=0, color='k')
 
         if self.__xaxisleft is not None and self.__xaxisright is not None:
-            plt.xlabel("<-- " + str(self.__xaxisleft) + " || " + str(self.__xaxisright) + " -->", fontsize="medium")
+            ax.set_xlabel("<-- " + str(self.__xaxisleft) + " || " + str(self.__xaxisright) + " -->", fontsize="medium")
         elif self.__xaxisright is None and self.__xaxisleft is not None:
-            plt.xlabel(str(self.__xaxisleft), fontsize="medium")
+            ax.set_xlabel(str(self.__xaxisleft), fontsize="medium")
         elif self.__xaxisleft is None and self.__xaxisright is not None:
-            plt.xlabel(str(self.__xaxisright), fontsize="medium")
+            ax.set_xlabel(str(self.__xaxisright), fontsize="medium")
 
         if self.__yaxistop is not None and self.__yaxisbottom is not None:
-            plt.ylabel("<-- " + str(self.__yaxisbottom) + " || " + str(self.__yaxistop) + " -->", fontsize="medium")
+            ax.set_ylabel("<-- " + str(self.__yaxisbottom) + " || " + str(self.__yaxistop) + " -->", fontsize="medium")
         elif self.__yaxisbottom is None and self.__yaxistop is not None:
-            plt.ylabel(str(self.__yaxistop), fontsize="medium")
+            ax.set_ylabel(str(self.__yaxistop), fontsize="medium")
         elif self.__yaxistop is None and self.__yaxisbottom is not None:
-            plt.ylabel(str(self.__yaxisbottom), fontsize="medium")
+            ax.set_ylabel(str(self.__yaxisbottom), fontsize="medium")
 
         if self.__name is not None:
-            plt.title(str(self.__name), fontsize="large")
-        plt.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
+            ax.set_title(str(self.__name), fontsize="large")
+        fig.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
 
-        plt.xlim(left=self.__minx, right=self.__maxx)
-        plt.ylim(bottom=self.__miny, top=self.__maxy)
+        ax.set_xlim(left=self.__minx, right=self.__maxx)
+        ax.set_ylim(bottom=self.__miny, top=self.__maxy)
         if zoom_x_min is not None and zoom_y_min is not None and zoom_x_max is not None and zoom_y_max is not None:
-            plt.axis([zoom_x_min, zoom_x_max, zoom_y_min, zoom_y_max])
+            ax.axis([zoom_x_min, zoom_x_max, zoom_y_min, zoom_y_max])
 
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+    def generate_plot(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False, density=False):
+        key = self.render_key(toggle_labels, zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max, contour, density)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, BytesIO(cached)
+
+        labels, values = self.__get_columns()
+        X, Y, err_X, err_Y = values.T
+        colors = get_colors(labels)
+
+        if not contour:
+            # Usually only the points have changed, so they're drawn over a cached image of everything else.
+            background = get_background(self.background_key(zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max),
+                                        lambda fig, ax: self.__draw_background(fig, ax, zoom_x_min, zoom_y_min,
+                                                                               zoom_x_max, zoom_y_max))
+            buffer = background.compose(lambda ax: draw_points(ax, X, Y, err_X, err_Y, colors, labels, toggle_labels))
+        else:
+            xi, yi = contour_grid(self.__minx, self.__maxx, self.__miny, self.__maxy)
+            if density:
+                zi = density_field(X, Y, xi, yi)
+            elif len(X) > 0:
+                center_x = X.mean()
+                center_y = Y.mean()
+                colors.append((0, 0, 0))
+                labels.append("")
+                X = np.append(X, center_x)
+                Y = np.append(Y, center_y)
+                zi = distance_field(X, Y, center_x, center_y, xi, yi)
+            else:
+                zi = None
+
+            if zi is None:
+                return 1, "There aren't enough points spread out on that plot to draw contours!"
+
+            fig = new_figure()
+            ax = fig.add_subplot(111)
+            self.__draw_background(fig, ax, zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max)
+
+            ax.contour(xi, yi, zi, levels=14, linewidths=0.5, colors='k')
+            cntr = ax.contourf(xi, yi, zi, levels=14, cmap="RdBu_r")
+            fig.colorbar(cntr, ax=ax)
+
+            draw_points(ax, X, Y, None, None, colors, labels, toggle_labels)
+            buffer = save_figure(fig)
+
+        RENDER_CACHE.put(key, buffer.getvalue())
 
         # bot.send_photo(chat_id=chat_id, photo=buffer)
         # This returns the image itself that can then be sent.
         return 0, buffer
 
     def generate_stats(self):
-        points_dict = { "Names" : pd.Series(np.asarray([p[0] for p in self.__points], dtype=str)),
-                        "X" : pd.Series(np.asarray([p[1] for p in self.__points], dtype=float)),
-                        "Y" : pd.Series(np.asarray([p[2] for p in self.__points], dtype=float)) }
-        return 0, pd.DataFrame(points_dict).describe()
+        version = self.__points.get_version()
+        if self.__stats is None or self.__stats[0] != version:
+            values = self.__points.get_values()
+            self.__stats = (version, to_text(describe(values[:, 0], values[:, 1])))
+        return 0, self.__stats[1]
+
+    def fit_key(self, deg, toggle_labels=True):
+        return fingerprint(self.background_key(), self.__points.get_digest(), "polyfit", deg, toggle_labels)
+
+    def get_fit(self, deg):
+        """
+        :return: The coefficients (lowest degree first) and R^2 of the least squares fit of the given degree.
+        """
+        return self.__fits.get_fit(self.__points, deg)
 
     def polyfit(self, deg, toggle_labels=True):
-        X = [p[1] for p in self.__points]
-        Y = [p[2] for p in self.__points]
-        labels = [p[0] for p in self.__points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in labels]]
+        key = self.fit_key(deg, toggle_labels)
+        p, r2 = self.get_fit(deg)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, (BytesIO(cached), r2)
 
-        fig = plt.figure()
+        values = self.__points.get_values()
+        X = values[:, 0]
+        Y = values[:, 1]
+        labels = self.__points.get_labels()
+        colors = get_colors(labels)
+
+        fig = new_figure()
+        ax = fig.add_subplot(111)
 
         if toggle_labels:
             for i in range(len(X)):
-                plt.annotate(labels[i], (X[i], Y[i]))
+                ax.annotate(labels[i], (X[i], Y[i]))
 
         if self.__xaxisleft is not None and self.__xaxisright is not None:
-            plt.xlabel("<-- " + str(self.__xaxisleft) + " || " + str(self.__xaxisright) + " -->", fontsize="medium")
+            ax.set_xlabel("<-- " + str(self.__xaxisleft) + " || " + str(self.__xaxisright) + " -->", fontsize="medium")
         elif self.__xaxisright is None and self.__xaxisleft is not None:
-            plt.xlabel(str(self.__xaxisleft), fontsize="medium")
+            ax.set_xlabel(str(self.__xaxisleft), fontsize="medium")
         elif self.__xaxisleft is None and self.__xaxisright is not None:
-            plt.xlabel(str(self.__xaxisright), fontsize="medium")
+            ax.set_xlabel(str(self.__xaxisright), fontsize="medium")
 
         if self.__yaxistop is not None and self.__yaxisbottom is not None:
-            plt.ylabel("<-- " + str(self.__yaxisbottom) + " || " + str(self.__yaxistop) + " -->", fontsize="medium")
+            ax.set_ylabel("<-- " + str(self.__yaxisbottom) + " || " + str(self.__yaxistop) + " -->", fontsize="medium")
         elif self.__yaxisbottom is None and self.__yaxistop is not None:
-            plt.ylabel(str(self.__yaxistop), fontsize="medium")
+            ax.set_ylabel(str(self.__yaxistop), fontsize="medium")
         elif self.__yaxistop is None and self.__yaxisbottom is not None:
-            plt.ylabel(str(self.__yaxisbottom), fontsize="medium")
+            ax.set_ylabel(str(self.__yaxisbottom), fontsize="medium")
 
         if self.__name is not None:
-            plt.title(str(self.__name), fontsize="large")
-        plt.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
+            ax.set_title(str(self.__name), fontsize="large")
+        fig.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
 
-        p = np.polynomial.polynomial.polyfit(X, Y, deg)
         f = np.poly1d(p[::-1])
 
         x_new = np.linspace(min(X), max(X), 10 * len(X))
         y_new = f(x_new)
 
-        x = symbols('x')
-        poly = sum(S("{:6.3f}".format(v)) * x ** i for i, v in enumerate(p))
-        eq_latex = printing.latex(poly)
-
-        plt.grid(True)
-        plt.scatter(X, Y, c=colors)
-        plt.axhline(y=0, color='k')
-        plt.axvline(x=0, color='k')
-        plt.plot(x_new, y_new, label="${}$".format(eq_latex))
-        plt.legend(fontsize="small")
+        eq_latex = to_latex(p, LEGEND_FORMAT)
 
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+        ax.grid(True)
+        ax.scatter(X, Y, c=colors)
+        ax.axhline(y=0, color='k')
+        ax.axvline(x=0, color='k')
+        ax.plot(x_new, y_new, label="${}$".format(eq_latex))
+        ax.legend(fontsize="small")
 
-        yhat = f(X)
-        ybar = np.sum(Y) / len(Y)
-        ssres = np.sum((Y - yhat) ** 2)
-        sstot = np.sum((Y - ybar) ** 2)
+        buffer = save_figure(fig)
+        RENDER_CACHE.put(key, buffer.getvalue())
 
-        return 0, (buffer, 1 - ssres / sstot)
+        return 0, (buffer, r2)
 
     def full_equation(self, deg):
-        X = [p[1] for p in self.__points]
-        Y = [p[2] for p in self.__points]
-
-        p = np.polynomial.polynomial.polyfit(X, Y, deg)
+        p, _ = self.get_fit(deg)
 
-        x = symbols('x')
-        poly = sum(S("{:f}".format(v)) * x ** i for i, v in enumerate(p))
-        eq_latex = printing.latex(poly)
+        eq_latex = to_latex(p, FULL_FORMAT)
 
         #fig = plt.figure()
         #plt.grid(False)
@@ -234,9 +494,9 @@ class Plot:
         return 0, eq_latex
 
     def lookup_label(self, label):
-        for p in self.__points:
-            if p[0] == label:
-                return 0, (p[1], p[2])
+        p = self.__points.get(label)
+        if p is not None:
+            return 0, (p[1], p[2])
         return 1, "Name not found on that plot."
 
     def edit_plot(self, plot_args):
@@ -285,7 +545,7 @@ class Plot:
         return self.__custompoints
 
     def get_points(self):
-        return self.__points
+        return self.__points.to_list()
 
     def get_id(self):
         return self.__id
@@ -305,115 +565,63 @@ class Plot:
 
     def add_crowdsource_point(self, id, label, x, y):
         # ID is the person plotting, label is the name of the point.
-        try:
-            consent = False
-            for (id, consent_label) in self.__crowdsourceable:
-                if label == consent_label:
-                    consent = True
-            if not consent:
-                return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.allows(label):
             return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
 
         if not self.__check_bounds(x, y):
             return 1, "Error: The point cannot be out of bounds!"
 
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = (x, y)
-        except AttributeError:
-            self.__crowdsourced_points = {}
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = (x, y)
+        self.__crowdsourced_points.put(id, label, (x, y))
         return 0, "Your contribution has been added!"
 
     def add_crowdsource_consent(self, id, label):
-        try:
-            if (id, label) in self.__crowdsourceable:
-                return self.remove_crowdsource_consent(id, label)
-            self.__crowdsourceable.append((id, label))
-            return 0, "You have now consented to being crowdsourced for this plot."
-        except AttributeError:
-            self.__crowdsourceable = [(id, label)]
-            return 0, "You have now consented to being crowdsourced for this plot."
+        if (id, label) in self.__crowdsourceable:
+            return self.remove_crowdsource_consent(id, label)
+        self.__crowdsourceable.add(id, label)
+        return 0, "You have now consented to being crowdsourced for this plot."
+
+    def __get_columns(self):
+        # The labels and an (n, 4) array of x, y, err_x, err_y for rendering. With no crowdsourced points these
+        # come straight from the point store without copying the values.
+        if len(self.__crowdsourced_points) == 0:
+            return self.__points.get_labels(), self.__points.get_values()
+        return self.__crowdsourced_points.merge(self.__points, 4)
 
     def update_points_with_crowdsource(self):
-        updated_points = self.__points.copy()
-        try:
-            for label in self.__crowdsourced_points.keys():
-                point_index = -1
-                for i in range(len(self.__points)):
-                    if updated_points[i][0].replace(" ", "") == label:
-                        point_index = i
-                        break
-
-                if point_index != -1:
-                    x = self.__points[point_index][1]
-                    y = self.__points[point_index][2]
-                else:
-                    x = 0
-                    y = 0
-
-                l = len(self.__crowdsourced_points[label]) + 1
-                for (id, (x2, y2)) in self.__crowdsourced_points[label].items():
-                    x += x2
-                    y += y2
-
-                if point_index != -1:
-                    updated_points[point_index] = (label, x / l, y / l, updated_points[point_index][3], updated_points[point_index][4])
-                else:
-                    updated_points.append((label, x / (l - 1), y / (l - 1), 0, 0))
-            return updated_points
-        except AttributeError:
-            self.__crowdsourced_points = {}
-        return self.__points
+        labels, values = self.__get_columns()
+        return [(label,) + tuple(row) for label, row in zip(labels, values.tolist())]
 
     def remove_crowdsource_consent(self, id, label):
-        try:
-            self.__crowdsourceable.remove((id, label))
-            return 0, "You have removed your consent for that plot."
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.remove(id, label):
             return 1, "You cannot remove your consent when you haven't yet given it."
+        return 0, "You have removed your consent for that plot."
 
     def remove_crowdsource_point(self, id, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-                return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
-            if self.__crowdsourced_points[label].get(id) is None:
-                return 1, "You haven't made a crowdsource contribution for that label yet!"
-            del self.__crowdsourced_points[label][id]
-            return 0, "You have removed your crowdsource point for that plot."
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        if self.__crowdsourced_points.get(label) is None:
             return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
+        if not self.__crowdsourced_points.remove(id, label):
+            return 1, "You haven't made a crowdsource contribution for that label yet!"
+        return 0, "You have removed your crowdsource point for that plot."
 
     def get_crowdsourced_points(self, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                return 1, "No one has crowdsourced you on that plot!"
-            return 0, self.__crowdsourced_points.get(label).items()
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        contributions = self.__crowdsourced_points.get(label)
+        if contributions is None:
             return 1, "No one has crowdsourced you on that plot!"
+        return 0, list(contributions.items())
 
     def whos_crowdsourceable(self):
-        try:
-            text = "Crowdsourceable:\n\n"
-            for (id, label) in self.__crowdsourceable:
-                text += label + "\n"
-            return 0, text
-        except AttributeError:
-            self.__crowdsourceable = []
-            return 1, "No one has consented to being crowdsourced on that plot!"
+        text = "Crowdsourceable:\n\n"
+        for (id, label) in self.__crowdsourceable:
+            text += label + "\n"
+        return 0, text
 
 
 class BoxedPlot:
     # We'll define horiz = [h1, h2, h3], vertical = [v1, v2, v3]
+    __slots__ = ("__name", "__horiz", "__vert", "__minx", "__maxx", "__miny", "__maxy", "__points", "__fits",
+                 "__stats", "__crowdsourced_points", "__crowdsourceable", "__createdby", "__custompoints", "__id",
+                 "__last_modified")
+
     def __init__(self, name, horiz, vert, createdby, id, custompoints=False):
         self.__name = name
         self.__horiz = horiz
@@ -422,14 +630,35 @@ class BoxedPlot:
         self.__maxx = 10
         self.__miny = -10
         self.__maxy = 10
-        self.__points = []
-        self.__crowdsourced_points = {}
-        self.__crowdsourceable = []
+        self.__points = PointStore()
+        self.__fits = FitCache()
+        self.__stats = None
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
         self.__createdby = createdby
         self.__custompoints = custompoints
         self.__id = id
         self.__last_modified = None
 
+    def __getstate__(self):
+        return get_slot_state(self)
+
+    def __setstate__(self, state):
+        # Plots from before crowdsourcing was added don't have the crowdsource attributes at all.
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
+        self.__fits = FitCache()
+        self.__stats = None
+        set_slot_state(self, state)
+        # Plots saved before points were kept in a PointStore have a plain list of tuples, and plots saved before
+        # the crowdsource was tallied have a plain dict and list.
+        if not isinstance(self.__points, PointStore):
+            self.__points = PointStore(self.__points)
+        if not isinstance(self.__crowdsourced_points, CrowdsourceTally):
+            self.__crowdsourced_points = CrowdsourceTally(self.__crowdsourced_points)
+        if not isinstance(self.__crowdsourceable, CrowdsourceConsent):
+            self.__crowdsourceable = CrowdsourceConsent(self.__crowdsourceable)
+
     def __check_bounds(self, x, y):
         if (self.__minx is not None and x < self.__minx) or (self.__maxx is not None and x > self.__maxx) or \
                 (self.__miny is not None and y < self.__miny) or (self.__maxy is not None and y > self.__maxy):
@@ -444,71 +673,43 @@ class BoxedPlot:
                    "y : [" + str(self.__miny if self.__miny is not None else "_") + ", " + \
                    str(self.__maxy if self.__maxy is not None else "_") + "]"
 
-        for i in range(len(self.__points)):
-            if self.__points[i][0] == label:
-                self.__points[i] = (label, x, y, err_x, err_y)
-                return 0, ""
-
-        self.__points.append((label if label is not None else "", x, y, err_x, err_y))
+        point = (label if label is not None else "", x, y, err_x, err_y)
+        self.__fits.put(self.__points.get(point[0]), point)
+        self.__points.put(point)
 
         return 0, ""
 
     def remove_point(self, label):
-        if label not in [t[0] for t in self.__points]:
+        point = self.__points.get(label)
+        if point is None:
             return 1, "Error: You haven't plotted yourself in this plot."
-        self.__points.remove(next(p for p in self.__points if p[0] == label))
-        if self.__crowdsourced_points.get(label) is not None:
-            del self.__crowdsourced_points[label]
+        self.__points.remove(label)
+        self.__fits.remove(point)
+        self.__crowdsourced_points.discard(label)
 
         return 0, ""
 
-    def generate_plot(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False):
-        updated_points = self.update_points_with_crowdsource()
+    def background_key(self, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None):
+        return fingerprint("BoxedPlot", self.__id, self.__name, self.__horiz, self.__vert, self.__minx, self.__maxx,
+                           self.__miny, self.__maxy,
+                           (zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max))
 
-        X = [p[1] for p in updated_points]
-        Y = [p[2] for p in updated_points]
-        err_X = [p[3] for p in updated_points]
-        err_Y = [p[4] for p in updated_points]
-        labels = [p[0] for p in updated_points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in labels]]
+    def render_key(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False, density=False):
+        crowdsourced_points = self.__crowdsourced_points.get_digest()
+        return fingerprint(self.background_key(zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max),
+                           self.__points.get_digest(), crowdsourced_points, toggle_labels, contour, density)
 
-        fig = plt.figure()
-        plt.grid(False)
-        if not contour:
-            plt.errorbar(X, Y, xerr=err_X, yerr=err_Y, ecolor=colors, linestyle="None")
-        else:
-            center_x = sum(X) / len(X)
-            center_y = sum(Y) / len(Y)
-            colors.append((0, 0, 0))
-            labels.append("")
-            X.append(center_x)
-            Y.append(center_y)
-            xi = np.linspace(self.__minx, self.__maxx, 10 * (abs(self.__maxx) + abs(self.__minx)))
-            yi = np.linspace(self.__miny, self.__maxy, 10 * (abs(self.__maxy) + abs(self.__miny)))
-            z = np.sqrt((np.array(X) - center_x) ** 2 + (np.array(Y) - center_y) ** 2)
-            triang = tri.Triangulation(np.array(X), np.array(Y))
-            interpolator = tri.LinearTriInterpolator(triang, z)
-            Xi, Yi = np.meshgrid(xi, yi)
-            zi = interpolator(Xi, Yi)
-
-            plt.contour(xi, yi, zi, levels=14, linewidths=0.5, colors='k')
-            cntr = plt.contourf(xi, yi, zi, levels=14, cmap="RdBu_r")
-            fig.colorbar(cntr)
-
-        plt.scatter(X, Y, c=colors)
-        plt.axhline(y=self.__minx, color='k')
-        plt.axvline(x=self.__miny, color='k')
-        plt.axhline(y=self.__maxx, color='k')
-        plt.axvline(x=self.__maxy, color='k')
-        plt.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3, color='k')
-        plt.axvline(x=self.__miny + (self.__maxy - self.__miny) / 3, color='k')
-        plt.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3, color='k')
-        plt.axvline(x=self.__miny + 2 * (self.__maxy - self.__miny) / 3, color='k')
+    def __draw_background(self, fig, ax, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None):
+        ax.grid(False)
 
-        if toggle_labels:
-            for i in range(len(X)):
-                plt.annotate(labels[i], (X[i], Y[i]))
+        ax.axhline(y=self.__minx, color='k')
+        ax.axvline(x=self.__miny, color='k')
+        ax.axhline(y=self.__maxx, color='k')
+        ax.axvline(x=self.__maxy, color='k')
+        ax.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3, color='k')
+        ax.axvline(x=self.__miny + (self.__maxy - self.__miny) / 3, color='k')
+        ax.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3, color='k')
+        ax.axvline(x=self.__miny + 2 * (self.__maxy - self.__miny) / 3, color='k')
 
         x_axis_title = ""
         if self.__horiz is not None:
@@ -522,54 +723,114 @@ class BoxedPlot:
                 y_axis_title += v + " || "
         y_axis_title = y_axis_title[:-4]
 
-        plt.xlabel(x_axis_title, fontsize="medium")
-        plt.ylabel(y_axis_title, fontsize="medium")
+        ax.set_xlabel(x_axis_title, fontsize="medium")
+        ax.set_ylabel(y_axis_title, fontsize="medium")
 
-        plt.xlim(left=self.__minx, right=self.__maxx)
-        plt.ylim(bottom=self.__miny, top=self.__maxy)
+        ax.set_xlim(left=self.__minx, right=self.__maxx)
+        ax.set_ylim(bottom=self.__miny, top=self.__maxy)
         if zoom_x_min is not None and zoom_y_min is not None and zoom_x_max is not None and zoom_y_max is not None:
-            plt.axis([zoom_x_min, zoom_x_max, zoom_y_min, zoom_y_max])
+            ax.axis([zoom_x_min, zoom_x_max, zoom_y_min, zoom_y_max])
 
         if self.__name is not None:
-            plt.title(str(self.__name), fontsize="large")
-        plt.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
+            ax.set_title(str(self.__name), fontsize="large")
+        fig.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
 
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+    def generate_plot(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False, density=False):
+        key = self.render_key(toggle_labels, zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max, contour, density)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, BytesIO(cached)
+
+        labels, values = self.__get_columns()
+        X, Y, err_X, err_Y = values.T
+        colors = get_colors(labels)
+
+        if not contour:
+            # Usually only the points have changed, so they're drawn over a cached image of everything else.
+            background = get_background(self.background_key(zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max),
+                                        lambda fig, ax: self.__draw_background(fig, ax, zoom_x_min, zoom_y_min,
+                                                                               zoom_x_max, zoom_y_max))
+            buffer = background.compose(lambda ax: draw_points(ax, X, Y, err_X, err_Y, colors, labels, toggle_labels))
+        else:
+            xi, yi = contour_grid(self.__minx, self.__maxx, self.__miny, self.__maxy)
+            if density:
+                zi = density_field(X, Y, xi, yi)
+            elif len(X) > 0:
+                center_x = X.mean()
+                center_y = Y.mean()
+                colors.append((0, 0, 0))
+                labels.append("")
+                X = np.append(X, center_x)
+                Y = np.append(Y, center_y)
+                zi = distance_field(X, Y, center_x, center_y, xi, yi)
+            else:
+                zi = None
+
+            if zi is None:
+                return 1, "There aren't enough points spread out on that plot to draw contours!"
+
+            fig = new_figure()
+            ax = fig.add_subplot(111)
+            self.__draw_background(fig, ax, zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max)
+
+            ax.contour(xi, yi, zi, levels=14, linewidths=0.5, colors='k')
+            cntr = ax.contourf(xi, yi, zi, levels=14, cmap="RdBu_r")
+            fig.colorbar(cntr, ax=ax)
+
+            draw_points(ax, X, Y, None, None, colors, labels, toggle_labels)
+            buffer = save_figure(fig)
+
+        RENDER_CACHE.put(key, buffer.getvalue())
 
         # bot.send_photo(chat_id=chat_id, photo=buffer)
         # This returns the image itself that can then be sent.
         return 0, buffer
 
     def generate_stats(self):
-        points_dict = { "Names" : pd.Series(np.asarray([p[0] for p in self.__points], dtype=str)),
-                        "X" : pd.Series(np.asarray([p[1] for p in self.__points], dtype=float)),
-                        "Y" : pd.Series(np.asarray([p[2] for p in self.__points], dtype=float)) }
-        return 0, pd.DataFrame(points_dict).describe()
+        version = self.__points.get_version()
+        if self.__stats is None or self.__stats[0] != version:
+            values = self.__points.get_values()
+            self.__stats = (version, to_text(describe(values[:, 0], values[:, 1])))
+        return 0, self.__stats[1]
+
+    def fit_key(self, deg, toggle_labels=True):
+        return fingerprint(self.background_key(), self.__points.get_digest(), "polyfit", deg, toggle_labels)
+
+    def get_fit(self, deg):
+        """
+        :return: The coefficients (lowest degree first) and R^2 of the least squares fit of the given degree.
+        """
+        return self.__fits.get_fit(self.__points, deg)
 
     def polyfit(self, deg, toggle_labels=True):
-        X = [p[1] for p in self.__points]
-        Y = [p[2] for p in self.__points]
-        labels = [p[0] for p in self.__points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in labels]]
-
-        fig = plt.figure()
-        plt.grid(False)
-        plt.scatter(X, Y, c=colors)
-        plt.axhline(y=self.__minx, color='k')
-        plt.axvline(x=self.__miny, color='k')
-        plt.axhline(y=self.__maxx, color='k')
-        plt.axvline(x=self.__maxy, color='k')
-        plt.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3, color='k')
-        plt.axvline(x=self.__miny + (self.__maxy - self.__miny) / 3, color='k')
-        plt.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3, color='k')
-        plt.axvline(x=self.__miny + 2 * (self.__maxy - self.__miny) / 3, color='k')
+        key = self.fit_key(deg, toggle_labels)
+        p, r2 = self.get_fit(deg)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, (BytesIO(cached), r2)
+
+        values = self.__points.get_values()
+        X = values[:, 0]
+        Y = values[:, 1]
+        labels = self.__points.get_labels()
+        colors = get_colors(labels)
+
+        fig = new_figure()
+        ax = fig.add_subplot(111)
+        ax.grid(False)
+        ax.scatter(X, Y, c=colors)
+        ax.axhline(y=self.__minx, color='k')
+        ax.axvline(x=self.__miny, color='k')
+        ax.axhline(y=self.__maxx, color='k')
+        ax.axvline(x=self.__maxy, color='k')
+        ax.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3, color='k')
+        ax.axvline(x=self.__miny + (self.__maxy - self.__miny) / 3, color='k')
+        ax.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3, color='k')
+        ax.axvline(x=self.__miny + 2 * (self.__maxy - self.__miny) / 3, color='k')
 
         if toggle_labels:
             for i in range(len(X)):
-                plt.annotate(labels[i], (X[i], Y[i]))
+                ax.annotate(labels[i], (X[i], Y[i]))
 
         x_axis_title = ""
         if self.__horiz is not None:
@@ -583,49 +844,35 @@ class BoxedPlot:
                 y_axis_title += v + " || "
         y_axis_title = y_axis_title[:-4]
 
-        plt.xlabel(x_axis_title, fontsize="medium")
-        plt.ylabel(y_axis_title, fontsize="medium")
+        ax.set_xlabel(x_axis_title, fontsize="medium")
+        ax.set_ylabel(y_axis_title, fontsize="medium")
 
-        plt.xlim(left=self.__minx, right=self.__maxx)
-        plt.ylim(bottom=self.__miny, top=self.__maxy)
+        ax.set_xlim(left=self.__minx, right=self.__maxx)
+        ax.set_ylim(bottom=self.__miny, top=self.__maxy)
 
         if self.__name is not None:
-            plt.title(str(self.__name), fontsize="large")
-        plt.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
+            ax.set_title(str(self.__name), fontsize="large")
+        fig.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
 
-        p = np.polynomial.polynomial.polyfit(X, Y, deg)
         f = np.poly1d(p[::-1])
 
         x_new = np.linspace(min(X), max(X), 10 * len(X))
         y_new = f(x_new)
 
-        x = symbols("x")
-        poly = sum(S("{:6.3f}".format(v)) * x ** i for i, v in enumerate(p))
-        eq_latex = printing.latex(poly)
-
-        plt.plot(x_new, y_new, label="${}$".format(eq_latex))
-        plt.legend(fontsize="small")
+        eq_latex = to_latex(p, LEGEND_FORMAT)
 
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+        ax.plot(x_new, y_new, label="${}$".format(eq_latex))
+        ax.legend(fontsize="small")
 
-        yhat = f(X)
-        ybar = np.sum(Y) / len(Y)
-        ssres = np.sum((Y - yhat) ** 2)
-        sstot = np.sum((Y - ybar) ** 2)
+        buffer = save_figure(fig)
+        RENDER_CACHE.put(key, buffer.getvalue())
 
-        return 0, (buffer, 1 - ssres / sstot)
+        return 0, (buffer, r2)
 
     def full_equation(self, deg):
-        X = [p[1] for p in self.__points]
-        Y = [p[2] for p in self.__points]
-
-        p = np.polynomial.polynomial.polyfit(X, Y, deg)
+        p, _ = self.get_fit(deg)
 
-        x = symbols('x')
-        poly = sum(S("{:f}".format(v)) * x ** i for i, v in enumerate(p))
-        eq_latex = printing.latex(poly)
+        eq_latex = to_latex(p, FULL_FORMAT)
 
         #fig = plt.figure()
         #plt.grid(False)
@@ -640,9 +887,9 @@ class BoxedPlot:
         return 0, eq_latex
 
     def lookup_label(self, label):
-        for p in self.__points:
-            if p[0] == label:
-                return 0, (p[1], p[2])
+        p = self.__points.get(label)
+        if p is not None:
+            return 0, (p[1], p[2])
         return 1, "Name not found on that plot."
 
     def edit_plot(self, plot_args):
@@ -687,7 +934,7 @@ class BoxedPlot:
         return self.__custompoints
 
     def get_points(self):
-        return self.__points
+        return self.__points.to_list()
 
     def get_id(self):
         return self.__id
@@ -707,114 +954,63 @@ class BoxedPlot:
 
     def add_crowdsource_point(self, id, label, x, y):
         # ID is the person plotting, label is the name of the point.
-        try:
-            consent = False
-            for (id, consent_label) in self.__crowdsourceable:
-                if label == consent_label:
-                    consent = True
-            if not consent:
-                return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.allows(label):
             return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
 
         if not self.__check_bounds(x, y):
             return 1, "Error: The point cannot be out of bounds!"
 
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = (x, y)
-        except AttributeError:
-            self.__crowdsourced_points = {}
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = (x, y)
+        self.__crowdsourced_points.put(id, label, (x, y))
+        return 0, "Your contribution has been added!"
 
     def add_crowdsource_consent(self, id, label):
-        try:
-            if (id, label) in self.__crowdsourceable:
-                return self.remove_crowdsource_consent(id, label)
-            self.__crowdsourceable.append((id, label))
-            return 0, "You have now consented to being crowdsourced for this plot."
-        except AttributeError:
-            self.__crowdsourceable = [(id, label)]
-            return 0, "You have now consented to being crowdsourced for this plot."
+        if (id, label) in self.__crowdsourceable:
+            return self.remove_crowdsource_consent(id, label)
+        self.__crowdsourceable.add(id, label)
+        return 0, "You have now consented to being crowdsourced for this plot."
+
+    def __get_columns(self):
+        # The labels and an (n, 4) array of x, y, err_x, err_y for rendering. With no crowdsourced points these
+        # come straight from the point store without copying the values.
+        if len(self.__crowdsourced_points) == 0:
+            return self.__points.get_labels(), self.__points.get_values()
+        return self.__crowdsourced_points.merge(self.__points, 4)
 
     def update_points_with_crowdsource(self):
-        updated_points = self.__points.copy()
-        try:
-            for label in self.__crowdsourced_points.keys():
-                point_index = -1
-                for i in range(len(self.__points)):
-                    if updated_points[i][0].replace(" ", "") == label:
-                        point_index = i
-                        break
-
-                if point_index != -1:
-                    x = self.__points[point_index][1]
-                    y = self.__points[point_index][2]
-                else:
-                    x = 0
-                    y = 0
-
-                l = len(self.__crowdsourced_points[label]) + 1
-                for (id, (x2, y2)) in self.__crowdsourced_points[label].items():
-                    x += x2
-                    y += y2
-
-                if point_index != -1:
-                    updated_points[point_index] = (label, x / l, y / l, updated_points[point_index][3], updated_points[point_index][4])
-                else:
-                    updated_points.append((label, x / (l - 1), y / (l - 1), 0, 0))
-            return updated_points
-        except AttributeError:
-            self.__crowdsourced_points = {}
-        return self.__points
+        labels, values = self.__get_columns()
+        return [(label,) + tuple(row) for label, row in zip(labels, values.tolist())]
 
     def remove_crowdsource_consent(self, id, label):
-        try:
-            self.__crowdsourceable.remove((id, label))
-            return 0, "You have removed your consent for that plot."
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.remove(id, label):
             return 1, "You cannot remove your consent when you haven't yet given it."
+        return 0, "You have removed your consent for that plot."
 
     def remove_crowdsource_point(self, id, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-                return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
-            if self.__crowdsourced_points[label].get(id) is None:
-                return 1, "You haven't made a crowdsource contribution for that label yet!"
-            del self.__crowdsourced_points[label][id]
-            return 0, "You have removed your crowdsource point for that plot."
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        if self.__crowdsourced_points.get(label) is None:
             return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
+        if not self.__crowdsourced_points.remove(id, label):
+            return 1, "You haven't made a crowdsource contribution for that label yet!"
+        return 0, "You have removed your crowdsource point for that plot."
 
     def get_crowdsourced_points(self, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                return 1, "No one has crowdsourced you on that plot!"
-            return 0, self.__crowdsourced_points.get(label).items()
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        contributions = self.__crowdsourced_points.get(label)
+        if contributions is None:
             return 1, "No one has crowdsourced you on that plot!"
+        return 0, list(contributions.items())
 
     def whos_crowdsourceable(self):
-        try:
-            text = "Crowdsourceable:\n\n"
-            for (id, label) in self.__crowdsourceable:
-                text += label + "\n"
-            return 0, text
-        except AttributeError:
-            self.__crowdsourceable = []
-            return 1, "No one has consented to being crowdsourced on that plot!"
+        text = "Crowdsourceable:\n\n"
+        for (id, label) in self.__crowdsourceable:
+            text += label + "\n"
+        return 0, text
 
 
 class AlignmentChart:
     # We'll define labels = [row1col1, row1col2, row1col3, row2col1, ..., row3col3]
+    __slots__ = ("__name", "__labels", "__label_spacing", "__minx", "__maxx", "__miny", "__maxy", "__points",
+                 "__fits", "__stats", "__crowdsourced_points", "__crowdsourceable", "__createdby", "__custompoints",
+                 "__id", "__last_modified")
+
     def __init__(self, name, labels, createdby, id, custompoints=False):
         self.__name = name
         self.__labels = labels
@@ -823,14 +1019,35 @@ class AlignmentChart:
         self.__maxx = 10
         self.__miny = -10
         self.__maxy = 10
-        self.__points = []
-        self.__crowdsourced_points = {}
-        self.__crowdsourceable = []
+        self.__points = PointStore()
+        self.__fits = FitCache()
+        self.__stats = None
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
         self.__createdby = createdby
         self.__custompoints = custompoints
         self.__id = id
         self.__last_modified = None
 
+    def __getstate__(self):
+        return get_slot_state(self)
+
+    def __setstate__(self, state):
+        # Plots from before crowdsourcing was added don't have the crowdsource attributes at all.
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
+        self.__fits = FitCache()
+        self.__stats = None
+        set_slot_state(self, state)
+        # Plots saved before points were kept in a PointStore have a plain list of tuples, and plots saved before
+        # the crowdsource was tallied have a plain dict and list.
+        if not isinstance(self.__points, PointStore):
+            self.__points = PointStore(self.__points)
+        if not isinstance(self.__crowdsourced_points, CrowdsourceTally):
+            self.__crowdsourced_points = CrowdsourceTally(self.__crowdsourced_points)
+        if not isinstance(self.__crowdsourceable, CrowdsourceConsent):
+            self.__crowdsourceable = CrowdsourceConsent(self.__crowdsourceable)
+
     def __check_bounds(self, x, y):
         if (self.__minx is not None and x < self.__minx) or (self.__maxx is not None and x > self.__maxx) or \
                 (self.__miny is not None and y < self.__miny) or (self.__maxy is not None and y > self.__maxy):
@@ -845,191 +1062,208 @@ class AlignmentChart:
                    "y : [" + str(self.__miny if self.__miny is not None else "_") + ", " + \
                    str(self.__maxy if self.__maxy is not None else "_") + "]"
 
-        for i in range(len(self.__points)):
-            if self.__points[i][0] == label:
-                self.__points[i] = (label, x, y, err_x, err_y)
-                return 0, ""
-
-        self.__points.append((label if label is not None else "", x, y, err_x, err_y))
+        point = (label if label is not None else "", x, y, err_x, err_y)
+        self.__fits.put(self.__points.get(point[0]), point)
+        self.__points.put(point)
 
         return 0, ""
 
     def remove_point(self, label):
-        if label not in [t[0] for t in self.__points]:
+        point = self.__points.get(label)
+        if point is None:
             return 1, "Error: You haven't plotted yourself in this plot."
-        self.__points.remove(next(p for p in self.__points if p[0] == label))
-        if self.__crowdsourced_points.get(label) is not None:
-            del self.__crowdsourced_points[label]
+        self.__points.remove(label)
+        self.__fits.remove(point)
+        self.__crowdsourced_points.discard(label)
 
         return 0, ""
 
-    def generate_plot(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False):
-        updated_points = self.update_points_with_crowdsource()
+    def background_key(self, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None):
+        return fingerprint("AlignmentChart", self.__id, self.__name, self.__labels, self.__minx, self.__maxx, self.__miny,
+                           self.__maxy,
+                           (zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max))
+
+    def render_key(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False, density=False):
+        crowdsourced_points = self.__crowdsourced_points.get_digest()
+        return fingerprint(self.background_key(zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max),
+                           self.__points.get_digest(), crowdsourced_points, toggle_labels, contour, density)
+
+    def __draw_background(self, fig, ax, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None):
+        ax.grid(False)
+
+        ax.axhline(y=self.__minx, color='k')
+        ax.axvline(x=self.__miny, color='k')
+        ax.axhline(y=self.__maxx, color='k')
+        ax.axhline(y=self.__maxx - self.__label_spacing, color='k')
+        ax.axvline(x=self.__maxy, color='k')
+        ax.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3, color='k')
+        ax.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3 - self.__label_spacing, color='k')
+        ax.axvline(x=self.__miny + (self.__maxy - self.__miny) / 3, color='k')
+        ax.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3, color='k')
+        ax.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3 - self.__label_spacing, color='k')
+        ax.axvline(x=self.__miny + 2 * (self.__maxy - self.__miny) / 3, color='k')
+
+        ax.set_xlabel("Lawful || Neutral || Chaotic", fontsize="medium")
+        ax.set_ylabel("Evil || Neutral || Good", fontsize="medium")
+
+        ax.text(-9.8, 9.2, self.__labels[0], fontsize=10)
+        ax.text(-3.2, 9.2, self.__labels[1], fontsize=10)
+        ax.text(3.5, 9.2, self.__labels[2], fontsize=10)
+        ax.text(-9.8, 2.6, self.__labels[3], fontsize=10)
+        ax.text(-3.2, 2.6, self.__labels[4], fontsize=10)
+        ax.text(3.5, 2.6, self.__labels[5], fontsize=10)
+        ax.text(-9.8, -4.0, self.__labels[6], fontsize=10)
+        ax.text(-3.2, -4.0, self.__labels[7], fontsize=10)
+        ax.text(3.5, -4.0, self.__labels[8], fontsize=10)
+
+        ax.set_xlim(left=self.__minx, right=self.__maxx)
+        ax.set_ylim(bottom=self.__miny, top=self.__maxy)
+        if zoom_x_min is not None and zoom_y_min is not None and zoom_x_max is not None and zoom_y_max is not None:
+            ax.axis([zoom_x_min, zoom_x_max, zoom_y_min, zoom_y_max])
+
+        if self.__name is not None:
+            ax.set_title(str(self.__name), fontsize="large")
+        fig.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
 
-        X = [p[1] for p in updated_points]
-        Y = [p[2] for p in updated_points]
-        err_X = [p[3] for p in updated_points]
-        err_Y = [p[4] for p in updated_points]
-        labels = [p[0] for p in updated_points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in labels]]
+    def generate_plot(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False, density=False):
+        key = self.render_key(toggle_labels, zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max, contour, density)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, BytesIO(cached)
 
-        fig = plt.figure()
-        plt.grid(False)
+        labels, values = self.__get_columns()
+        X, Y, err_X, err_Y = values.T
+        colors = get_colors(labels)
 
         if not contour:
-            plt.errorbar(X, Y, xerr=err_X, yerr=err_Y, ecolor=colors, linestyle="None")
+            # Usually only the points have changed, so they're drawn over a cached image of everything else.
+            background = get_background(self.background_key(zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max),
+                                        lambda fig, ax: self.__draw_background(fig, ax, zoom_x_min, zoom_y_min,
+                                                                               zoom_x_max, zoom_y_max))
+            buffer = background.compose(lambda ax: draw_points(ax, X, Y, err_X, err_Y, colors, labels, toggle_labels))
         else:
-            center_x = sum(X) / len(X)
-            center_y = sum(Y) / len(Y)
-            colors.append((0, 0, 0))
-            labels.append("")
-            X.append(center_x)
-            Y.append(center_y)
-            xi = np.linspace(self.__minx, self.__maxx, 10 * (abs(self.__maxx) + abs(self.__minx)))
-            yi = np.linspace(self.__miny, self.__maxy, 10 * (abs(self.__maxy) + abs(self.__miny)))
-            z = np.sqrt((np.array(X) - center_x) ** 2 + (np.array(Y) - center_y) ** 2)
-            triang = tri.Triangulation(np.array(X), np.array(Y))
-            interpolator = tri.LinearTriInterpolator(triang, z)
-            Xi, Yi = np.meshgrid(xi, yi)
-            zi = interpolator(Xi, Yi)
-
-            plt.contour(xi, yi, zi, levels=14, linewidths=0.5, colors='k')
-            cntr = plt.contourf(xi, yi, zi, levels=14, cmap="RdBu_r")
-            fig.colorbar(cntr)
-
-        plt.scatter(X, Y, c=colors)
-        plt.axhline(y=self.__minx, color='k')
-        plt.axvline(x=self.__miny, color='k')
-        plt.axhline(y=self.__maxx, color='k')
-        plt.axhline(y=self.__maxx - self.__label_spacing, color='k')
-        plt.axvline(x=self.__maxy, color='k')
-        plt.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3, color='k')
-        plt.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3 - self.__label_spacing, color='k')
-        plt.axvline(x=self.__miny + (self.__maxy - self.__miny) / 3, color='k')
-        plt.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3, color='k')
-        plt.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3 - self.__label_spacing, color='k')
-        plt.axvline(x=self.__miny + 2 * (self.__maxy - self.__miny) / 3, color='k')
-
-        if toggle_labels:
-            for i in range(len(X)):
-                plt.annotate(labels[i], (X[i], Y[i]))
-
-        plt.xlabel("Lawful || Neutral || Chaotic", fontsize="medium")
-        plt.ylabel("Evil || Neutral || Good", fontsize="medium")
-
-        plt.text(-9.8, 9.2, self.__labels[0], fontsize=10)
-        plt.text(-3.2, 9.2, self.__labels[1], fontsize=10)
-        plt.text(3.5, 9.2, self.__labels[2], fontsize=10)
-        plt.text(-9.8, 2.6, self.__labels[3], fontsize=10)
-        plt.text(-3.2, 2.6, self.__labels[4], fontsize=10)
-        plt.text(3.5, 2.6, self.__labels[5], fontsize=10)
-        plt.text(-9.8, -4.0, self.__labels[6], fontsize=10)
-        plt.text(-3.2, -4.0, self.__labels[7], fontsize=10)
-        plt.text(3.5, -4.0, self.__labels[8], fontsize=10)
-
-        plt.xlim(left=self.__minx, right=self.__maxx)
-        plt.ylim(bottom=self.__miny, top=self.__maxy)
-        if zoom_x_min is not None and zoom_y_min is not None and zoom_x_max is not None and zoom_y_max is not None:
-            plt.axis([zoom_x_min, zoom_x_max, zoom_y_min, zoom_y_max])
-
-        if self.__name is not None:
-            plt.title(str(self.__name), fontsize="large")
-        plt.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
-
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+            xi, yi = contour_grid(self.__minx, self.__maxx, self.__miny, self.__maxy)
+            if density:
+                zi = density_field(X, Y, xi, yi)
+            elif len(X) > 0:
+                center_x = X.mean()
+                center_y = Y.mean()
+                colors.append((0, 0, 0))
+                labels.append("")
+                X = np.append(X, center_x)
+                Y = np.append(Y, center_y)
+                zi = distance_field(X, Y, center_x, center_y, xi, yi)
+            else:
+                zi = None
+
+            if zi is None:
+                return 1, "There aren't enough points spread out on that plot to draw contours!"
+
+            fig = new_figure()
+            ax = fig.add_subplot(111)
+            self.__draw_background(fig, ax, zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max)
+
+            ax.contour(xi, yi, zi, levels=14, linewidths=0.5, colors='k')
+            cntr = ax.contourf(xi, yi, zi, levels=14, cmap="RdBu_r")
+            fig.colorbar(cntr, ax=ax)
+
+            draw_points(ax, X, Y, None, None, colors, labels, toggle_labels)
+            buffer = save_figure(fig)
+
+        RENDER_CACHE.put(key, buffer.getvalue())
 
         # bot.send_photo(chat_id=chat_id, photo=buffer)
         # This returns the image itself that can then be sent.
         return 0, buffer
 
     def generate_stats(self):
-        points_dict = { "Names" : pd.Series(np.asarray([p[0] for p in self.__points], dtype=str)),
-                        "X" : pd.Series(np.asarray([p[1] for p in self.__points], dtype=float)),
-                        "Y" : pd.Series(np.asarray([p[2] for p in self.__points], dtype=float)) }
-        return 0, pd.DataFrame(points_dict).describe()
+        version = self.__points.get_version()
+        if self.__stats is None or self.__stats[0] != version:
+            values = self.__points.get_values()
+            self.__stats = (version, to_text(describe(values[:, 0], values[:, 1])))
+        return 0, self.__stats[1]
+
+    def fit_key(self, deg, toggle_labels=True):
+        return fingerprint(self.background_key(), self.__points.get_digest(), "polyfit", deg, toggle_labels)
+
+    def get_fit(self, deg):
+        """
+        :return: The coefficients (lowest degree first) and R^2 of the least squares fit of the given degree.
+        """
+        return self.__fits.get_fit(self.__points, deg)
 
     def polyfit(self, deg, toggle_labels=True):
-        X = [p[1] for p in self.__points]
-        Y = [p[2] for p in self.__points]
-        labels = [p[0] for p in self.__points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in labels]]
-
-        fig = plt.figure()
-        plt.grid(False)
-        plt.scatter(X, Y, c=colors)
-        plt.axhline(y=self.__minx, color='k')
-        plt.axvline(x=self.__miny, color='k')
-        plt.axhline(y=self.__maxx, color='k')
-        plt.axhline(y=self.__maxx - self.__label_spacing, color='k')
-        plt.axvline(x=self.__maxy, color='k')
-        plt.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3, color='k')
-        plt.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3 - self.__label_spacing, color='k')
-        plt.axvline(x=self.__miny + (self.__maxy - self.__miny) / 3, color='k')
-        plt.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3, color='k')
-        plt.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3 - self.__label_spacing, color='k')
-        plt.axvline(x=self.__miny + 2 * (self.__maxy - self.__miny) / 3, color='k')
+        key = self.fit_key(deg, toggle_labels)
+        p, r2 = self.get_fit(deg)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, (BytesIO(cached), r2)
+
+        values = self.__points.get_values()
+        X = values[:, 0]
+        Y = values[:, 1]
+        labels = self.__points.get_labels()
+        colors = get_colors(labels)
+
+        fig = new_figure()
+        ax = fig.add_subplot(111)
+        ax.grid(False)
+        ax.scatter(X, Y, c=colors)
+        ax.axhline(y=self.__minx, color='k')
+        ax.axvline(x=self.__miny, color='k')
+        ax.axhline(y=self.__maxx, color='k')
+        ax.axhline(y=self.__maxx - self.__label_spacing, color='k')
+        ax.axvline(x=self.__maxy, color='k')
+        ax.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3, color='k')
+        ax.axhline(y=self.__minx + (self.__maxx - self.__minx) / 3 - self.__label_spacing, color='k')
+        ax.axvline(x=self.__miny + (self.__maxy - self.__miny) / 3, color='k')
+        ax.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3, color='k')
+        ax.axhline(y=self.__minx + 2 * (self.__maxx - self.__minx) / 3 - self.__label_spacing, color='k')
+        ax.axvline(x=self.__miny + 2 * (self.__maxy - self.__miny) / 3, color='k')
 
         if toggle_labels:
             for i in range(len(X)):
-                plt.annotate(labels[i], (X[i], Y[i]))
+                ax.annotate(labels[i], (X[i], Y[i]))
 
-        plt.xlabel("Lawful || Neutral || Chaotic", fontsize="medium")
-        plt.ylabel("Evil || Neutral || Good", fontsize="medium")
+        ax.set_xlabel("Lawful || Neutral || Chaotic", fontsize="medium")
+        ax.set_ylabel("Evil || Neutral || Good", fontsize="medium")
 
-        plt.text(-9.8, 9.2, self.__labels[0], fontsize=10)
-        plt.text(-3.2, 9.2, self.__labels[1], fontsize=10)
-        plt.text(3.5, 9.2, self.__labels[2], fontsize=10)
-        plt.text(-9.8, 2.6, self.__labels[3], fontsize=10)
-        plt.text(-3.2, 2.6, self.__labels[4], fontsize=10)
-        plt.text(3.5, 2.6, self.__labels[5], fontsize=10)
-        plt.text(-9.8, -4.0, self.__labels[6], fontsize=10)
-        plt.text(-3.2, -4.0, self.__labels[7], fontsize=10)
-        plt.text(3.5, -4.0, self.__labels[8], fontsize=10)
+        ax.text(-9.8, 9.2, self.__labels[0], fontsize=10)
+        ax.text(-3.2, 9.2, self.__labels[1], fontsize=10)
+        ax.text(3.5, 9.2, self.__labels[2], fontsize=10)
+        ax.text(-9.8, 2.6, self.__labels[3], fontsize=10)
+        ax.text(-3.2, 2.6, self.__labels[4], fontsize=10)
+        ax.text(3.5, 2.6, self.__labels[5], fontsize=10)
+        ax.text(-9.8, -4.0, self.__labels[6], fontsize=10)
+        ax.text(-3.2, -4.0, self.__labels[7], fontsize=10)
+        ax.text(3.5, -4.0, self.__labels[8], fontsize=10)
 
-        plt.xlim(left=self.__minx, right=self.__maxx)
-        plt.ylim(bottom=self.__miny, top=self.__maxy)
+        ax.set_xlim(left=self.__minx, right=self.__maxx)
+        ax.set_ylim(bottom=self.__miny, top=self.__maxy)
 
         if self.__name is not None:
-            plt.title(str(self.__name), fontsize="large")
-        plt.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
+            ax.set_title(str(self.__name), fontsize="large")
+        fig.suptitle("ID: (" + str(self.__id) + ")", fontsize=8)
 
-        p = np.polynomial.polynomial.polyfit(X, Y, deg)
         f = np.poly1d(p[::-1])
 
         x_new = np.linspace(min(X), max(X), 10 * len(X))
         y_new = f(x_new)
 
-        x = symbols("x")
-        poly = sum(S("{:6.3f}".format(v)) * x ** i for i, v in enumerate(p))
-        eq_latex = printing.latex(poly)
-
-        plt.plot(x_new, y_new, label="${}$".format(eq_latex))
-        plt.legend(fontsize="small")
+        eq_latex = to_latex(p, LEGEND_FORMAT)
 
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+        ax.plot(x_new, y_new, label="${}$".format(eq_latex))
+        ax.legend(fontsize="small")
 
-        yhat = f(X)
-        ybar = np.sum(Y) / len(Y)
-        ssres = np.sum((Y - yhat) ** 2)
-        sstot = np.sum((Y - ybar) ** 2)
+        buffer = save_figure(fig)
+        RENDER_CACHE.put(key, buffer.getvalue())
 
-        return 0, (buffer, 1 - ssres / sstot)
+        return 0, (buffer, r2)
 
     def full_equation(self, deg):
-        X = [p[1] for p in self.__points]
-        Y = [p[2] for p in self.__points]
-
-        p = np.polynomial.polynomial.polyfit(X, Y, deg)
+        p, _ = self.get_fit(deg)
 
-        x = symbols('x')
-        poly = sum(S("{:f}".format(v)) * x ** i for i, v in enumerate(p))
-        eq_latex = printing.latex(poly)
+        eq_latex = to_latex(p, FULL_FORMAT)
 
         #fig = plt.figure()
         #plt.grid(False)
@@ -1044,9 +1278,9 @@ class AlignmentChart:
         return 0, eq_latex
 
     def lookup_label(self, label):
-        for p in self.__points:
-            if p[0] == label:
-                return 0, (p[1], p[2])
+        p = self.__points.get(label)
+        if p is not None:
+            return 0, (p[1], p[2])
         return 1, "Name not found on that plot."
 
     def edit_plot(self, plot_args):
@@ -1089,7 +1323,7 @@ class AlignmentChart:
         return self.__custompoints
 
     def get_points(self):
-        return self.__points
+        return self.__points.to_list()
 
     def get_id(self):
         return self.__id
@@ -1109,114 +1343,62 @@ class AlignmentChart:
 
     def add_crowdsource_point(self, id, label, x, y):
         # ID is the person plotting, label is the name of the point.
-        try:
-            consent = False
-            for (id, consent_label) in self.__crowdsourceable:
-                if label == consent_label:
-                    consent = True
-            if not consent:
-                return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.allows(label):
             return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
 
         if not self.__check_bounds(x, y):
             return 1, "Error: The point cannot be out of bounds!"
 
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = (x, y)
-        except AttributeError:
-            self.__crowdsourced_points = {}
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = (x, y)
+        self.__crowdsourced_points.put(id, label, (x, y))
         return 0, "Your contribution has been added!"
 
     def add_crowdsource_consent(self, id, label):
-        try:
-            if (id, label) in self.__crowdsourceable:
-                return self.remove_crowdsource_consent(id, label)
-            self.__crowdsourceable.append((id, label))
-            return 0, "You have now consented to being crowdsourced for this plot."
-        except AttributeError:
-            self.__crowdsourceable = [(id, label)]
-            return 0, "You have now consented to being crowdsourced for this plot."
+        if (id, label) in self.__crowdsourceable:
+            return self.remove_crowdsource_consent(id, label)
+        self.__crowdsourceable.add(id, label)
+        return 0, "You have now consented to being crowdsourced for this plot."
+
+    def __get_columns(self):
+        # The labels and an (n, 4) array of x, y, err_x, err_y for rendering. With no crowdsourced points these
+        # come straight from the point store without copying the values.
+        if len(self.__crowdsourced_points) == 0:
+            return self.__points.get_labels(), self.__points.get_values()
+        return self.__crowdsourced_points.merge(self.__points, 4)
 
     def update_points_with_crowdsource(self):
-        updated_points = self.__points.copy()
-        try:
-            for label in self.__crowdsourced_points.keys():
-                point_index = -1
-                for i in range(len(self.__points)):
-                    if updated_points[i][0].replace(" ", "") == label:
-                        point_index = i
-                        break
-
-                if point_index != -1:
-                    x = self.__points[point_index][1]
-                    y = self.__points[point_index][2]
-                else:
-                    x = 0
-                    y = 0
-
-                l = len(self.__crowdsourced_points[label]) + 1
-                for (id, (x2, y2)) in self.__crowdsourced_points[label].items():
-                    x += x2
-                    y += y2
-
-                if point_index != -1:
-                    updated_points[point_index] = (label, x / l, y / l, updated_points[point_index][3], updated_points[point_index][4])
-                else:
-                    updated_points.append((label, x / (l - 1), y / (l - 1), 0, 0))
-            return updated_points
-        except AttributeError:
-            self.__crowdsourced_points = {}
-        return self.__points
+        labels, values = self.__get_columns()
+        return [(label,) + tuple(row) for label, row in zip(labels, values.tolist())]
 
     def remove_crowdsource_consent(self, id, label):
-        try:
-            self.__crowdsourceable.remove((id, label))
-            return 0, "You have removed your consent for that plot."
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.remove(id, label):
             return 1, "You cannot remove your consent when you haven't yet given it."
+        return 0, "You have removed your consent for that plot."
 
     def remove_crowdsource_point(self, id, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-                return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
-            if self.__crowdsourced_points[label].get(id) is None:
-                return 1, "You haven't made a crowdsource contribution for that label yet!"
-            del self.__crowdsourced_points[label][id]
-            return 0, "You have removed your crowdsource point for that plot."
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        if self.__crowdsourced_points.get(label) is None:
             return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
+        if not self.__crowdsourced_points.remove(id, label):
+            return 1, "You haven't made a crowdsource contribution for that label yet!"
+        return 0, "You have removed your crowdsource point for that plot."
 
     def get_crowdsourced_points(self, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                return 1, "No one has crowdsourced you on that plot!"
-            return 0, self.__crowdsourced_points.get(label).items()
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        contributions = self.__crowdsourced_points.get(label)
+        if contributions is None:
             return 1, "No one has crowdsourced you on that plot!"
+        return 0, list(contributions.items())
 
     def whos_crowdsourceable(self):
-        try:
-            text = "Crowdsourceable:\n\n"
-            for (id, label) in self.__crowdsourceable:
-                text += label + "\n"
-            return 0, text
-        except AttributeError:
-            self.__crowdsourceable = []
-            return 1, "No one has consented to being crowdsourced on that plot!"
+        text = "Crowdsourceable:\n\n"
+        for (id, label) in self.__crowdsourceable:
+            text += label + "\n"
+        return 0, text
 
 
 class TrianglePlot:
+    __slots__ = ("__name", "__xaxisleft", "__xaxisright", "__yaxistop", "__minx", "__maxx", "__miny", "__maxy",
+                 "__points", "__fits", "__stats", "__crowdsourced_points", "__crowdsourceable", "__createdby",
+                 "__custompoints", "__id", "__last_modified")
+
     def __init__(self, name, xaxisleft, xaxisright, yaxistop, createdby, id, custompoints=False):
         self.__name = name
         self.__xaxisleft = xaxisleft
@@ -1226,14 +1408,35 @@ class TrianglePlot:
         self.__maxx = 10
         self.__miny = 0
         self.__maxy = 10
-        self.__points = []
-        self.__crowdsourced_points = {}
-        self.__crowdsourceable = []
+        self.__points = PointStore()
+        self.__fits = FitCache()
+        self.__stats = None
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
         self.__createdby = createdby
         self.__custompoints = custompoints
         self.__id = id
         self.__last_modified = None
 
+    def __getstate__(self):
+        return get_slot_state(self)
+
+    def __setstate__(self, state):
+        # Plots from before crowdsourcing was added don't have the crowdsource attributes at all.
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
+        self.__fits = FitCache()
+        self.__stats = None
+        set_slot_state(self, state)
+        # Plots saved before points were kept in a PointStore have a plain list of tuples, and plots saved before
+        # the crowdsource was tallied have a plain dict and list.
+        if not isinstance(self.__points, PointStore):
+            self.__points = PointStore(self.__points)
+        if not isinstance(self.__crowdsourced_points, CrowdsourceTally):
+            self.__crowdsourced_points = CrowdsourceTally(self.__crowdsourced_points)
+        if not isinstance(self.__crowdsourceable, CrowdsourceConsent):
+            self.__crowdsourceable = CrowdsourceConsent(self.__crowdsourceable)
+
     def __check_sign(self, x1, y1, x2, y2, x3, y3):
         return (x1 - x3) * (y2 - y3) - (x2 - x3) * (y1 - y3)
 
@@ -1253,168 +1456,188 @@ class TrianglePlot:
                 not self.__check_bounds(x, y - err_y) or not self.__check_bounds(x - err_x, y):
             return 1, "Error: Plot point and error cannot be out of triangle bounds!"
 
-        for i in range(len(self.__points)):
-            if self.__points[i][0] == label:
-                self.__points[i] = (label, x, y, err_x, err_y)
-                return 0, ""
-
-        self.__points.append((label if label is not None else "", x, y, err_x, err_y))
+        point = (label if label is not None else "", x, y, err_x, err_y)
+        self.__fits.put(self.__points.get(point[0]), point)
+        self.__points.put(point)
 
         return 0, ""
 
     def remove_point(self, label):
-        if label not in [t[0] for t in self.__points]:
+        point = self.__points.get(label)
+        if point is None:
             return 1, "Error: You haven't plotted yourself in this plot."
-        self.__points.remove(next(p for p in self.__points if p[0] == label))
-        if self.__crowdsourced_points.get(label) is not None:
-            del self.__crowdsourced_points[label]
+        self.__points.remove(label)
+        self.__fits.remove(point)
+        self.__crowdsourced_points.discard(label)
 
         return 0, ""
 
-    def generate_plot(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False):
-        updated_points = self.update_points_with_crowdsource()
+    def background_key(self, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None):
+        return fingerprint("TrianglePlot", self.__id, self.__name, self.__xaxisleft, self.__xaxisright, self.__yaxistop,
+                           self.__minx, self.__maxx, self.__miny, self.__maxy,
+                           (zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max))
 
-        X = [p[1] for p in updated_points]
-        Y = [p[2] for p in updated_points]
-        err_X = [p[3] for p in updated_points]
-        err_Y = [p[4] for p in updated_points]
-        labels = [p[0] for p in updated_points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in labels]]
+    def render_key(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False, density=False):
+        crowdsourced_points = self.__crowdsourced_points.get_digest()
+        return fingerprint(self.background_key(zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max),
+                           self.__points.get_digest(), crowdsourced_points, toggle_labels, contour, density)
 
-        fig = plt.figure()
-        plt.grid(False)
+    def __draw_background(self, fig, ax, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None):
+        import matplotlib.patches as mpatches
 
-        if not contour:
-            plt.errorbar(X, Y, xerr=err_X, yerr=err_Y, ecolor=colors, linestyle="None")
-        else:
-            center_x = sum(X) / len(X)
-            center_y = sum(Y) / len(Y)
-            colors.append((0, 0, 0))
-            labels.append("")
-            X.append(center_x)
-            Y.append(center_y)
-            xi = np.linspace(self.__minx, self.__maxx, 10 * (abs(self.__maxx) + abs(self.__minx)))
-            yi = np.linspace(self.__miny, self.__maxy, 10 * (abs(self.__maxy) + abs(self.__miny)))
-            z = np.sqrt((np.array(X) - center_x) ** 2 + (np.array(Y) - center_y) ** 2)
-            triang = tri.Triangulation(np.array(X), np.array(Y))
-            interpolator = tri.LinearTriInterpolator(triang, z)
-            Xi, Yi = np.meshgrid(xi, yi)
-            zi = interpolator(Xi, Yi)
-
-            plt.contour(xi, yi, zi, levels=14, linewidths=0.5, colors='k')
-            cntr = plt.contourf(xi, yi, zi, levels=14, cmap="RdBu_r")
-            fig.colorbar(cntr)
-
-        plt.scatter(X, Y, c=colors)
-
-        triangle = plt.Polygon([[self.__minx, self.__miny], [self.__maxx / 2, self.__maxy], [self.__maxx, self.__miny]], fill=False, color='k')
-        plt.gca().add_patch(triangle)
+        ax.grid(False)
 
-        if toggle_labels:
-            for i in range(len(X)):
-                plt.annotate(labels[i], (X[i], Y[i]))
+        triangle = mpatches.Polygon([[self.__minx, self.__miny], [self.__maxx / 2, self.__maxy], [self.__maxx, self.__miny]], fill=False, color='k')
+        ax.add_patch(triangle)
 
         if self.__xaxisleft is not None and self.__xaxisright is not None:
-            plt.xlabel("<-- " + str(self.__xaxisleft) + " || " + str(self.__xaxisright) + " -->", fontsize="medium")
+            ax.set_xlabel("<-- " + str(self.__xaxisleft) + " || " + str(self.__xaxisright) + " -->", fontsize="medium")
         elif self.__xaxisright is None and self.__xaxisleft is not None:
-            plt.xlabel(str(self.__xaxisleft), fontsize="medium")
+            ax.set_xlabel(str(self.__xaxisleft), fontsize="medium")
         elif self.__xaxisleft is None and self.__xaxisright is not None:
-            plt.xlabel(str(self.__xaxisright), fontsize="medium")
+            ax.set_xlabel(str(self.__xaxisright), fontsize="medium")
 
         if self.__yaxistop is not None:
-            plt.title(str(self.__yaxistop), fontsize="medium")
+            ax.set_title(str(self.__yaxistop), fontsize="medium")
 
         if self.__name is not None:
-            plt.ylabel(str("ID: (" + str(self.__id) + ")\n" + self.__name), fontsize="large")
+            ax.set_ylabel(str("ID: (" + str(self.__id) + ")\n" + self.__name), fontsize="large")
         else:
-            plt.ylabel("ID: (" + str(self.__id) + ")", fontsize="large")
+            ax.set_ylabel("ID: (" + str(self.__id) + ")", fontsize="large")
 
-        plt.xlim(left=self.__minx, right=self.__maxx)
-        plt.ylim(bottom=self.__miny, top=self.__maxy)
+        ax.set_xlim(left=self.__minx, right=self.__maxx)
+        ax.set_ylim(bottom=self.__miny, top=self.__maxy)
         if zoom_x_min is not None and zoom_y_min is not None and zoom_x_max is not None and zoom_y_max is not None:
-            plt.axis([zoom_x_min, zoom_x_max, zoom_y_min, zoom_y_max])
+            ax.axis([zoom_x_min, zoom_x_max, zoom_y_min, zoom_y_max])
 
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+    def generate_plot(self, toggle_labels=True, zoom_x_min=None, zoom_y_min=None, zoom_x_max=None, zoom_y_max=None, contour=False, density=False):
+        key = self.render_key(toggle_labels, zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max, contour, density)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, BytesIO(cached)
+
+        labels, values = self.__get_columns()
+        X, Y, err_X, err_Y = values.T
+        colors = get_colors(labels)
+
+        if not contour:
+            # Usually only the points have changed, so they're drawn over a cached image of everything else.
+            background = get_background(self.background_key(zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max),
+                                        lambda fig, ax: self.__draw_background(fig, ax, zoom_x_min, zoom_y_min,
+                                                                               zoom_x_max, zoom_y_max))
+            buffer = background.compose(lambda ax: draw_points(ax, X, Y, err_X, err_Y, colors, labels, toggle_labels))
+        else:
+            xi, yi = contour_grid(self.__minx, self.__maxx, self.__miny, self.__maxy)
+            if density:
+                zi = density_field(X, Y, xi, yi)
+            elif len(X) > 0:
+                center_x = X.mean()
+                center_y = Y.mean()
+                colors.append((0, 0, 0))
+                labels.append("")
+                X = np.append(X, center_x)
+                Y = np.append(Y, center_y)
+                zi = distance_field(X, Y, center_x, center_y, xi, yi)
+            else:
+                zi = None
+
+            if zi is None:
+                return 1, "There aren't enough points spread out on that plot to draw contours!"
+
+            fig = new_figure()
+            ax = fig.add_subplot(111)
+            self.__draw_background(fig, ax, zoom_x_min, zoom_y_min, zoom_x_max, zoom_y_max)
+
+            ax.contour(xi, yi, zi, levels=14, linewidths=0.5, colors='k')
+            cntr = ax.contourf(xi, yi, zi, levels=14, cmap="RdBu_r")
+            fig.colorbar(cntr, ax=ax)
+
+            draw_points(ax, X, Y, None, None, colors, labels, toggle_labels)
+            buffer = save_figure(fig)
+
+        RENDER_CACHE.put(key, buffer.getvalue())
 
         # bot.send_photo(chat_id=chat_id, photo=buffer)
         # This returns the image itself that can then be sent.
         return 0, buffer
 
     def generate_stats(self):
-        points_dict = { "Names" : pd.Series(np.asarray([p[0] for p in self.__points], dtype=str)),
-                        "X" : pd.Series(np.asarray([p[1] for p in self.__points], dtype=float)),
-                        "Y" : pd.Series(np.asarray([p[2] for p in self.__points], dtype=float)) }
-        return 0, pd.DataFrame(points_dict).describe()
+        version = self.__points.get_version()
+        if self.__stats is None or self.__stats[0] != version:
+            values = self.__points.get_values()
+            self.__stats = (version, to_text(describe(values[:, 0], values[:, 1])))
+        return 0, self.__stats[1]
+
+    def fit_key(self, deg, toggle_labels=True):
+        return fingerprint(self.background_key(), self.__points.get_digest(), "polyfit", deg, toggle_labels)
+
+    def get_fit(self, deg):
+        """
+        :return: The coefficients (lowest degree first) and R^2 of the least squares fit of the given degree.
+        """
+        return self.__fits.get_fit(self.__points, deg)
 
     def polyfit(self, deg, toggle_labels=True):
-        X = [p[1] for p in self.__points]
-        Y = [p[2] for p in self.__points]
-        labels = [p[0] for p in self.__points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in labels]]
+        key = self.fit_key(deg, toggle_labels)
+        p, r2 = self.get_fit(deg)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, (BytesIO(cached), r2)
+
+        values = self.__points.get_values()
+        X = values[:, 0]
+        Y = values[:, 1]
+        labels = self.__points.get_labels()
+        colors = get_colors(labels)
 
-        fig = plt.figure()
+        fig = new_figure()
+        ax = fig.add_subplot(111)
 
         if toggle_labels:
             for i in range(len(X)):
-                plt.annotate(labels[i], (X[i], Y[i]))
+                ax.annotate(labels[i], (X[i], Y[i]))
 
         if self.__xaxisleft is not None and self.__xaxisright is not None:
-            plt.xlabel("<-- " + str(self.__xaxisleft) + " || " + str(self.__xaxisright) + " -->", fontsize="medium")
+            ax.set_xlabel("<-- " + str(self.__xaxisleft) + " || " + str(self.__xaxisright) + " -->", fontsize="medium")
         elif self.__xaxisright is None and self.__xaxisleft is not None:
-            plt.xlabel(str(self.__xaxisleft), fontsize="medium")
+            ax.set_xlabel(str(self.__xaxisleft), fontsize="medium")
         elif self.__xaxisleft is None and self.__xaxisright is not None:
-            plt.xlabel(str(self.__xaxisright), fontsize="medium")
+            ax.set_xlabel(str(self.__xaxisright), fontsize="medium")
 
         if self.__yaxistop is not None:
-            plt.title(str(self.__yaxistop), fontsize="medium")
+            ax.set_title(str(self.__yaxistop), fontsize="medium")
 
         if self.__name is not None:
-            plt.ylabel("ID: (" + str(self.__id) + ")\n" + str(self.__name), fontsize="large")
+            ax.set_ylabel("ID: (" + str(self.__id) + ")\n" + str(self.__name), fontsize="large")
         else:
-            plt.ylabel("ID: (" + str(self.__id) + ")", fontsize="large")
+            ax.set_ylabel("ID: (" + str(self.__id) + ")", fontsize="large")
 
-        p = np.polynomial.polynomial.polyfit(X, Y, deg)
         f = np.poly1d(p[::-1])
 
         x_new = np.linspace(min(X), max(X), 10 * len(X))
         y_new = f(x_new)
 
-        x = symbols('x')
-        poly = sum(S("{:6.3f}".format(v)) * x ** i for i, v in enumerate(p))
-        eq_latex = printing.latex(poly)
+        eq_latex = to_latex(p, LEGEND_FORMAT)
 
-        plt.grid(False)
-        plt.scatter(X, Y, c=colors)
-        triangle = plt.Polygon([[self.__minx, self.__miny], [self.__maxx / 2, self.__maxy], [self.__maxx, self.__miny]], fill=False, color='k')
-        plt.gca().add_patch(triangle)
+        import matplotlib.patches as mpatches
 
-        plt.plot(x_new, y_new, label="${}$".format(eq_latex))
-        plt.legend(fontsize="small")
+        ax.grid(False)
+        ax.scatter(X, Y, c=colors)
+        triangle = mpatches.Polygon([[self.__minx, self.__miny], [self.__maxx / 2, self.__maxy], [self.__maxx, self.__miny]], fill=False, color='k')
+        ax.add_patch(triangle)
 
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+        ax.plot(x_new, y_new, label="${}$".format(eq_latex))
+        ax.legend(fontsize="small")
 
-        yhat = f(X)
-        ybar = np.sum(Y) / len(Y)
-        ssres = np.sum((Y - yhat) ** 2)
-        sstot = np.sum((Y - ybar) ** 2)
+        buffer = save_figure(fig)
+        RENDER_CACHE.put(key, buffer.getvalue())
 
-        return 0, (buffer, 1 - ssres / sstot)
+        return 0, (buffer, r2)
 
     def full_equation(self, deg):
-        X = [p[1] for p in self.__points]
-        Y = [p[2] for p in self.__points]
-
-        p = np.polynomial.polynomial.polyfit(X, Y, deg)
+        p, _ = self.get_fit(deg)
 
-        x = symbols('x')
-        poly = sum(S("{:f}".format(v)) * x ** i for i, v in enumerate(p))
-        eq_latex = printing.latex(poly)
+        eq_latex = to_latex(p, FULL_FORMAT)
 
         #fig = plt.figure()
         #plt.grid(False)
@@ -1429,9 +1652,9 @@ class TrianglePlot:
         return 0, eq_latex
 
     def lookup_label(self, label):
-        for p in self.__points:
-            if p[0] == label:
-                return 0, (p[1], p[2])
+        p = self.__points.get(label)
+        if p is not None:
+            return 0, (p[1], p[2])
         return 1, "Name not found on that plot."
 
     def edit_plot(self, plot_args):
@@ -1472,7 +1695,7 @@ class TrianglePlot:
         return self.__custompoints
 
     def get_points(self):
-        return self.__points
+        return self.__points.to_list()
 
     def get_id(self):
         return self.__id
@@ -1492,124 +1715,88 @@ class TrianglePlot:
 
     def add_crowdsource_point(self, id, label, x, y):
         # ID is the person plotting, label is the name of the point.
-        try:
-            consent = False
-            for (id, consent_label) in self.__crowdsourceable:
-                if label == consent_label:
-                    consent = True
-            if not consent:
-                return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.allows(label):
             return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
 
         if not self.__check_bounds(x, y):
             return 1, "Error: The point cannot be out of bounds!"
 
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = (x, y)
-        except AttributeError:
-            self.__crowdsourced_points = {}
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = (x, y)
+        self.__crowdsourced_points.put(id, label, (x, y))
         return 0, "Your contribution has been added!"
 
     def add_crowdsource_consent(self, id, label):
-        try:
-            if (id, label) in self.__crowdsourceable:
-                return self.remove_crowdsource_consent(id, label)
-            self.__crowdsourceable.append((id, label))
-            return 0, "You have now consented to being crowdsourced for this plot."
-        except AttributeError:
-            self.__crowdsourceable = [(id, label)]
-            return 0, "You have now consented to being crowdsourced for this plot."
+        if (id, label) in self.__crowdsourceable:
+            return self.remove_crowdsource_consent(id, label)
+        self.__crowdsourceable.add(id, label)
+        return 0, "You have now consented to being crowdsourced for this plot."
+
+    def __get_columns(self):
+        # The labels and an (n, 4) array of x, y, err_x, err_y for rendering. With no crowdsourced points these
+        # come straight from the point store without copying the values.
+        if len(self.__crowdsourced_points) == 0:
+            return self.__points.get_labels(), self.__points.get_values()
+        return self.__crowdsourced_points.merge(self.__points, 4)
 
     def update_points_with_crowdsource(self):
-        updated_points = self.__points.copy()
-        try:
-            for label in self.__crowdsourced_points.keys():
-                point_index = -1
-                for i in range(len(self.__points)):
-                    if updated_points[i][0].replace(" ", "") == label:
-                        point_index = i
-                        break
-
-                if point_index != -1:
-                    x = self.__points[point_index][1]
-                    y = self.__points[point_index][2]
-                else:
-                    x = 0
-                    y = 0
-
-                l = len(self.__crowdsourced_points[label]) + 1
-                for (id, (x2, y2)) in self.__crowdsourced_points[label].items():
-                    x += x2
-                    y += y2
-
-                if point_index != -1:
-                    updated_points[point_index] = (label, x / l, y / l, updated_points[point_index][3], updated_points[point_index][4])
-                else:
-                    updated_points.append((label, x / (l - 1), y / (l - 1), 0, 0))
-            return updated_points
-        except AttributeError:
-            self.__crowdsourced_points = {}
-        return self.__points
+        labels, values = self.__get_columns()
+        return [(label,) + tuple(row) for label, row in zip(labels, values.tolist())]
 
     def remove_crowdsource_consent(self, id, label):
-        try:
-            self.__crowdsourceable.remove((id, label))
-            return 0, "You have removed your consent for that plot."
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.remove(id, label):
             return 1, "You cannot remove your consent when you haven't yet given it."
+        return 0, "You have removed your consent for that plot."
 
     def remove_crowdsource_point(self, id, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-                return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
-            if self.__crowdsourced_points[label].get(id) is None:
-                return 1, "You haven't made a crowdsource contribution for that label yet!"
-            del self.__crowdsourced_points[label][id]
-            return 0, "You have removed your crowdsource point for that plot."
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        if self.__crowdsourced_points.get(label) is None:
             return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
+        if not self.__crowdsourced_points.remove(id, label):
+            return 1, "You haven't made a crowdsource contribution for that label yet!"
+        return 0, "You have removed your crowdsource point for that plot."
 
     def get_crowdsourced_points(self, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                return 1, "No one has crowdsourced you on that plot!"
-            return 0, self.__crowdsourced_points.get(label).items()
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        contributions = self.__crowdsourced_points.get(label)
+        if contributions is None:
             return 1, "No one has crowdsourced you on that plot!"
+        return 0, list(contributions.items())
 
     def whos_crowdsourceable(self):
-        try:
-            text = "Crowdsourceable:\n\n"
-            for (id, label) in self.__crowdsourceable:
-                text += label + "\n"
-            return 0, text
-        except AttributeError:
-            self.__crowdsourceable = []
-            return 1, "No one has consented to being crowdsourced on that plot!"
+        text = "Crowdsourceable:\n\n"
+        for (id, label) in self.__crowdsourceable:
+            text += label + "\n"
+        return 0, text
 
 
 class RadarPlot:
+    __slots__ = ("__name", "__labels", "__points", "__crowdsourced_points", "__crowdsourceable", "__createdby",
+                 "__custompoints", "__id", "__last_modified")
+
     def __init__(self, name, labels, createdby, id):
         self.__name = name
         self.__labels = [" ".join(l) for l in labels]
-        self.__points = []
-        self.__crowdsourced_points = {}
-        self.__crowdsourceable = []
+        self.__points = PointStore()
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
         self.__createdby = createdby
         self.__id = id
         self.__last_modified = None
 
+    def __getstate__(self):
+        return get_slot_state(self)
+
+    def __setstate__(self, state):
+        # Plots from before crowdsourcing was added don't have the crowdsource attributes at all.
+        self.__crowdsourced_points = CrowdsourceTally()
+        self.__crowdsourceable = CrowdsourceConsent()
+        set_slot_state(self, state)
+        # Plots saved before points were kept in a PointStore have a plain list of tuples, and plots saved before
+        # the crowdsource was tallied have a plain dict and list.
+        if not isinstance(self.__points, PointStore):
+            self.__points = PointStore(self.__points)
+        if not isinstance(self.__crowdsourced_points, CrowdsourceTally):
+            self.__crowdsourced_points = CrowdsourceTally(self.__crowdsourced_points)
+        if not isinstance(self.__crowdsourceable, CrowdsourceConsent):
+            self.__crowdsourceable = CrowdsourceConsent(self.__crowdsourceable)
+
     def plot_point(self, label, vals):
         if len(vals) != len(self.__labels):
             return 1, "That list doesn't match the number of labels."
@@ -1623,89 +1810,99 @@ class RadarPlot:
             if v > 10 or v < 0:
                 return 1, "All points must be within the bounds [0, 10]!"
 
-        for i in range(len(self.__points)):
-            if self.__points[i][0] == label:
-                self.__points[i] = (label, vals)
-                return 0, ""
-
-        self.__points.append((label if label is not None else "", vals))
+        self.__points.put((label if label is not None else "", vals))
 
         return 0, ""
 
     def remove_point(self, label):
-        if label not in [t[0] for t in self.__points]:
+        if not self.__points.remove(label):
             return 1, "Error: You haven't plotted yourself in this plot."
-        self.__points.remove(next(p for p in self.__points if p[0] == label))
-        if self.__crowdsourced_points.get(label) is not None:
-            del self.__crowdsourced_points[label]
+        self.__crowdsourced_points.discard(label)
 
         return 0, ""
 
-    def generate_plot(self, toggle_labels=True):
-        updated_points = self.update_points_with_crowdsource()
+    def background_key(self, dpi=None):
+        return fingerprint("RadarPlot", self.__id, self.__name, self.__labels, dpi)
 
-        point_labels = [p[0] for p in updated_points]
-        vals = [np.concatenate((p[1], [p[1][0]])) for p in updated_points]
-        colors = [(color_hash[0] / 255, color_hash[1] / 255, color_hash[2] / 255)
-                  for color_hash in [ColorHash(label).rgb for label in point_labels]]
+    def render_key(self, toggle_labels=True):
+        crowdsourced_points = self.__crowdsourced_points.get_digest()
+        return fingerprint(self.background_key(), self.__points.get_digest(), crowdsourced_points, toggle_labels)
 
+    def __draw_background(self, fig, ax):
         angles = np.linspace(0, 2 * np.pi, len(self.__labels), endpoint=False)
-        angles = np.concatenate((angles, [angles[0]]))
-
-        fig = plt.figure()
-        ax = fig.add_subplot(111, polar=True)
         ax.set_thetagrids(angles * 180 / np.pi, self.__labels)
         if self.__name is not None:
-            plt.title(str(self.__name), fontsize="large")
-        plt.suptitle("ID: (" + str(self.__id) + ")\n", fontsize=8)
+            ax.set_title(str(self.__name), fontsize="large")
+        fig.suptitle("ID: (" + str(self.__id) + ")\n", fontsize=8)
         ax.set_rlim(bottom=0, top=10)
         ax.grid(True)
 
-        def anim_updater(i):
-            plt.clf()
-            ax = fig.add_subplot(111, polar=True)
-            ax.set_thetagrids(angles * 180 / np.pi, self.__labels)
-            if self.__name is not None:
-                plt.title(str(self.__name), fontsize="large")
-            plt.suptitle("ID: (" + str(self.__id) + ")\n", fontsize=8)
-            ax.grid(True)
-            ax.plot(angles, vals[i], "o-", linewidth=2, color=colors[i])
-            ax.fill(angles, vals[i], alpha=0.25, color=colors[i])
-            ax.set_rlim(bottom=0, top=10)
-            ax.legend(handles=[mpatches.Patch(color=colors[i],
-                                             label=point_labels[i])],
-                      loc=(0.95, -0.1),
-                      labelspacing=0.1,
-                      fontsize="small")
+    def generate_plot(self, toggle_labels=True):
+        key = self.render_key(toggle_labels)
+        cached = RENDER_CACHE.get(key)
+        if cached is not None:
+            return 0, BytesIO(cached)
 
-        if not toggle_labels:
-            anim = FuncAnimation(fig, anim_updater, frames=len(point_labels), interval=1000)
-            anim.save("current_anim.gif", writer="imagemagick", dpi=90)
-            file = io.open("current_anim.gif", "rb", buffering=1)
-            file.seek(0)
-            return 0, file
+        import matplotlib.patches as mpatches
 
-        for i in range(len(vals)):
-            ax.plot(angles, vals[i], "o-", linewidth=2, color=colors[i])
-            ax.fill(angles, vals[i], alpha=0.25, color=colors[i])
+        point_labels, values = self.__get_columns()
+        # Each row closes its polygon by repeating the first value.
+        vals = np.concatenate((values, values[:, :1]), axis=1)
+        colors = get_colors(point_labels)
 
-        if toggle_labels:
-            ax.legend(point_labels, loc=(0.95, -0.1), labelspacing=0.1, fontsize="small")
+        angles = np.linspace(0, 2 * np.pi, len(self.__labels), endpoint=False)
+        angles = np.concatenate((angles, [angles[0]]))
 
-        buffer = BytesIO()
-        fig.savefig(buffer, format="png")
-        buffer.seek(0)
+        if not toggle_labels:
+            if len(vals) == 0:
+                return 1, "No one has plotted themselves on this radar plot yet!"
+
+            # Each frame is one person drawn over the same background, so a frame only has to be redrawn when that
+            # person's values change.
+            background_key = self.background_key(ANIMATION_DPI)
+            background = get_background(background_key, self.__draw_background, projection="polar", dpi=ANIMATION_DPI)
+
+            def frame_drawer(i):
+                def draw(ax):
+                    artists = ax.plot(angles, vals[i], "o-", linewidth=2, color=colors[i])
+                    artists += ax.fill(angles, vals[i], alpha=0.25, color=colors[i])
+                    artists.append(ax.legend(handles=[mpatches.Patch(color=colors[i],
+                                                                     label=point_labels[i])],
+                                             loc=(0.95, -0.1),
+                                             labelspacing=0.1,
+                                             fontsize="small"))
+                    return artists
+                return draw
+
+            frames = [render_frame(fingerprint(background_key, point_labels[i], vals[i].tolist()), background,
+                                   frame_drawer(i))
+                      for i in range(len(vals))]
+            data = encode_gif(frames, background.get_size(), 1000)
+            RENDER_CACHE.put(key, data)
+            return 0, BytesIO(data)
+
+        def draw(ax):
+            artists = []
+            for i in range(len(vals)):
+                artists += ax.plot(angles, vals[i], "o-", linewidth=2, color=colors[i])
+                artists += ax.fill(angles, vals[i], alpha=0.25, color=colors[i])
+            artists.append(ax.legend(point_labels, loc=(0.95, -0.1), labelspacing=0.1, fontsize="small"))
+            return artists
+
+        background = get_background(self.background_key(), self.__draw_background, projection="polar")
+        buffer = background.compose(draw)
+        RENDER_CACHE.put(key, buffer.getvalue())
 
         # bot.send_photo(chat_id=chat_id, photo=buffer)
         # This returns the image itself that can then be sent.
         return 0, buffer
 
     def lookup_label(self, label):
-        for p in self.__points:
-            if p[0] == label:
-                if len(p[1]) >= 2:
-                    return 0, p[1][::-1][-1:] + p[1][::-1][:-1]
-                return 0, p[1]
+        p = self.__points.get(label)
+        if p is not None:
+            if len(p[1]) >= 2:
+                return 0, p[1][::-1][-1:] + p[1][::-1][:-1]
+            return 0, p[1]
         return 1, "Name not found on that plot."
 
     def edit_plot(self, plot_args):
@@ -1723,7 +1920,7 @@ class RadarPlot:
         return self.__createdby
 
     def get_points(self):
-        return self.__points
+        return self.__points.to_list()
 
     def get_id(self):
         return self.__id
@@ -1743,17 +1940,12 @@ class RadarPlot:
 
     def add_crowdsource_point(self, id, label, vals):
         # ID is the person plotting, label is the name of the point.
-        try:
-            consent = False
-            for (id, consent_label) in self.__crowdsourceable:
-                if label == consent_label:
-                    consent = True
-            if not consent:
-                return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.allows(label):
             return 1, "That person (" + label + ") has not consented to being crowdsource plotted!"
 
+        if len(vals) != len(self.__labels):
+            return 1, "That list doesn't match the number of labels."
+
         for v in vals:
             if v > 10 or v < 0:
                 return 1, "All points must be within the bounds [0, 10]!"
@@ -1761,95 +1953,46 @@ class RadarPlot:
         if len(vals) >= 2:
             vals = vals[::-1][-1:] + vals[::-1][:-1]
 
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = vals
-        except AttributeError:
-            self.__crowdsourced_points = {}
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-            self.__crowdsourced_points[label][id] = vals
+        self.__crowdsourced_points.put(id, label, vals)
         return 0, "Your contribution has been added!"
 
     def add_crowdsource_consent(self, id, label):
-        try:
-            if (id, label) in self.__crowdsourceable:
-                return self.remove_crowdsource_consent(id, label)
-            self.__crowdsourceable.append((id, label))
-            return 0, "You have now consented to being crowdsourced for this plot."
-        except AttributeError:
-            self.__crowdsourceable = [(id, label)]
-            return 0, "You have now consented to being crowdsourced for this plot."
+        if (id, label) in self.__crowdsourceable:
+            return self.remove_crowdsource_consent(id, label)
+        self.__crowdsourceable.add(id, label)
+        return 0, "You have now consented to being crowdsourced for this plot."
+
+    def __get_columns(self):
+        # The labels and an (n, len(labels)) array of values for rendering. With no crowdsourced points these come
+        # straight from the point store without copying the values.
+        if len(self.__crowdsourced_points) == 0:
+            return self.__points.get_labels(), self.__points.get_values()
+        return self.__crowdsourced_points.merge(self.__points, len(self.__labels))
 
     def update_points_with_crowdsource(self):
-        updated_points = self.__points.copy()
-        try:
-            for label in self.__crowdsourced_points.keys():
-                point_index = -1
-                for i in range(len(self.__points)):
-                    if updated_points[i][0].replace(" ", "") == label:
-                        point_index = i
-                        break
-
-                if point_index != -1:
-                    x = self.__points[point_index][1]
-                    y = self.__points[point_index][2]
-                else:
-                    x = 0
-                    y = 0
-
-                l = len(self.__crowdsourced_points[label]) + 1
-                for (id, (x2, y2)) in self.__crowdsourced_points[label].items():
-                    x += x2
-                    y += y2
-
-                if point_index != -1:
-                    updated_points[point_index] = (label, x / l, y / l, updated_points[point_index][3], updated_points[point_index][4])
-                else:
-                    updated_points.append((label, x / (l - 1), y / (l - 1), 0, 0))
-            return updated_points
-        except AttributeError:
-            self.__crowdsourced_points = {}
-        return self.__points
+        labels, values = self.__get_columns()
+        return [(label, row) for label, row in zip(labels, values.tolist())]
 
     def remove_crowdsource_consent(self, id, label):
-        try:
-            self.__crowdsourceable.remove((id, label))
-            return 0, "You have removed your consent for that plot."
-        except AttributeError:
-            self.__crowdsourceable = []
+        if not self.__crowdsourceable.remove(id, label):
             return 1, "You cannot remove your consent when you haven't yet given it."
+        return 0, "You have removed your consent for that plot."
 
     def remove_crowdsource_point(self, id, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                self.__crowdsourced_points[label] = {}
-                return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
-            if self.__crowdsourced_points[label].get(id) is None:
-                return 1, "You haven't made a crowdsource contribution for that label yet!"
-            del self.__crowdsourced_points[label][id]
-            return 0, "You have removed your crowdsource point for that plot."
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        if self.__crowdsourced_points.get(label) is None:
             return 1, "You can't remove your crowdsource contribution to a point that doesn't exist!"
+        if not self.__crowdsourced_points.remove(id, label):
+            return 1, "You haven't made a crowdsource contribution for that label yet!"
+        return 0, "You have removed your crowdsource point for that plot."
 
     def get_crowdsourced_points(self, label):
-        try:
-            if self.__crowdsourced_points.get(label) is None:
-                return 1, "No one has crowdsourced you on that plot!"
-            # "\n".join([str(v) for v in self.__crowdsourced_points.get(label).values()])
-            return 0, self.__crowdsourced_points.get(label).items()
-        except AttributeError:
-            self.__crowdsourced_points = {}
+        contributions = self.__crowdsourced_points.get(label)
+        if contributions is None:
             return 1, "No one has crowdsourced you on that plot!"
+        return 0, list(contributions.items())
 
     def whos_crowdsourceable(self):
-        try:
-            text = "Crowdsourceable:\n\n"
-            for (id, label) in self.__crowdsourceable:
-                text += label + "\n"
-            return 0, text
-        except AttributeError:
-            self.__crowdsourceable = []
-            return 1, "No one has consented to being crowdsourced on that plot!"
+        text = "Crowdsourceable:\n\n"
+        for (id, label) in self.__crowdsourceable:
+            text += label + "\n"
+        return 0, text
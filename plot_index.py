@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import bisect
+
+# Creating a plot used to take the max of every plot ID in the chat, and every command that defaults to the newest
+# plot (/plotme, /removeme, /showplot, /contour, ...) built a dict of the plots that aren't archived just to take the
+# max of its keys, which adds up in chats with thousands of old plots. Each chat now keeps a PlotIndex in
+# chat_data["plot_index"]: a counter for the next plot ID and a sorted list of the IDs of the plots that exist and
+# aren't archived, kept up to date by the handlers that create, remove, archive and unarchive plots.
+#
+# The index also maps each creator's user ID to the plots they made, so /myplots, /archiveall and /unarchiveall only
+# look at the caller's plots. Old plots stored just their creator's username; normalize_creators replaces those with
+# (username, user ID) when the index is first built, for every username whose ID is known from elsewhere in the
+# chat. The rest are indexed by username until their creator next uses one of those commands and claims them.
+#
+# IDs come from the counter, so they only go up and a removed plot's ID isn't handed out again. Only the counter is
+# saved; the rest is rebuilt from the chat's plots the first time it's needed after loading.
+
+
+class PlotIndex:
+    __slots__ = ("__next_id", "__active", "__owners", "__legacy")
+
+    def __init__(self, next_id=1):
+        self.__next_id = next_id
+        # The sorted IDs of the plots that exist and aren't archived, or None until built.
+        self.__active = None
+        # The creator's user ID as a string -> the IDs of their plots, and the same for plots whose creator is only
+        # a username.
+        self.__owners = {}
+        self.__legacy = {}
+
+    def __getstate__(self):
+        return {"next_id": self.__next_id}
+
+    def __setstate__(self, state):
+        self.__init__(state["next_id"])
+
+    def is_built(self):
+        return self.__active is not None
+
+    def rebuild(self, plots, archived):
+        """
+        Work out the active plots from scratch, and make sure the counter is past every ID in use.
+        :param plots: The chat's dictionary of plot ID to plot.
+        :param archived: The chat's dictionary of archived plot IDs.
+        """
+        ids = [k for k in plots.keys() if isinstance(k, int)]
+        self.__next_id = max([self.__next_id] + [k + 1 for k in ids])
+        self.__active = sorted(k for k in ids if k not in archived)
+        self.__owners = {}
+        self.__legacy = {}
+        for k in ids:
+            self.__own(k, plots[k].get_creator())
+
+    def __own(self, plot_id, creator):
+        if isinstance(creator, tuple):
+            self.__owners.setdefault(str(creator[1]), set()).add(plot_id)
+        else:
+            self.__legacy.setdefault(str(creator), set()).add(plot_id)
+
+    def allocate(self, creator):
+        """
+        :param creator: The new plot's creator, (username, user ID).
+        :return: The ID for a new plot, which is added to the active plots and its creator's plots.
+        """
+        plot_id = self.__next_id
+        self.__next_id += 1
+        if self.__active is not None:
+            self.add(plot_id)
+            self.__own(plot_id, creator)
+        return plot_id
+
+    def remove(self, plot_id, creator):
+        """
+        Forget a plot that was removed.
+        :param creator: The plot's creator.
+        """
+        if self.__active is None:
+            return
+        self.discard(plot_id)
+        owned = self.__owners.get(str(creator[1])) if isinstance(creator, tuple) else self.__legacy.get(str(creator))
+        if owned is not None:
+            owned.discard(plot_id)
+
+    def add(self, plot_id):
+        """
+        Mark a plot as active, e.g. when it's unarchived. Until the index is built, this is left to rebuild.
+        """
+        if self.__active is None:
+            return
+        i = bisect.bisect_left(self.__active, plot_id)
+        if i == len(self.__active) or self.__active[i] != plot_id:
+            self.__active.insert(i, plot_id)
+
+    def discard(self, plot_id):
+        """
+        Mark a plot as no longer active, e.g. when it's removed or archived.
+        """
+        if self.__active is None:
+            return
+        i = bisect.bisect_left(self.__active, plot_id)
+        if i < len(self.__active) and self.__active[i] == plot_id:
+            del self.__active[i]
+
+    def claim(self, username, user_id):
+        """
+        Give a user every plot whose creator is only their username.
+        :return: A list of the IDs of those plots.
+        """
+        if self.__active is None:
+            return []
+        claimed = self.__legacy.pop(str(username), set())
+        if len(claimed) > 0:
+            self.__owners.setdefault(str(user_id), set()).update(claimed)
+        return sorted(claimed)
+
+    def claim_plot(self, plot_id, username, user_id):
+        """
+        Give a user one plot whose creator was only their username.
+        """
+        if self.__active is None:
+            return
+        self.__legacy.get(str(username), set()).discard(plot_id)
+        self.__owners.setdefault(str(user_id), set()).add(plot_id)
+
+    def get_owned(self, user_id):
+        """
+        :return: A list of the IDs of the plots the user created, in ascending order.
+        """
+        return sorted(self.__owners.get(str(user_id), ()))
+
+    def get_default(self):
+        """
+        :return: The ID of the newest active plot, else None.
+        """
+        return self.__active[-1] if len(self.__active) > 0 else None
+
+    def get_active(self):
+        """
+        :return: A list of the active plot IDs in ascending order.
+        """
+        return list(self.__active)
+
+
+def normalize_creators(chat_data):
+    """
+    Replace the usernames old plots have as their creator with (username, user ID), for each username that the
+    chat's other plots, scoreboard or bets show belongs to exactly one user.
+    :param chat_data: The dictionary of data for the chat.
+    :return: A list of the IDs of the plots that were changed.
+    """
+    plots = {k: v for k, v in (chat_data.get("plots") or {}).items() if isinstance(k, int)}
+    # Username -> the user IDs seen with it, as strings, to the IDs themselves.
+    known = {}
+    pairs = [p.get_creator() for p in plots.values()] + list((chat_data.get("scoreboard") or {}).keys())
+    for bet in [chat_data.get("current_bet")] + list((chat_data.get("all_bets") or {}).values()):
+        if isinstance(bet, dict):
+            pairs += list((bet.get("bets") or {}).keys())
+    for pair in pairs:
+        if isinstance(pair, tuple) and len(pair) == 2:
+            known.setdefault(str(pair[0]), {})[str(pair[1])] = pair[1]
+
+    changed = []
+    for plot_id, plot in plots.items():
+        creator = plot.get_creator()
+        if not isinstance(creator, tuple) and len(known.get(str(creator), {})) == 1:
+            plot.set_creator(creator, list(known[str(creator)].values())[0])
+            changed.append(plot_id)
+    return changed
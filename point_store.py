@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import hashlib
+
+import numpy as np
+
+# Points used to be a plain list of tuples that every lookup, update and removal scanned from the start, and that
+# every render, fit and stats call unpacked into fresh X/Y/error lists. The store keeps the values in one float64
+# array (a row per point, grown geometrically) with a parallel list of labels, both in insertion order, which is
+# the order points are drawn in. A label-to-slot dict makes finding a point by its label a dict lookup, and
+# renders read the columns as views of the array without copying.
+#
+# Removing a point leaves an empty slot behind rather than shifting everything after it (and renumbering their
+# slots). Empty slots are squeezed out the next time the columns are read, which is about to cost O(n) anyway.
+#
+# Points go in and come out as the same tuples as before: (label, x, y, err_x, err_y) on most plots and
+# (label, [values]) on radar plots, which is decided by the first point stored.
+
+
+class PointStore:
+    __slots__ = ("__labels", "__values", "__count", "__index", "__unspaced", "__removed", "__vector", "__digest",
+                 "__version")
+
+    def __init__(self, points=None):
+        self.__labels = []
+        self.__values = None
+        self.__count = 0
+        self.__index = {}
+        # The label with its spaces removed -> the first slot with that label. Crowdsourced points are keyed by
+        # labels without spaces, so this matches them to a point without a scan. It's only needed by plots with
+        # crowdsourced points, so it's built on first use and dropped whenever the labels change.
+        self.__unspaced = None
+        self.__removed = 0
+        self.__vector = False
+        self.__digest = None
+        self.__version = 0
+        for p in points or []:
+            self.put(p)
+
+    def __len__(self):
+        return len(self.__index)
+
+    def __iter__(self):
+        return (self.__point(slot) for slot in range(self.__count) if self.__labels[slot] is not None)
+
+    def __contains__(self, label):
+        return label in self.__index
+
+    def __repr__(self):
+        return "PointStore(" + repr(self.to_list()) + ")"
+
+    def __getstate__(self):
+        # A plain list of point tuples, so the pickled form doesn't depend on how the store is laid out.
+        return self.to_list()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __point(self, slot):
+        if self.__vector:
+            return self.__labels[slot], self.__values[slot].tolist()
+        return (self.__labels[slot],) + tuple(self.__values[slot].tolist())
+
+    def __compact(self):
+        keep = [slot for slot in range(self.__count) if self.__labels[slot] is not None]
+        labels = [self.__labels[slot] for slot in keep]
+        values = self.__values[keep]
+
+        self.__labels = labels
+        self.__values = values
+        self.__count = len(labels)
+        self.__removed = 0
+        self.__index = {label: slot for slot, label in enumerate(labels)}
+        self.__unspaced = None
+
+    def get(self, label):
+        """
+        :return: The point with the given label, else None.
+        """
+        slot = self.__index.get(label)
+        return self.__point(slot) if slot is not None else None
+
+    def put(self, point):
+        """
+        Add a point, or replace the point with the same label (the first element of the tuple) in place.
+        """
+        label = point[0]
+        if len(self.__index) == 0 and self.__count == 0:
+            self.__vector = len(point) == 2 and not np.isscalar(point[1])
+        row = point[1] if self.__vector else point[1:]
+        self.__digest = None
+        self.__version += 1
+
+        slot = self.__index.get(label)
+        if slot is not None:
+            self.__values[slot] = row
+            return
+
+        if self.__values is None:
+            self.__values = np.empty((8, len(row)), dtype=np.float64)
+        elif self.__count == len(self.__values):
+            grown = np.empty((2 * len(self.__values), self.__values.shape[1]), dtype=np.float64)
+            grown[:self.__count] = self.__values[:self.__count]
+            self.__values = grown
+
+        slot = self.__count
+        self.__values[slot] = row
+        self.__labels.append(label)
+        self.__count += 1
+        self.__index[label] = slot
+        self.__unspaced = None
+
+    def remove(self, label):
+        """
+        Remove the point with the given label.
+        :return: True if there was such a point, else False.
+        """
+        slot = self.__index.pop(label, None)
+        if slot is None:
+            return False
+
+        self.__labels[slot] = None
+        self.__removed += 1
+        self.__digest = None
+        self.__version += 1
+        self.__unspaced = None
+        return True
+
+    def get_labels(self):
+        """
+        :return: A new list of the labels in insertion order.
+        """
+        if self.__removed > 0:
+            self.__compact()
+        return list(self.__labels)
+
+    def get_values(self):
+        """
+        :return: An (n, width) float64 array of the points' values in insertion order: x, y, err_x, err_y on most
+        plots, or one column per label on radar plots. It's a view of the store, so treat it as read-only, and it's
+        only valid until the store is next changed.
+        """
+        if self.__removed > 0:
+            self.__compact()
+        if self.__values is None:
+            return np.empty((0, 4), dtype=np.float64)
+        return self.__values[:self.__count]
+
+    def get_digest(self):
+        """
+        :return: A hash of the labels and values, for render cache keys. It's kept until the store changes.
+        """
+        if self.__digest is None:
+            digest = hashlib.sha1(repr(self.get_labels()).encode("utf-8"))
+            digest.update(np.ascontiguousarray(self.get_values()).tobytes())
+            self.__digest = digest.hexdigest()
+        return self.__digest
+
+    def get_version(self):
+        """
+        :return: A number that changes whenever the store does. Cheaper than get_digest, but it starts over when the
+        store is loaded, so it only tells apart states of the same store in one process.
+        """
+        return self.__version
+
+    def to_list(self):
+        """
+        :return: A new list of the point tuples in insertion order.
+        """
+        return list(self)
+
+    def find_unspaced(self, label):
+        """
+        Find the first point whose label, with its spaces removed, is the given label.
+        :return: The point's index in to_list, get_labels and get_values, else -1. Only valid until the store is
+        next changed.
+        """
+        if self.__removed > 0:
+            self.__compact()
+        if self.__unspaced is None:
+            self.__unspaced = {}
+            for slot in reversed(range(self.__count)):
+                self.__unspaced[self.__labels[slot].replace(" ", "")] = slot
+        return self.__unspaced.get(label, -1)
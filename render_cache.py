@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Most /showplot calls in a busy chat ask for a picture that was already drawn, so rendered images are kept
+# here keyed by a hash of everything that goes into drawing them. Keys are content-addressed, so any change to
+# the plot produces a new key and stale entries simply age out of the LRU.
+
+
+def fingerprint(*parts):
+    """
+    Hash an arbitrary tuple of plot state and render options into a cache key.
+    :param parts: Any values with a stable repr (strings, numbers, tuples, lists, dicts).
+    :return: A hex digest string.
+    """
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, sizeof=len):
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        # How to measure an entry against max_bytes. The default suits bytes and strings.
+        self.__sizeof = sizeof
+        self.__entries = OrderedDict()
+        self.__total_bytes = 0
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        with self.__lock:
+            value = self.__entries.get(key)
+            if value is not None:
+                self.__entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = self.__sizeof(value)
+        if size > self.__max_bytes:
+            return
+        with self.__lock:
+            old = self.__entries.pop(key, None)
+            if old is not None:
+                self.__total_bytes -= self.__sizeof(old)
+            self.__entries[key] = value
+            self.__total_bytes += size
+            while len(self.__entries) > self.__max_entries or self.__total_bytes > self.__max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.__total_bytes -= self.__sizeof(evicted)
+
+    def discard(self, key):
+        with self.__lock:
+            old = self.__entries.pop(key, None)
+            if old is not None:
+                self.__total_bytes -= self.__sizeof(old)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__total_bytes = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_total_bytes(self):
+        return self.__total_bytes
+
+
+RENDER_CACHE = RenderCache()
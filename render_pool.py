@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import logging
+import multiprocessing
+import pickle
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+
+from metrics import METRICS
+
+# Rendering goes through matplotlib, which isn't thread-safe and holds the GIL for most of a render. Running renders
+# in worker processes keeps a slow contour plot in one chat from stalling every other chat, and lets one bot use
+# every core.
+
+
+def make_spec(plot, method, kwargs):
+    """
+    Serialize a render request. The plot is pickled right away so later changes to it can't race the worker.
+    :param plot: The plot object to render.
+    :param method: The name of the plot's render method, e.g. "generate_plot" or "polyfit".
+    :param kwargs: A dictionary of keyword arguments for the method.
+    :return: The pickled render spec.
+    """
+    return pickle.dumps((plot, method, kwargs))
+
+
+def detach(value):
+    """
+    Replace any in-memory file objects in a render result with their bytes so it can cross process boundaries.
+    :param value: A render result, e.g. (0, BytesIO) or (0, (BytesIO, r2)).
+    :return: The same structure with bytes in place of file objects.
+    """
+    if isinstance(value, BytesIO):
+        return value.getvalue()
+    if isinstance(value, tuple):
+        return tuple(detach(v) for v in value)
+    return value
+
+
+def run_spec(spec):
+    """
+    Run a render spec. This is what executes in the worker processes.
+    :param spec: A render spec from make_spec.
+    :return: The CPU seconds the render took, and the render result with bytes in place of file objects.
+    """
+    start = time.thread_time()
+    plot, method, kwargs = pickle.loads(spec)
+    result = detach(getattr(plot, method)(**kwargs))
+    return time.thread_time() - start, result
+
+
+def warm_up():
+    pass
+
+
+class RenderPool:
+    def __init__(self, workers=0):
+        """
+        :param workers: How many worker processes to render in. With none, renders run inline in the calling thread;
+        results are still delivered through callbacks. Workers are forked right away, so create the pool before
+        starting any threads: a worker forked while another thread holds a lock (an import lock, a cache's lock)
+        inherits it locked and hangs on its first render.
+        """
+        self.__executor = None
+        if workers > 0:
+            # Forking keeps the modules already imported, where spawn or forkserver would import the bot's main
+            # module again in every worker. With fork, the executor starts every worker on the first job and none
+            # after that.
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() \
+                else None
+            self.__executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            self.__executor.submit(warm_up).result()
+        self.__queues = {}
+        self.__delivering = set()
+        self.__lock = threading.Lock()
+
+    def __future(self, spec):
+        # The render's time is charged to the group of the handler that asked for it.
+        group = METRICS.get_group()
+        future = Future()
+
+        def finish(timed):
+            try:
+                seconds, result = timed.result()
+            except Exception as e:
+                future.set_exception(e)
+                return
+            METRICS.record_render(group, seconds)
+            future.set_result(result)
+
+        if self.__executor is not None:
+            self.__executor.submit(run_spec, spec).add_done_callback(finish)
+            return future
+        timed = Future()
+        try:
+            timed.set_result(run_spec(spec))
+        except Exception as e:
+            timed.set_exception(e)
+        finish(timed)
+        return future
+
+    def __enqueue(self, chat_id, future, callback):
+        callback = METRICS.bind(callback)
+        with self.__lock:
+            self.__queues.setdefault(chat_id, deque()).append((future, callback))
+        future.add_done_callback(lambda f: self.__deliver(chat_id))
+
+    def __deliver(self, chat_id):
+        # Only one thread delivers for a chat at a time, and only the head of its queue, so callbacks for a chat run
+        # one after another in the order they were submitted.
+        while True:
+            with self.__lock:
+                queue = self.__queues.get(chat_id)
+                if chat_id in self.__delivering or not queue or not queue[0][0].done():
+                    return
+                self.__delivering.add(chat_id)
+                future, callback = queue.popleft()
+                if len(queue) == 0:
+                    del self.__queues[chat_id]
+
+            try:
+                callback(self.__result(future))
+            except Exception:
+                logging.getLogger(__name__).exception("Delivering a render to chat %s failed.", chat_id)
+            finally:
+                with self.__lock:
+                    self.__delivering.discard(chat_id)
+
+    def __result(self, future):
+        try:
+            return future.result()
+        except Exception:
+            logging.getLogger(__name__).exception("Rendering failed.")
+            return 1, "Something went wrong drawing that plot!"
+
+    def submit(self, chat_id, callback, plot, method, **kwargs):
+        """
+        Render a plot off the dispatcher thread.
+        :param chat_id: The ID of the chat the render is for. Callbacks for one chat run in submission order.
+        :param callback: Called with the render result, e.g. (0, png_bytes), once it and every earlier render for
+        the chat are done.
+        :param plot: The plot object to render.
+        :param method: The name of the plot's render method.
+        :param kwargs: Keyword arguments for the method.
+        """
+        self.submit_spec(chat_id, callback, make_spec(plot, method, kwargs))
+
+    def submit_spec(self, chat_id, callback, spec):
+        """
+        Render a spec made earlier with make_spec, e.g. on the thread that owns the plot.
+        :param chat_id: The ID of the chat the render is for.
+        :param callback: Called with the render result.
+        :param spec: A render spec from make_spec.
+        """
+        self.__enqueue(chat_id, self.__future(spec), callback)
+
+    def submit_result(self, chat_id, callback, result):
+        """
+        Queue an already known result (e.g. from a cache) behind any renders still pending for the chat.
+        :param chat_id: The ID of the chat the result is for.
+        :param callback: Called with the result.
+        :param result: The result to pass to the callback.
+        """
+        future = Future()
+        future.set_result(result)
+        self.__enqueue(chat_id, future, callback)
+
+    def render(self, plot, method, **kwargs):
+        """
+        Render a plot in a worker and wait for the result.
+        :param plot: The plot object to render.
+        :param method: The name of the plot's render method.
+        :param kwargs: Keyword arguments for the method.
+        :return: The render result, with bytes in place of file objects.
+        """
+        return self.__result(self.__future(make_spec(plot, method, kwargs)))
+
+    def get_pending(self):
+        with self.__lock:
+            return sum(len(q) for q in self.__queues.values())
+
+    def shutdown(self, timeout=30):
+        """
+        Wait at most timeout seconds for pending renders to finish and be delivered, then stop the workers. Call
+        this before shutting down the outbound queue, so the images delivered here are still sent.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.__lock:
+                done = len(self.__queues) == 0 and len(self.__delivering) == 0
+            if done or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        if not done:
+            logging.getLogger(__name__).error("%d renders were still pending at shutdown.", self.get_pending())
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=done)
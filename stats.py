@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+import math
+import re
+
+import numpy as np
+
+# /plotstats used to build a pandas DataFrame of the labels and coordinates and print its describe(), which spent
+# most of its time on pandas overhead and on the column of labels it then left out of the summary. describe works the
+# summary out with a few vectorized passes over the x and y columns, and to_text lays it out the way pandas printed
+# it, so the table reads the same as before. Plots cache the text until their points change.
+#
+# pandas is only needed to get the summary as a DataFrame (to_frame), e.g. to check the table against it.
+
+DESCRIBE_ROWS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+QUANTILES = [0.25, 0.5, 0.75]
+
+# pandas' display.precision, the number of digits after the point.
+DIGITS = 6
+
+NUMBER = re.compile(r"^\s*[\+-]?[0-9]+\.[0-9]*$")
+
+
+def describe(X, Y):
+    """
+    Summarize the x and y coordinates of a plot's points the way pandas' describe does, plus the skew of each and
+    their covariance and correlation.
+    :param X: The x coordinates of the points.
+    :param Y: The y coordinates of the points.
+    :return: A dictionary from each of DESCRIBE_ROWS and "skew" to an (x, y) pair of floats, and from "cov" and "corr"
+    to a float. Values that need more points than there are (e.g. the std of one point) are NaN.
+    """
+    columns = np.array([X, Y], dtype=np.float64)
+    n = columns.shape[1]
+    summary = {"count": (float(n), float(n))}
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = columns.sum(axis=1) / n if n > 0 else np.full(2, np.nan)
+        centered = columns - mean[:, None]
+        squares = centered ** 2
+        m2 = squares.sum(axis=1)
+        m3 = (squares * centered).sum(axis=1)
+        std = np.sqrt(m2 / (n - 1)) if n > 1 else np.full(2, np.nan)
+
+        # The adjusted Fisher-Pearson skew, as pandas computes it. Sums that are only rounding error count as zero.
+        max_abs = np.abs(columns).max(axis=1, initial=0.0)
+        eps = np.finfo(np.float64).eps
+        m2 = np.where(np.abs(m2) < (eps * max_abs) ** 2 * n, 0, m2)
+        m3 = np.where(np.abs(m3) < (eps * max_abs) ** 3 * n, 0, m3)
+        if n < 3:
+            skew = np.full(2, np.nan)
+        else:
+            skew = np.where(m2 == 0, 0, (n * (n - 1) ** 0.5 / (n - 2)) * (m3 / m2 ** 1.5))
+
+        if n > 1:
+            cov = (centered[0] * centered[1]).sum() / (n - 1)
+            corr = cov / (std[0] * std[1]) if std[0] > 0 and std[1] > 0 else np.nan
+        else:
+            cov = corr = np.nan
+
+    if n > 0:
+        quantiles = np.quantile(columns, QUANTILES, axis=1)
+        low, high = columns.min(axis=1), columns.max(axis=1)
+    else:
+        quantiles = np.full((len(QUANTILES), 2), np.nan)
+        low = high = np.full(2, np.nan)
+
+    for name, pair in [("mean", mean), ("std", std), ("min", low), ("25%", quantiles[0]), ("50%", quantiles[1]),
+                       ("75%", quantiles[2]), ("max", high), ("skew", skew)]:
+        summary[name] = (float(pair[0]), float(pair[1]))
+    summary["cov"] = float(cov)
+    summary["corr"] = float(corr)
+    return summary
+
+
+def format_column(values, digits=DIGITS):
+    """
+    Format a column of floats the way pandas prints a float column: with digits places, then with trailing zeros
+    every value has dropped, or in scientific notation if some values would show as 0 or take too much room.
+    :return: A list of strings, "NaN" for NaN.
+    """
+    def format_with(spec):
+        strings = ["NaN" if math.isnan(v) else spec.format(v) for v in values]
+        while any(NUMBER.match(s) for s in strings) and all(s.endswith("0") for s in strings if NUMBER.match(s)):
+            strings = [s[:-1] if NUMBER.match(s) else s for s in strings]
+        return [s + "0" if NUMBER.match(s) and s.endswith(".") else s for s in strings]
+
+    strings = format_with("{: .%df}" % digits)
+    too_long = max(len(s) for s in strings) > digits + 6 if strings else False
+    magnitudes = [abs(v) for v in values if not math.isnan(v)]
+    large = any(v > 1e6 for v in magnitudes)
+    small = any(0 < v < 10 ** -digits for v in magnitudes)
+    if small or (too_long and large):
+        strings = format_with("{: .%de}" % digits)
+    return strings
+
+
+def format_table(index, columns, header=True):
+    """
+    Lay out a table the way pandas prints a DataFrame of floats.
+    :param index: The row labels.
+    :param columns: A list of (name, values) pairs, one per column, with a value for each row.
+    :param header: Whether to put the column names above the table.
+    :return: The table as a string.
+    """
+    index_width = max(len(label) for label in index)
+    formatted = []
+    for name, values in columns:
+        strings = format_column(values)
+        width = max([len(s) for s in strings] + [len(name) if header else 0])
+        formatted.append((name, strings, width))
+
+    lines = []
+    if header:
+        lines.append(" " * index_width + "".join(" " + name.rjust(width) for name, _, width in formatted))
+    for i, label in enumerate(index):
+        lines.append(label.ljust(index_width) + "".join(" " + strings[i].rjust(width)
+                                                        for _, strings, width in formatted))
+    return "\n".join(lines)
+
+
+def to_text(summary):
+    """
+    :param summary: A summary from describe.
+    :return: The describe table as pandas printed it, followed by the skews, covariance and correlation.
+    """
+    table = format_table(DESCRIBE_ROWS, [(name, [summary[row][i] for row in DESCRIBE_ROWS])
+                                         for i, name in enumerate(["X", "Y"])])
+    # Each on its own, so a skew that's only rounding error away from 0 doesn't put the rest in scientific notation.
+    extra = "\n".join(format_table([label], [("", [value])], header=False) for label, value in
+                      [("skew(X)   ", summary["skew"][0]), ("skew(Y)   ", summary["skew"][1]),
+                       ("cov(X, Y) ", summary["cov"]), ("corr(X, Y)", summary["corr"])])
+    return table + "\n\n" + extra
+
+
+def to_frame(summary):
+    """
+    :param summary: A summary from describe.
+    :return: The describe table as a pandas DataFrame, the same as describe() on a DataFrame of the points.
+    """
+    import pandas as pd
+
+    return pd.DataFrame({name: [summary[row][i] for row in DESCRIBE_ROWS] for i, name in enumerate(["X", "Y"])},
+                        index=DESCRIBE_ROWS)
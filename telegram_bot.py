@@ -3,17 +3,28 @@
 from __future__ import unicode_literals
 
 import telegram
-from telegram.ext import Updater, CommandHandler, PicklePersistence
-from telegram.error import TelegramError, Unauthorized
+from telegram.ext import Updater, CommandHandler, CallbackQueryHandler
+from telegram.error import TelegramError, Unauthorized, BadRequest
 import logging
 
 import os
 import argparse
+import threading
+import time
 from collections import Counter, OrderedDict
 import datetime
 from operator import itemgetter
-
-from plot import Plot, BoxedPlot, AlignmentChart, TrianglePlot, RadarPlot
+from io import BytesIO
+
+from plot import Plot, BoxedPlot, AlignmentChart, TrianglePlot, RadarPlot, preload
+from render_cache import RENDER_CACHE, RenderCache
+from render_pool import RenderPool, make_spec
+from outbound import OutboundQueue, PRIORITY_BULK, PRIORITY_REPLY
+from paging import CALLBACK_PREFIX, Pager, pack
+from contour import MODES
+from persistence import JournalPersistence, SQLitePersistence
+from metrics import METRICS
+from plot_index import PlotIndex, normalize_creators
 
 with open("api_key.txt", 'r') as f:
     TOKEN = f.read().rstrip()
@@ -48,14 +59,404 @@ ARG_PARSER.add_argument("-My", "--maxy", type=int)
 ARG_PARSER.add_argument("--custompoints", action="store_true")
 ARG_PARSER.add_argument("-l", "--labels", type=str, action="append", nargs='*')
 
-pp = PicklePersistence(filename="plotyourselfbot", on_flush=False)
+# Set PERSISTENCE=sqlite to use the SQLite store (see migrate_to_sqlite.py) instead of the pickle journal.
+if os.environ.get('PERSISTENCE', 'journal') == 'sqlite':
+    pp = SQLitePersistence(filename="plotyourselfbot.sqlite3")
+else:
+    pp = JournalPersistence(filename="plotyourselfbot")
+
+# Renders run in worker processes. RENDER_WORKERS sets how many; 0 renders inline on the dispatcher thread. Each
+# worker keeps its own image, frame and background caches, so the default is a small pool rather than one per core.
+# The workers are forked here, so this has to come before anything that starts a thread (OUTBOUND, preload, ...).
+RENDER_POOL = RenderPool(workers=int(os.environ.get('RENDER_WORKERS', min(2, os.cpu_count() or 1))))
+
+# Maps a plot's render fingerprint to the Telegram file_id of the image already uploaded for it.
+FILE_IDS = RenderCache(max_entries=4096)
+
+# When a plot is posted, lots of people plot themselves on it at once. Their changes are applied straight away, but
+# the image is only sent once per PLOT_DEBOUNCE_SECONDS per plot, showing the plot as it is at the end of the
+# window. 0 sends an image after every change.
+PLOT_DEBOUNCE_SECONDS = float(os.environ.get('PLOT_DEBOUNCE_SECONDS', '3'))
+# (chat ID, plot ID) -> the timer that will send the plot at the end of its window, the function it calls, and the
+# function from prepare_plot that sends the plot as of its latest change.
+PENDING_PLOTS = {}
+PENDING_PLOTS_LOCK = threading.Lock()
+
+# Images sent for a change to a plot replace the image in the last message the plot was sent in, as long as that
+# message is at most PLOT_EDIT_MAX_AGE_SECONDS old; otherwise it has likely scrolled out of view, so a new message is
+# sent. Maps (chat ID, plot ID) to the message ID and time the plot's default view was last sent. It's only kept in
+# memory, so after a restart the next change sends a new message.
+PLOT_EDIT_MAX_AGE_SECONDS = float(os.environ.get('PLOT_EDIT_MAX_AGE_SECONDS', '600'))
+PLOT_MESSAGES = RenderCache(max_entries=4096, sizeof=lambda v: 1)
+
+# Every message goes out through this queue, which keeps under Telegram's rate limits and retries after flood control.
+# OUTBOUND_WORKERS sets how many messages can be in flight at once (to different chats).
+OUTBOUND = OutboundQueue(workers=int(os.environ.get('OUTBOUND_WORKERS', '4')))
+
+# Long listings that are sent as one message with page buttons.
+PAGER = Pager()
+
+# The Telegram user ID of whoever runs the bot, who can see its stats with /botstats. Unset, no one can.
+OWNER_ID = os.environ.get('OWNER_ID')
+
+# Seconds between the summaries of the bot's stats written to the log; 0 for none.
+METRICS_LOG_SECONDS = float(os.environ.get('METRICS_LOG_SECONDS', '600'))
+
+def send_message(bot, chat_id, text, priority=PRIORITY_REPLY, reply_markup=None):
+    """
+    Queues a text message to a chat.
+    :param bot: The Telegram bot for handling messages.
+    :param chat_id: The ID of the chat to send the message to.
+    :param text: The text of the message.
+    :param priority: PRIORITY_REPLY or PRIORITY_BULK.
+    :param reply_markup: Optional buttons to attach to the message.
+    """
+    # print(text)
+    OUTBOUND.submit(chat_id, lambda: bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup),
+                    priority=priority)
+
+
+def send_long_message(bot, chat_id, blocks):
+    """
+    Queues text that may not fit in one message to a chat. It's packed into as few messages as possible, and if that's
+    still more than a few, sent as one message with buttons to page through it.
+    :param bot: The Telegram bot for handling messages.
+    :param chat_id: The ID of the chat to send the text to.
+    :param blocks: The text in blocks that are kept together in one message where possible, e.g. one per line.
+    """
+    for text, markup in PAGER.paginate(pack(blocks)):
+        send_message(bot, chat_id, text, reply_markup=markup)
+
+
+def send_dm(bot, user_id, chat_id, blocks):
+    """
+    Queues text to a user's private chat with the bot, packed and paged like send_long_message. If the user hasn't
+    started a private chat with the bot, the chat the command came from is told why.
+    :param bot: The Telegram bot for handling messages.
+    :param user_id: The ID of the user to message.
+    :param chat_id: The ID of the chat the command came from.
+    :param blocks: The text in blocks that are kept together in one message where possible.
+    """
+    messages = PAGER.paginate(pack(blocks))
+
+    def on_error(e):
+        if isinstance(e, Unauthorized):
+            send_message(bot, chat_id, "You haven't sent a DM to the bot and thus cannot receive DMs!")
+
+    # Each message is queued once the one before it is sent, so a failure stops the rest.
+    def send_next(i):
+        if i < len(messages):
+            text, markup = messages[i]
+            OUTBOUND.submit(user_id, lambda: bot.send_message(chat_id=user_id, text=text, reply_markup=markup),
+                            priority=PRIORITY_BULK, callback=lambda message: send_next(i + 1), on_error=on_error)
+
+    send_next(0)
+
+
+def send_photo(bot, chat_id, image):
+    """
+    Queues a photo to a chat.
+    :param bot: The Telegram bot for handling messages.
+    :param chat_id: The ID of the chat to send the photo to.
+    :param image: A file-like object with the image data, or the file_id of a previously uploaded image.
+    """
+    def send():
+        message = send_image(bot, chat_id, image)
+        if isinstance(image, BytesIO):
+            METRICS.record_upload(METRICS.get_group(), len(image.getvalue()))
+        return message
+
+    OUTBOUND.submit(chat_id, send)
+
+
+def persist(chat_id, chat_data, *paths):
+    """
+    Saves the parts of a chat's data that a handler changed.
+    :param chat_id: The ID of the chat.
+    :param chat_data: The dictionary of data for the chat.
+    :param paths: Tuples of keys into chat_data that changed, e.g. ("plots", plot_id). With none, the whole chat is
+    saved.
+    """
+    start = time.perf_counter()
+    pp.record(chat_id, chat_data, *paths)
+    METRICS.record_save(time.perf_counter() - start)
+
+
+def get_plot_index(chat_id, chat_data):
+    """
+    Gets a chat's index of plot IDs and owners, creating it or rebuilding it from the chat's data if needed. The
+    first time it's built, old plots with only a username as their creator get the user's ID where it's known.
+    :param chat_id: The ID of the chat.
+    :param chat_data: The dictionary of data for the chat.
+    :return: The chat's PlotIndex.
+    """
+    index = chat_data.get("plot_index")
+    if index is None:
+        index = chat_data["plot_index"] = PlotIndex()
+    if not index.is_built():
+        changed = [("plots", plot_id) for plot_id in normalize_creators(chat_data)]
+        # Archived plots used to be saved a second time as their archived value; only the key is ever read.
+        archived = chat_data.get("archived") or {}
+        if any(v is not True for v in archived.values()):
+            chat_data["archived"] = {plot_id: True for plot_id in archived}
+            changed.append(("archived",))
+        index.rebuild(chat_data.get("plots") or {}, chat_data.get("archived") or {})
+        if len(changed) > 0:
+            persist(chat_id, chat_data, *changed)
+    return index
+
+
+def set_plot_creator(chat_id, chat_data, plot_id, username, user_id):
+    """
+    Replaces the username an old plot has as its creator with (username, user ID), in the plot and the chat's index.
+    :param chat_id: The ID of the chat.
+    :param chat_data: The dictionary of data for the chat.
+    :param plot_id: The ID of the plot.
+    :param username: The creator's username.
+    :param user_id: The creator's user ID.
+    """
+    chat_data["plots"][plot_id].set_creator(username, user_id)
+    get_plot_index(chat_id, chat_data).claim_plot(plot_id, username, user_id)
+
+
+def get_user_plots(chat_id, chat_data, user):
+    """
+    Gets the plots a user created, first claiming any old plots that only have their username as the creator.
+    :param chat_id: The ID of the chat.
+    :param chat_data: The dictionary of data for the chat.
+    :param user: A Telegram user object.
+    :return: A list of the user's plot IDs in ascending order, and a list of the ("plots", plot ID) paths of the
+    plots whose creator was updated.
+    """
+    username = get_username(user)
+    plots = chat_data.get("plots") or {}
+    index = get_plot_index(chat_id, chat_data)
+
+    changed = []
+    for plot_id in index.claim(username, user.id):
+        creator = plots[plot_id].get_creator() if plot_id in plots else None
+        if creator is not None and not isinstance(creator, tuple) and str(creator) == str(username):
+            plots[plot_id].set_creator(username, user.id)
+            changed.append(("plots", plot_id))
+
+    # The index is only kept up to date by the handlers, so plots that aren't the user's any more are skipped.
+    owned = [plot_id for plot_id in index.get_owned(user.id) if plot_id in plots and
+             isinstance(plots[plot_id].get_creator(), tuple) and str(plots[plot_id].get_creator()[1]) == str(user.id)]
+    return owned, changed
+
+
+def get_default_plot_id(chat_id, chat_data):
+    """
+    Gets the ID of the plot commands use when none is given: the newest plot that isn't archived.
+    :param chat_id: The ID of the chat.
+    :param chat_data: The dictionary of data for the chat.
+    :return: The plot ID. Raises ValueError if there is no such plot.
+    """
+    index = get_plot_index(chat_id, chat_data)
+    plot_id = index.get_default()
+    # The index is only kept up to date by the handlers, so it's rebuilt if it's somehow out of step.
+    if plot_id is not None and (plot_id not in (chat_data.get("plots") or {}) or
+                                plot_id in (chat_data.get("archived") or {})):
+        index.rebuild(chat_data.get("plots") or {}, chat_data.get("archived") or {})
+        plot_id = index.get_default()
+    if plot_id is None:
+        raise ValueError("There are no plots that aren't archived.")
+    return plot_id
+
+
+def send_image(bot, chat_id, image, animation=False):
+    """
+    Sends an image or an animation to a chat right away. Should only be called from a job on the outbound queue.
+    :param bot: The Telegram bot for handling messages.
+    :param chat_id: The ID of the chat to send the image to.
+    :param image: A file-like object with the image data, or the file_id of a previously uploaded image.
+    :param animation: Whether the image is an animation rather than a photo.
+    :return: The sent Telegram message.
+    """
+    if animation:
+        return bot.send_animation(chat_id=chat_id, animation=image)
+    return bot.send_photo(chat_id=chat_id, photo=image)
+
+
+def get_file_id(message):
+    """
+    Given a sent Telegram message with an image, return the file_id Telegram assigned to it.
+    :param message: A Telegram message object.
+    :return: The file_id of the largest photo size, animation or document in the message, else None.
+    """
+    if message is None:
+        return None
+    if message.photo:
+        return message.photo[-1].file_id
+    if message.animation is not None:
+        return message.animation.file_id
+    if message.document is not None:
+        return message.document.file_id
+    return None
+
+
+def edit_plot_message(bot, chat_id, plot_id, image):
+    """
+    Replaces the image in the last message a plot's default view was sent in, if it was sent recently enough.
+    :param bot: The Telegram bot for handling messages.
+    :param chat_id: The ID of the chat the plot is in.
+    :param plot_id: The ID of the plot.
+    :param image: A file-like object with the image data, or the file_id of a previously uploaded image.
+    :return: The edited Telegram message, True if the message already showed that image, or None if there's no
+    message to edit and the image should be sent in a new one.
+    """
+    sent = PLOT_MESSAGES.get((chat_id, plot_id))
+    if sent is None or time.time() - sent[1] > PLOT_EDIT_MAX_AGE_SECONDS:
+        return None
 
-def send_message(bot, chat_id, text):
     try:
-        # print(text)
-        bot.send_message(chat_id=chat_id, text=text)
-    except TelegramError as e:
-        raise e
+        return bot.edit_message_media(chat_id=chat_id, message_id=sent[0], media=telegram.InputMediaPhoto(image))
+    except BadRequest as e:
+        if "not modified" in str(e).lower():
+            return True
+        # The message was deleted or can't be edited any more.
+        PLOT_MESSAGES.discard((chat_id, plot_id))
+        if isinstance(image, BytesIO):
+            image.seek(0)
+        return None
+
+
+def prepare_plot(plot, edit=False, **render_args):
+    """
+    Takes everything needed to send the image of a plot from the plot now, so it can be sent later or from another
+    thread without reading the plot while a handler changes it. If the image isn't cached, the plot is pickled for
+    the render pool right away.
+    :param plot: The plot to be sent.
+    :param edit: Whether to replace the image in the last message the plot was sent in, if it's recent enough,
+    instead of sending a new message. Only applies to the plot's default view.
+    :param render_args: Keyword arguments passed on to the plot's generate_plot.
+    :return: A function taking the Telegram bot and the ID of the chat to send the image to.
+    """
+    plot_id = plot.get_id()
+    animation = isinstance(plot, RadarPlot) and not render_args.get("toggle_labels", True)
+    # Whether this is the plain image /showplot sends, rather than a zoom, contour or animation.
+    default_view = all(v is None or v is False for k, v in render_args.items() if k != "toggle_labels") and \
+        render_args.get("toggle_labels", True) is True
+    key = plot.render_key(**render_args)
+    rendered = RENDER_CACHE.get(key)
+    spec = make_spec(plot, "generate_plot", render_args) if rendered is None else None
+
+    def send(bot, chat_id, use_file_id=True):
+        def deliver(result):
+            if result is None:
+                return
+
+            if result[0] == 1:
+                send_message(bot, chat_id, result[1])
+                return
+
+            if isinstance(result[1], bytes):
+                RENDER_CACHE.put(key, result[1])
+                image = BytesIO(result[1])
+            else:
+                image = result[1]
+            OUTBOUND.submit(chat_id, lambda: upload(image))
+
+        def upload(image):
+            if isinstance(image, BytesIO):
+                # The image may have been read by an attempt that hit flood control.
+                image.seek(0)
+
+            message = edit_plot_message(bot, chat_id, plot_id, image) if edit and default_view else None
+            if message is True:
+                return message
+            if message is None:
+                try:
+                    message = send_image(bot, chat_id, image, animation=animation)
+                except BadRequest:
+                    if isinstance(image, BytesIO):
+                        raise
+                    # Telegram no longer knows that file, so forget it and upload the image itself.
+                    FILE_IDS.discard(key)
+                    send(bot, chat_id, use_file_id=False)
+                    return None
+
+            if isinstance(image, BytesIO):
+                METRICS.record_upload(METRICS.get_group(), len(image.getvalue()))
+
+            if default_view and getattr(message, "message_id", None) is not None:
+                PLOT_MESSAGES.put((chat_id, plot_id), (message.message_id, time.time()))
+
+            file_id = get_file_id(message)
+            if file_id is not None:
+                FILE_IDS.put(key, file_id)
+            return message
+
+        cached = (FILE_IDS.get(key) if use_file_id else None) or rendered or RENDER_CACHE.get(key)
+        if cached is not None:
+            RENDER_POOL.submit_result(chat_id, deliver, (0, cached))
+        else:
+            RENDER_POOL.submit_spec(chat_id, deliver, spec)
+
+    return send
+
+
+def send_plot(bot, chat_id, plot, edit=False, **render_args):
+    """
+    Sends the image of a plot to a chat. If an identical image was already uploaded, it's sent again by its
+    Telegram file_id; otherwise it's rendered in the render pool and sent once ready, after any images still pending
+    for the chat.
+    :param bot: The Telegram bot for handling messages.
+    :param chat_id: The ID of the chat to send the image to.
+    :param plot: The plot to be sent.
+    :param edit: Whether to replace the image in the last message the plot was sent in, if it's recent enough,
+    instead of sending a new message. Only applies to the plot's default view.
+    :param render_args: Keyword arguments passed on to the plot's generate_plot.
+    """
+    prepare_plot(plot, edit=edit, **render_args)(bot, chat_id)
+
+
+def send_plot_debounced(bot, chat_id, plot):
+    """
+    Sends the image of a plot to a chat after it changed. The first change starts a window of PLOT_DEBOUNCE_SECONDS
+    and any further changes to the plot during it are covered by the one image sent when it ends. The image replaces
+    the one in the plot's last message when that's recent enough.
+    :param bot: The Telegram bot for handling messages.
+    :param chat_id: The ID of the chat to send the image to.
+    :param plot: The plot that changed.
+    """
+    if PLOT_DEBOUNCE_SECONDS <= 0:
+        send_plot(bot, chat_id, plot, edit=True)
+        return
+
+    key = (chat_id, plot.get_id())
+    # The timer runs on its own thread while handlers keep changing the plot, so it only sends the latest snapshot
+    # taken here on the dispatcher thread and never reads the plot itself.
+    send = prepare_plot(plot, edit=True)
+
+    # The image is charged to the command whose change started the window.
+    @METRICS.bind
+    def fire():
+        with PENDING_PLOTS_LOCK:
+            pending = PENDING_PLOTS.pop(key, None)
+        if pending is not None:
+            pending[2](bot, chat_id)
+
+    with PENDING_PLOTS_LOCK:
+        if key in PENDING_PLOTS:
+            timer, pending_fire, _ = PENDING_PLOTS[key]
+            PENDING_PLOTS[key] = (timer, pending_fire, send)
+            return
+        timer = threading.Timer(PLOT_DEBOUNCE_SECONDS, fire)
+        timer.daemon = True
+        PENDING_PLOTS[key] = (timer, fire, send)
+        timer.start()
+
+
+def flush_pending_plots():
+    """
+    Sends every plot still waiting on its debounce window now, e.g. before shutting down.
+    """
+    with PENDING_PLOTS_LOCK:
+        pending = list(PENDING_PLOTS.values())
+    for timer, fire, _ in pending:
+        timer.cancel()
+        fire()
 
 
 def get_username(user):
@@ -132,10 +533,10 @@ def create_plot_handler(bot, update, chat_data, args):
     if chat_data.get("plots") is None:
         chat_data["plots"] = {}
 
-    max_key = max(chat_data["plots"].keys()) if len(chat_data["plots"].keys()) > 0 else 0
+    plot_id = get_plot_index(chat_id, chat_data).allocate((username, user.id))
 
     if len(args) == 0:
-        send_message(bot, chat_id, "You have created an empty plot (" + str(max_key + 1) + ") successfully!")
+        send_message(bot, chat_id, "You have created an empty plot (" + str(plot_id) + ") successfully!")
 
     plot = Plot(" ".join(plot_args.get("title")) if plot_args.get("title") is not None else None,
                 " ".join(plot_args.get("xleft")) if plot_args.get("xleft") is not None else None,
@@ -147,14 +548,15 @@ def create_plot_handler(bot, update, chat_data, args):
                 plot_args.get("miny") if plot_args.get("miny") is not None else -10,
                 plot_args.get("maxy") if plot_args.get("maxy") is not None else 10,
                 (username, user.id),
-                max_key + 1,
+                plot_id,
                 plot_args.get("custompoints") if plot_args.get("custompoints") is not None else False)
-    chat_data["plots"][max_key + 1] = plot
+    chat_data["plots"][plot_id] = plot
 
     send_message(bot, chat_id, str(" ".join(plot_args.get("title", ""))) +
-                                   " (" + str(max_key + 1) + ") was created successfully!")
+                                   " (" + str(plot_id) + ") was created successfully!")
 
-    show_plot_handler(bot, update, chat_data, [max_key + 1])
+    persist(chat_id, chat_data, ("plots", plot_id), ("plot_index",))
+    show_plot_handler(bot, update, chat_data, [plot_id])
 
 
 def remove_plot_handler(bot, update, chat_data, args):
@@ -190,7 +592,7 @@ def remove_plot_handler(bot, update, chat_data, args):
         return
 
     if not isinstance(plot.get_creator(), tuple) and str(plot.get_creator()) == str(username):
-        plot.set_creator(username, user.id)
+        set_plot_creator(chat_id, chat_data, plot_id, username, user.id)
     if not isinstance(plot.get_creator(), tuple) and str(plot.get_creator()) != str(username):
         send_message(bot, chat_id, "You didn't make that plot (" + str(plot_id) + ")!")
         return
@@ -202,8 +604,9 @@ def remove_plot_handler(bot, update, chat_data, args):
     del chat_data["plots"][plot_id]
     if chat_data.get("archived") is not None and chat_data["archived"].get(plot_id) is not None:
         del chat_data["archived"][plot_id]
+    get_plot_index(chat_id, chat_data).remove(plot_id, plot.get_creator())
     send_message(bot, chat_id, "Plot (" + str(plot_id) + ") has been removed!")
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("plots", plot_id), ("archived", plot_id))
 
 
 def plot_me_handler(bot, update, chat_data, args):
@@ -228,8 +631,7 @@ def plot_me_handler(bot, update, chat_data, args):
 
     try:
         # Select the most recent (max) key from plots that aren't archived by default.
-        plot_id = int(args[0]) if len(args) >= 3 else int(max({k:v for k, v in chat_data["plots"].items()
-                                                               if k not in chat_data["archived"]}.keys()))
+        plot_id = int(args[0]) if len(args) >= 3 else get_default_plot_id(chat_id, chat_data)
         x = float(args[1] if len(args) >= 3 else args[0])
         y = float(args[2] if len(args) >= 3 else args[1])
         err_x = float(args[3] if len(args) >= 4 else 0)
@@ -261,19 +663,10 @@ def plot_me_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, result[1])
         return
     elif result[0] == 0:
-        img = plot.generate_plot()
-
-        if img is None:
-            return
-
-        if img[0] == 1:
-            send_message(bot, chat_id, img[1])
-            return
-        elif img[0] == 0:
-            bot.send_photo(chat_id=chat_id, photo=img[1])
+        send_plot_debounced(bot, chat_id, plot)
 
         chat_data["plots"][plot_id].set_last_modified(datetime.datetime.now())
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("plots", plot_id))
 
 
 def remove_me_handler(bot, update, chat_data, args):
@@ -297,8 +690,7 @@ def remove_me_handler(bot, update, chat_data, args):
         chat_data["archived"] = {}
 
     try:
-        plot_id = int(args[0]) if len(args) == 1 else int(max({k:v for k, v in chat_data["plots"].items()
-                                                               if k not in chat_data["archived"]}.keys()))
+        plot_id = int(args[0]) if len(args) == 1 else get_default_plot_id(chat_id, chat_data)
     except ValueError:
         send_message(bot, chat_id, "The plot ID must be an integer!")
         return
@@ -322,19 +714,10 @@ def remove_me_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, result[1])
         return
     elif result[0] == 0:
-        img = plot.generate_plot()
-
-        if img is None:
-            return
-
-        if img[0] == 1:
-            send_message(bot, chat_id, img[1])
-            return
-        elif img[0] == 0:
-            bot.send_photo(chat_id=chat_id, photo=img[1])
+        send_plot_debounced(bot, chat_id, plot)
 
         chat_data["plots"][plot_id].set_last_modified(datetime.datetime.now())
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("plots", plot_id))
 
 
 def show_plot_handler(bot, update, chat_data, args):
@@ -356,8 +739,7 @@ def show_plot_handler(bot, update, chat_data, args):
         chat_data["archived"] = {}
 
     try:
-        plot_id = int(args[0]) if len(args) >= 1 else int(max({k:v for k, v in chat_data["plots"].items()
-                                                               if k not in chat_data["archived"]}.keys()))
+        plot_id = int(args[0]) if len(args) >= 1 else get_default_plot_id(chat_id, chat_data)
         toggle = 1 if len(args) != 2 else int(args[1])
     except ValueError:
         send_message(bot, chat_id, "The plot ID and optional toggle must be an integer!")
@@ -374,20 +756,7 @@ def show_plot_handler(bot, update, chat_data, args):
         return
 
     toggle_labels = True if toggle > 0 else False
-    result = plot.generate_plot(toggle_labels=toggle_labels)
-
-    if result is None:
-        return
-
-    if result[0] == 1:
-        send_message(bot, chat_id, result[1])
-        return
-    elif result[0] == 0:
-        if not toggle_labels and isinstance(plot, RadarPlot):
-            bot.send_animation(chat_id=chat_id, animation=result[1])
-            return
-        bot.send_photo(chat_id=chat_id, photo=result[1])
-    telegram.ext.PicklePersistence.flush(pp)
+    send_plot(bot, chat_id, plot, toggle_labels=toggle_labels)
 
 
 def list_plots_handler(bot, update, chat_data):
@@ -409,15 +778,12 @@ def list_plots_handler(bot, update, chat_data):
     # Plots that aren't archived.
     cur_plots = OrderedDict(sorted({k:v for k, v in chat_data["plots"].items() if k not in chat_data["archived"]}.items()))
 
-    text = "Current plots:\n\n"
+    blocks = ["Current plots:\n\n"]
     for (key, value) in cur_plots.items():
         if isinstance(key, int):
-            text += "(" + str(key) + "): " + str(value.get_name()) + "\n"
+            blocks.append("(" + str(key) + "): " + str(value.get_name()) + "\n")
 
-    try:
-        send_message(bot, user_id, text)
-    except Unauthorized as u:
-        send_message(bot, chat_id, "You haven't sent a DM to the bot and thus cannot receive DMs!")
+    send_dm(bot, user_id, chat_id, blocks)
 
 
 def full_list_plots_handler(bot, update, chat_data):
@@ -433,15 +799,12 @@ def full_list_plots_handler(bot, update, chat_data):
     if chat_data.get("plots") is None:
         chat_data["plots"] = {}
 
-    text = "All plots:\n\n"
+    blocks = ["All plots:\n\n"]
     for (key, value) in OrderedDict(sorted(chat_data["plots"].items())).items():
         if isinstance(key, int):
-            text += "(" + str(key) + "): " + str(value.get_name()) + "\n"
+            blocks.append("(" + str(key) + "): " + str(value.get_name()) + "\n")
 
-    try:
-        send_message(bot, user_id, text)
-    except Unauthorized as u:
-        send_message(bot, chat_id, "You haven't sent a DM to the bot and thus cannot receive DMs!")
+    send_dm(bot, user_id, chat_id, blocks)
 
 
 def get_plot_stats_handler(bot, update, chat_data, args):
@@ -535,17 +898,25 @@ def polyfit_plot_handler(bot, update, chat_data, args):
         return
 
     toggle_labels = True if toggle > 0 else False
-    result = plot.polyfit(deg, toggle_labels=toggle_labels)
 
-    if result is None:
-        return
+    def deliver(result):
+        if result is None:
+            return
 
-    if result[0] == 1:
-        send_message(bot, chat_id, result[1])
-        return
-    elif result[0] == 0:
-        bot.send_photo(chat_id=chat_id, photo=result[1][0])
-        send_message(bot, chat_id, "Plot (" + str(plot_id) + ") R^2: " + str(result[1][1]))
+        if result[0] == 1:
+            send_message(bot, chat_id, result[1])
+            return
+        elif result[0] == 0:
+            RENDER_CACHE.put(key, result[1][0])
+            send_photo(bot, chat_id, BytesIO(result[1][0]))
+            send_message(bot, chat_id, "Plot (" + str(plot_id) + ") R^2: " + str(result[1][1]))
+
+    key = plot.fit_key(deg, toggle_labels)
+    cached = RENDER_CACHE.get(key)
+    if cached is not None:
+        RENDER_POOL.submit_result(chat_id, deliver, (0, (cached, plot.get_fit(deg)[1])))
+    else:
+        RENDER_POOL.submit(chat_id, deliver, plot, "polyfit", deg=deg, toggle_labels=toggle_labels)
 
 
 def whomademe_handler(bot, update, chat_data, args):
@@ -625,7 +996,7 @@ def custom_point_handler(bot, update, chat_data, args):
         return
 
     if not isinstance(plot.get_creator(), tuple) and str(plot.get_creator()) == str(username):
-        plot.set_creator(username, user.id)
+        set_plot_creator(chat_id, chat_data, plot_id, username, user.id)
 
     if str(plot.get_creator()[1]) != str(user.id):
         send_message(bot, chat_id, "You didn't make that plot (" + str(plot_id) + ")!")
@@ -644,20 +1015,11 @@ def custom_point_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, result[1])
         return
     elif result[0] == 0:
-        img = plot.generate_plot()
-
-        if img is None:
-            return
-
-        if img[0] == 1:
-            send_message(bot, chat_id, img[1])
-            return
-        elif img[0] == 0:
-            bot.send_photo(chat_id=chat_id, photo=img[1])
+        send_plot_debounced(bot, chat_id, plot)
 
         chat_data["plots"][plot_id].set_last_modified(datetime.datetime.now())
 
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("plots", plot_id))
 
 
 def boxed_plot_handler(bot, update, chat_data, args):
@@ -686,23 +1048,24 @@ def boxed_plot_handler(bot, update, chat_data, args):
         " ".join(plot_args.get("vert1")) if plot_args.get("vert1") is not None else ""
     ]
 
-    max_key = max(chat_data["plots"].keys()) if len(chat_data["plots"].keys()) > 0 else 0
+    plot_id = get_plot_index(chat_id, chat_data).allocate((username, user.id))
 
     if len(args) == 0:
-        send_message(bot, chat_id, "You have created an empty plot (" + str(max_key + 1) + ") successfully!")
+        send_message(bot, chat_id, "You have created an empty plot (" + str(plot_id) + ") successfully!")
 
     plot = BoxedPlot(" ".join(plot_args.get("title")) if plot_args.get("title") is not None else None,
                 horiz,
                 vert,
                 (username, user.id),
-                max_key + 1,
+                plot_id,
                 plot_args.get("custompoints") if plot_args.get("custompoints") is not None else False)
-    chat_data["plots"][max_key + 1] = plot
+    chat_data["plots"][plot_id] = plot
 
     send_message(bot, chat_id, str(" ".join(plot_args.get("title", ""))) +
-                                   " (" + str(max_key + 1) + ") was created successfully!")
+                                   " (" + str(plot_id) + ") was created successfully!")
 
-    show_plot_handler(bot, update, chat_data, [max_key + 1])
+    persist(chat_id, chat_data, ("plots", plot_id), ("plot_index",))
+    show_plot_handler(bot, update, chat_data, [plot_id])
 
 
 def lookup_handler(bot, update, chat_data, args):
@@ -782,7 +1145,7 @@ def my_bet_handler(bot, update, chat_data, args):
     # We assume there can only be one bet at a time. This has an associated degree and plot ID.
     chat_data["current_bet"]["bets"][(username, user.id)] = R2
     send_message(bot, chat_id, "Your bet has been placed!")
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("current_bet",))
 
 
 def setup_bet_handler(bot, update, chat_data, args):
@@ -841,7 +1204,7 @@ def setup_bet_handler(bot, update, chat_data, args):
     send_message(bot, chat_id, "The following bet was created:\n\nPlot ID: " +
                  str(chat_data["current_bet"]["plot_id"]) + "\nDegree: " +
                  str(chat_data["current_bet"]["degree"]))
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("current_bet",))
 
 
 def cancel_bet_handler(bot, update, chat_data):
@@ -859,7 +1222,7 @@ def cancel_bet_handler(bot, update, chat_data):
 
     chat_data["current_bet"] = None
     send_message(bot, chat_id, "The bet has been canceled.")
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("current_bet",))
 
 
 def complete_bet_handler(bot, update, chat_data):
@@ -880,7 +1243,16 @@ def complete_bet_handler(bot, update, chat_data):
         return
 
     plot = chat_data["plots"][chat_data["current_bet"]["plot_id"]]
-    result = plot.polyfit(chat_data["current_bet"]["degree"])
+    deg = chat_data["current_bet"]["degree"]
+    key = plot.fit_key(deg)
+    cached = RENDER_CACHE.get(key)
+    if cached is not None:
+        result = 0, (cached, plot.get_fit(deg)[1])
+    else:
+        # The winner depends on the fit, so wait for this render rather than queueing it.
+        result = RENDER_POOL.render(plot, "polyfit", deg=deg)
+        if result is not None and result[0] == 0:
+            RENDER_CACHE.put(key, result[1][0])
 
     if result is None:
         return
@@ -888,6 +1260,9 @@ def complete_bet_handler(bot, update, chat_data):
     if chat_data.get("all_user_bet_data") is None:
         chat_data["all_user_bet_data"] = {}
 
+    # The parts of chat_data this bet touches, so only those need to be saved.
+    changed = []
+
     if result[0] == 1:
         send_message(bot, chat_id, result[1])
         return
@@ -919,6 +1294,7 @@ def complete_bet_handler(bot, update, chat_data):
                 "degree"  : chat_data["current_bet"]["degree"],
                 "bet"     : value
             }
+            changed.append(("all_user_bet_data", user_id))
 
             if diff < best_diff:
                 best_diff = diff
@@ -926,7 +1302,7 @@ def complete_bet_handler(bot, update, chat_data):
                 best_id = user_id
                 bestr2 = value
 
-        bot.send_photo(chat_id=chat_id, photo=result[1][0])
+        send_photo(bot, chat_id, BytesIO(result[1][0]))
         send_message(bot, chat_id, "Actual R^2: " + str(result[1][1]))
         send_message(bot, chat_id, "Winner: " + best + " with R^2 = " + str(bestr2) + "!")
 
@@ -964,9 +1340,13 @@ def complete_bet_handler(bot, update, chat_data):
         chat_data["all_bets"][chat_data["current_bet"]["created_at"]]["winner_value"] = bestr2
         chat_data["all_bets"][chat_data["current_bet"]["created_at"]]["actual_value"] = result[1][1]
 
+        changed += [("scoreboard", (best, best_id)),
+                    ("scoreboard_avg", (best, best_id)),
+                    ("all_bets", chat_data["current_bet"]["created_at"])]
+
     # Reset the current bet.
     chat_data["current_bet"] = None
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("current_bet",), *changed)
 
 
 def scoreboard_handler(bot, update, chat_data):
@@ -1094,7 +1474,7 @@ def edit_plot_handler(bot, update, chat_data, args):
         return
 
     if not isinstance(plot.get_creator(), tuple) and str(plot.get_creator()) == str(username):
-        plot.set_creator(username, user.id)
+        set_plot_creator(chat_id, chat_data, plot_id, username, user.id)
 
     if str(plot.get_creator()[1]) != str(user.id):
         send_message(bot, chat_id, "You didn't make that plot (" + str(plot_id) + ")!")
@@ -1109,7 +1489,7 @@ def edit_plot_handler(bot, update, chat_data, args):
 
     plot.edit_plot(plot_args)
     send_message(bot, chat_id, "Plot (" + str(plot_id) + ") has been updated!")
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("plots", plot_id))
 
 
 def current_bet_handler(bot, update, chat_data, args):
@@ -1194,22 +1574,23 @@ def alignment_chart_handler(bot, update, chat_data, args):
         " ".join(plot_args.get("label9")) if plot_args.get("label9") is not None else ""
     ]
 
-    max_key = max(chat_data["plots"].keys()) if len(chat_data["plots"].keys()) > 0 else 0
+    plot_id = get_plot_index(chat_id, chat_data).allocate((username, user.id))
 
     if len(args) == 0:
-        send_message(bot, chat_id, "You have created an empty plot (" + str(max_key + 1) + ") successfully!")
+        send_message(bot, chat_id, "You have created an empty plot (" + str(plot_id) + ") successfully!")
 
     plot = AlignmentChart(" ".join(plot_args.get("title")) if plot_args.get("title") is not None else None,
                 labels,
                 (username, user.id),
-                max_key + 1,
+                plot_id,
                 plot_args.get("custompoints") if plot_args.get("custompoints") is not None else False)
-    chat_data["plots"][max_key + 1] = plot
+    chat_data["plots"][plot_id] = plot
 
     send_message(bot, chat_id, str(" ".join(plot_args.get("title", ""))) +
-                                   " (" + str(max_key + 1) + ") was created successfully!")
+                                   " (" + str(plot_id) + ") was created successfully!")
 
-    show_plot_handler(bot, update, chat_data, [max_key + 1])
+    persist(chat_id, chat_data, ("plots", plot_id), ("plot_index",))
+    show_plot_handler(bot, update, chat_data, [plot_id])
 
 
 def archive_handler(bot, update, chat_data, args):
@@ -1245,8 +1626,10 @@ def archive_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, "That plot (" + str(plot_id) + ") doesn't exist!")
         return
 
+    changed = [("archived", plot_id)]
     if not isinstance(plot.get_creator(), tuple) and str(plot.get_creator()) == str(username):
-        plot.set_creator(username, user.id)
+        set_plot_creator(chat_id, chat_data, plot_id, username, user.id)
+        changed.append(("plots", plot_id))
     if not isinstance(plot.get_creator(), tuple) and str(plot.get_creator()) != str(username):
         send_message(bot, chat_id, "You didn't make that plot (" + str(plot_id) + ")!")
         return
@@ -1262,9 +1645,10 @@ def archive_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, "That plot (" + str(plot_id) + ") has already been archived!")
         return
 
-    chat_data["archived"][plot_id] = chat_data["plots"][plot_id]
+    chat_data["archived"][plot_id] = True
+    get_plot_index(chat_id, chat_data).discard(plot_id)
     send_message(bot, chat_id, "Plot (" + str(plot_id) + ") has been archived!")
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, *changed)
 
 
 def unarchive_handler(bot, update, chat_data, args):
@@ -1300,8 +1684,10 @@ def unarchive_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, "That plot (" + str(plot_id) + ") doesn't exist!")
         return
 
+    changed = [("archived", plot_id)]
     if not isinstance(plot.get_creator(), tuple) and str(plot.get_creator()) == str(username):
-        plot.set_creator(username, user.id)
+        set_plot_creator(chat_id, chat_data, plot_id, username, user.id)
+        changed.append(("plots", plot_id))
     if not isinstance(plot.get_creator(), tuple) and str(plot.get_creator()) != str(username):
         send_message(bot, chat_id, "You didn't make that plot (" + str(plot_id) + ")!")
         return
@@ -1319,9 +1705,10 @@ def unarchive_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, "That plot (" + str(plot_id) + ") has not been archived!")
         return
 
-    del chat_data["plots"][plot_id]
+    del chat_data["archived"][plot_id]
+    get_plot_index(chat_id, chat_data).add(plot_id)
     send_message(bot, chat_id, "Plot (" + str(plot_id) + ") has been unarchived!")
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, *changed)
 
 
 def my_plots_handler(bot, update, chat_data):
@@ -1334,27 +1721,21 @@ def my_plots_handler(bot, update, chat_data):
     chat_id = update.message.chat.id
     user = update.message.from_user
     user_id = user.id
-    username = get_username(user)
 
     if chat_data.get("plots") is None:
         chat_data["plots"] = {}
         send_message(bot, chat_id, "No plots currently exist!")
         return
 
-    text = "Your plots:\n\n"
-    for (key, value) in chat_data["plots"].items():
-        if isinstance(key, int):
-            creator = value.get_creator()
-            if isinstance(creator, tuple) and str(creator[1]) == str(user_id):
-                text += "(" + str(key) + "): " + str(value.get_name()) + "\n"
-            elif not isinstance(creator, tuple) and str(creator) == str(username):
-                text += "(" + str(key) + "): " + str(value.get_name()) + "\n"
-                value.set_creator(username, user_id)
+    owned, changed = get_user_plots(chat_id, chat_data, user)
 
-    try:
-        send_message(bot, user_id, text)
-    except Unauthorized as u:
-        send_message(bot, chat_id, "You haven't sent a DM to the bot and thus cannot receive DMs!")
+    blocks = ["Your plots:\n\n"]
+    for key in owned:
+        blocks.append("(" + str(key) + "): " + str(chat_data["plots"][key].get_name()) + "\n")
+
+    send_dm(bot, user_id, chat_id, blocks)
+    if len(changed) > 0:
+        persist(chat_id, chat_data, *changed)
 
 
 def archive_all_handler(bot, update, chat_data):
@@ -1366,7 +1747,6 @@ def archive_all_handler(bot, update, chat_data):
     """
     chat_id = update.message.chat.id
     user = update.message.from_user
-    username = get_username(user)
 
     if chat_data.get("plots") is None:
         chat_data["plots"] = {}
@@ -1376,17 +1756,17 @@ def archive_all_handler(bot, update, chat_data):
     if chat_data.get("archived") is None:
         chat_data["archived"] = {}
 
-    for (key, value) in chat_data["plots"].items():
-        if isinstance(key, int) and key not in chat_data["archived"].keys():
-            creator = value.get_creator()
-            if isinstance(creator, tuple) and str(creator[1]) == str(user.id):
-                chat_data["archived"][key] = value
-            elif not isinstance(creator, tuple) and str(creator) == str(username):
-                chat_data["archived"][key] = value
-                value.set_creator(username, user.id)
+    owned, changed = get_user_plots(chat_id, chat_data, user)
+    index = get_plot_index(chat_id, chat_data)
+    for key in owned:
+        if key not in chat_data["archived"]:
+            chat_data["archived"][key] = True
+            index.discard(key)
+            changed.append(("archived", key))
 
     send_message(bot, chat_id, "Your plots have been archived.")
-    telegram.ext.PicklePersistence.flush(pp)
+    if len(changed) > 0:
+        persist(chat_id, chat_data, *changed)
 
 
 def unarchive_all_handler(bot, update, chat_data):
@@ -1398,7 +1778,6 @@ def unarchive_all_handler(bot, update, chat_data):
     """
     chat_id = update.message.chat.id
     user = update.message.from_user
-    username = get_username(user)
 
     if chat_data.get("plots") is None:
         chat_data["plots"] = {}
@@ -1408,17 +1787,17 @@ def unarchive_all_handler(bot, update, chat_data):
     if chat_data.get("archived") is None:
         chat_data["archived"] = {}
 
-    for (key, value) in chat_data["plots"].items():
-        if isinstance(key, int) and key in chat_data["archived"].keys():
-            creator = value.get_creator()
-            if isinstance(creator, tuple) and str(creator[1]) == str(user.id):
-                del chat_data["archived"][key]
-            elif not isinstance(creator, tuple) and str(creator) == str(username):
-                del chat_data["archived"][key]
-                value.set_creator(username, user.id)
+    owned, changed = get_user_plots(chat_id, chat_data, user)
+    index = get_plot_index(chat_id, chat_data)
+    for key in owned:
+        if key in chat_data["archived"]:
+            del chat_data["archived"][key]
+            index.add(key)
+            changed.append(("archived", key))
 
     send_message(bot, chat_id, "Your plots have been unarchived.")
-    telegram.ext.PicklePersistence.flush(pp)
+    if len(changed) > 0:
+        persist(chat_id, chat_data, *changed)
 
 
 def last_updated_handler(bot, update, chat_data, args):
@@ -1490,17 +1869,17 @@ def whos_plotted_handler(bot, update, chat_data, args):
         return
 
     points = plot.get_points()
-    text = "Currently plotted on (" + str(plot_id) +  "):\n\n"
+    blocks = ["Currently plotted on (" + str(plot_id) +  "):\n\n"]
     for p in points:
         if isinstance(plot, RadarPlot):
             if len(p[1]) >= 2:
                 vals_str = ", ".join([str(x) for x in p[1][::-1][-1:] + p[1][::-1][:-1]])
             else:
                 vals_str = ", ".join([str(x) for x in p[1]])
-            text += str(p[0]) + ": (" + vals_str + ")\n"
+            blocks.append(str(p[0]) + ": (" + vals_str + ")\n")
         else:
-            text += str(p[0]) + ": (" + str(p[1]) + ", " + str(p[2]) + ")\n"
-    send_message(bot, chat_id, text)
+            blocks.append(str(p[0]) + ": (" + str(p[1]) + ", " + str(p[2]) + ")\n")
+    send_long_message(bot, chat_id, blocks)
 
 
 def triangle_plot_handler(bot, update, chat_data, args):
@@ -1525,24 +1904,25 @@ def triangle_plot_handler(bot, update, chat_data, args):
     if chat_data.get("plots") is None:
         chat_data["plots"] = {}
 
-    max_key = max(chat_data["plots"].keys()) if len(chat_data["plots"].keys()) > 0 else 0
+    plot_id = get_plot_index(chat_id, chat_data).allocate((username, user.id))
 
     if len(args) == 0:
-        send_message(bot, chat_id, "You have created an empty plot (" + str(max_key + 1) + ") successfully!")
+        send_message(bot, chat_id, "You have created an empty plot (" + str(plot_id) + ") successfully!")
 
     plot = TrianglePlot(" ".join(plot_args.get("title")) if plot_args.get("title") is not None else None,
                 " ".join(plot_args.get("xleft")) if plot_args.get("xleft") is not None else None,
                 " ".join(plot_args.get("xright")) if plot_args.get("xright") is not None else None,
                 " ".join(plot_args.get("ytop")) if plot_args.get("ytop") is not None else None,
                 (username, user.id),
-                max_key + 1,
+                plot_id,
                 plot_args.get("custompoints") if plot_args.get("custompoints") is not None else False)
-    chat_data["plots"][max_key + 1] = plot
+    chat_data["plots"][plot_id] = plot
 
     send_message(bot, chat_id, str(" ".join(plot_args.get("title", ""))) +
-                                   " (" + str(max_key + 1) + ") was created successfully!")
+                                   " (" + str(plot_id) + ") was created successfully!")
 
-    show_plot_handler(bot, update, chat_data, [max_key + 1])
+    persist(chat_id, chat_data, ("plots", plot_id), ("plot_index",))
+    show_plot_handler(bot, update, chat_data, [plot_id])
 
 
 def zoom_handler(bot, update, chat_data, args):
@@ -1584,40 +1964,36 @@ def zoom_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, "You can't do that on radar plots!")
         return
 
-    result = plot.generate_plot(zoom_x_min=min_x, zoom_y_min=min_y, zoom_x_max=max_x, zoom_y_max=max_y)
-
-    if result is None:
-        return
-
-    if result[0] == 1:
-        send_message(bot, chat_id, result[1])
-        return
-    elif result[0] == 0:
-        bot.send_photo(chat_id=chat_id, photo=result[1])
+    send_plot(bot, chat_id, plot, zoom_x_min=min_x, zoom_y_min=min_y, zoom_x_max=max_x, zoom_y_max=max_y)
 
 
 def contour_handler(bot, update, chat_data, args):
     """
-    Sends a message with a contour of the points as distances from the center of the data.
+    Sends a message with a contour of the points as distances from the center of the data, or as their density.
     :param bot: The Telegram bot for handling messages.
     :param update: The update data from the message, including the chat and user that sent it.
     :param chat_data: The dictionary of data for the chat.
-    :param args: A possibly empty list containing a plot ID and a label toggle value.
+    :param args: A possibly empty list containing a plot ID, a label toggle value and a contour mode.
     """
     chat_id = update.message.chat.id
 
-    # Args are: {optional plot_id} {optional toggle for labels}
-    if len(args) > 2:
-        send_message(bot, chat_id, "usage: /contour {plot_id} {optional 0/1 toggle for labels}")
+    # Args are: {optional plot_id} {optional toggle for labels} {optional mode}
+    if len(args) > 3:
+        send_message(bot, chat_id, "usage: /contour {plot_id} {optional 0/1 toggle for labels} "
+                                   "{optional mode: distance/density}")
+        return
+
+    mode = "distance" if len(args) != 3 else args[2].lower()
+    if mode not in MODES:
+        send_message(bot, chat_id, "The contour mode must be one of: " + ", ".join(MODES) + "!")
         return
 
     if chat_data.get("archived") is None:
         chat_data["archived"] = {}
 
     try:
-        plot_id = int(args[0]) if len(args) >= 1 else int(max({k:v for k, v in chat_data["plots"].items()
-                                                               if k not in chat_data["archived"]}.keys()))
-        toggle = 1 if len(args) != 2 else int(args[1])
+        plot_id = int(args[0]) if len(args) >= 1 else get_default_plot_id(chat_id, chat_data)
+        toggle = 1 if len(args) < 2 else int(args[1])
     except ValueError:
         send_message(bot, chat_id, "The plot ID and optional toggle must be an integer!")
         return
@@ -1638,18 +2014,10 @@ def contour_handler(bot, update, chat_data, args):
 
     if len(plot.get_points()) < 2:
         send_message(bot, chat_id, "That plot (" + str(plot_id) + ") must have at least 2 points!")
-
-    toggle_labels = True if toggle > 0 else False
-    result = plot.generate_plot(toggle_labels=toggle_labels, contour=True)
-
-    if result is None:
         return
 
-    if result[0] == 1:
-        send_message(bot, chat_id, result[1])
-        return
-    elif result[0] == 0:
-        bot.send_photo(chat_id=chat_id, photo=result[1])
+    toggle_labels = True if toggle > 0 else False
+    send_plot(bot, chat_id, plot, toggle_labels=toggle_labels, contour=True, density=(mode == "density"))
 
 
 def my_bet_data_handler(bot, update, chat_data):
@@ -1676,10 +2044,7 @@ def my_bet_data_handler(bot, update, chat_data):
            "Average Difference: " + str(chat_data["all_user_bet_data"][user_id].get("avg_diff")) + "\n" +  \
            "Winning Average Difference: " + str(chat_data["all_user_bet_data"][user_id].get("win_avg_diff"))
 
-    try:
-        send_message(bot, user_id, text)
-    except Unauthorized as u:
-        send_message(bot, chat_id, "You haven't sent a DM to the bot and thus cannot receive DMs!")
+    send_dm(bot, user_id, chat_id, [text])
 
 
 def bet_history_handler(bot, update, chat_data):
@@ -1697,9 +2062,9 @@ def bet_history_handler(bot, update, chat_data):
         send_message(bot, chat_id, "There haven't been any bets yet!")
         return
 
-    text = "All bets:\n\n"
+    blocks = ["All bets:\n\n"]
     for key in chat_data["all_bets"].keys():
-        text += "Created At: " + key + \
+        text = "Created At: " + key + \
                 "\nPlot ID: " + str(chat_data["all_bets"][key].get("plot_id")) + \
                 "\nDegree: " + str(chat_data["all_bets"][key].get("degree")) + \
                 "\nWinner: " + str(chat_data["all_bets"][key].get("winner")) + \
@@ -1710,13 +2075,10 @@ def bet_history_handler(bot, update, chat_data):
             text += str(username) + ": " + str(value) + "\n"
         text += "\n---\n\n"
 
-        # Send and reset.
-        try:
-            send_message(bot, user_id, text)
-        except Unauthorized as u:
-            send_message(bot, chat_id, "You haven't sent a DM to the bot and thus cannot receive DMs!")
-            break
-        text = ""
+        # Each bet is kept in one message where possible.
+        blocks.append(text)
+
+    send_dm(bot, user_id, chat_id, blocks)
 
 
 def percent_plot_me_handler(bot, update, chat_data, args):
@@ -1741,8 +2103,7 @@ def percent_plot_me_handler(bot, update, chat_data, args):
 
     try:
         # Select the most recent (max) key from plots that aren't archived by default.
-        plot_id = int(args[0]) if len(args) >= 3 else int(max({k: v for k, v in chat_data["plots"].items()
-                                                               if k not in chat_data["archived"]}.keys()))
+        plot_id = int(args[0]) if len(args) >= 3 else get_default_plot_id(chat_id, chat_data)
         percent_x = float(args[1] if len(args) >= 3 else args[0])
         percent_y = float(args[2] if len(args) >= 3 else args[1])
         err_x = float(args[3] if len(args) >= 4 else 0)
@@ -1802,19 +2163,10 @@ def percent_plot_me_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, result[1])
         return
     elif result[0] == 0:
-        img = plot.generate_plot()
-
-        if img is None:
-            return
-
-        if img[0] == 1:
-            send_message(bot, chat_id, img[1])
-            return
-        elif img[0] == 0:
-            bot.send_photo(chat_id=chat_id, photo=img[1])
+        send_plot_debounced(bot, chat_id, plot)
 
         chat_data["plots"][plot_id].set_last_modified(datetime.datetime.now())
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("plots", plot_id))
 
 
 def radar_plot_handler(bot, update, chat_data, args):
@@ -1839,21 +2191,22 @@ def radar_plot_handler(bot, update, chat_data, args):
     if chat_data.get("plots") is None:
         chat_data["plots"] = {}
 
-    max_key = max(chat_data["plots"].keys()) if len(chat_data["plots"].keys()) > 0 else 0
+    plot_id = get_plot_index(chat_id, chat_data).allocate((username, user.id))
 
     if len(args) == 0:
-        send_message(bot, chat_id, "You have created an empty plot (" + str(max_key + 1) + ") successfully!")
+        send_message(bot, chat_id, "You have created an empty plot (" + str(plot_id) + ") successfully!")
 
     plot = RadarPlot(" ".join(plot_args.get("title")) if plot_args.get("title") is not None else None,
                      (plot_args.get("labels")[::-1][-1:] + plot_args.get("labels")[::-1][:-1]) if plot_args.get("labels") is not None else [""],
                 (username, user.id),
-                max_key + 1)
-    chat_data["plots"][max_key + 1] = plot
+                plot_id)
+    chat_data["plots"][plot_id] = plot
 
     send_message(bot, chat_id, str(" ".join(plot_args.get("title", ""))) +
-                                   " (" + str(max_key + 1) + ") was created successfully!")
+                                   " (" + str(plot_id) + ") was created successfully!")
 
-    show_plot_handler(bot, update, chat_data, [max_key + 1])
+    persist(chat_id, chat_data, ("plots", plot_id), ("plot_index",))
+    show_plot_handler(bot, update, chat_data, [plot_id])
 
 
 def radar_plot_me_handler(bot, update, chat_data, args):
@@ -1903,19 +2256,10 @@ def radar_plot_me_handler(bot, update, chat_data, args):
         send_message(bot, chat_id, result[1])
         return
     elif result[0] == 0:
-        img = plot.generate_plot()
-
-        if img is None:
-            return
-
-        if img[0] == 1:
-            send_message(bot, chat_id, img[1])
-            return
-        elif img[0] == 0:
-            bot.send_photo(chat_id=chat_id, photo=img[1])
+        send_plot_debounced(bot, chat_id, plot)
 
         chat_data["plots"][plot_id].set_last_modified(datetime.datetime.now())
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("plots", plot_id))
 
 
 def plot_crowdsource_handler(bot, update, chat_data, args):
@@ -1974,8 +2318,9 @@ def plot_crowdsource_handler(bot, update, chat_data, args):
         return
 
     send_message(bot, chat_id, result[1])
-    telegram.ext.PicklePersistence.flush(pp)
-    show_plot_handler(bot, update, chat_data, [plot_id])
+    if result[0] == 0:
+        send_plot_debounced(bot, chat_id, plot)
+    persist(chat_id, chat_data, ("plots", plot_id))
 
 
 def crowdsource_consent_handler(bot, update, chat_data, args):
@@ -1999,8 +2344,7 @@ def crowdsource_consent_handler(bot, update, chat_data, args):
 
     try:
         # Select the most recent (max) key from plots that aren't archived by default.
-        plot_id = int(args[0]) if len(args) == 1 else int(max({k:v for k, v in chat_data["plots"].items()
-                                                               if k not in chat_data["archived"]}.keys()))
+        plot_id = int(args[0]) if len(args) == 1 else get_default_plot_id(chat_id, chat_data)
     except ValueError:
         send_message(bot, chat_id, "Plot ID must be an int!")
         return
@@ -2021,7 +2365,7 @@ def crowdsource_consent_handler(bot, update, chat_data, args):
         return
 
     send_message(bot, chat_id, result[1])
-    telegram.ext.PicklePersistence.flush(pp)
+    persist(chat_id, chat_data, ("plots", plot_id))
 
 
 def my_crowdsourced_points_handler(bot, update, chat_data, args):
@@ -2110,6 +2454,57 @@ def whos_crowdsourceable_handler(bot, update, chat_data, args):
     send_message(bot, chat_id, result[1])
 
 
+def page_handler(bot, update):
+    """
+    Shows another page of a long listing when one of its page buttons is pressed.
+    :param bot: The Telegram bot for handling messages.
+    :param update: The update data from the button press, including the message the button is on.
+    """
+    query = update.callback_query
+    page = PAGER.get_page(query.data)
+    if page is None:
+        bot.answer_callback_query(query.id, text="That list has expired. Run the command again to see it.")
+        return
+    bot.answer_callback_query(query.id)
+
+    text, markup = page
+    chat_id = query.message.chat_id
+    message_id = query.message.message_id
+
+    def on_error(e):
+        # Pressing the button for the page already shown changes nothing, which Telegram reports as an error.
+        if "not modified" not in str(e).lower():
+            logging.getLogger(__name__).warning("Turning the page in chat %s failed: %s", chat_id, e)
+
+    OUTBOUND.submit(chat_id, lambda: bot.edit_message_text(text, chat_id=chat_id, message_id=message_id,
+                                                           reply_markup=markup), on_error=on_error)
+
+
+def get_outbound_stats():
+    """
+    :return: A line of text with the outbound queue's depth and counts of messages sent, retried and failed.
+    """
+    stats = OUTBOUND.get_stats()
+    return "Outbound: %d waiting (at most %d), %d sent, %d retried, %d failed." % (
+        stats["depth"], stats["max_depth"], stats["sent"], stats["retried"], stats["failed"])
+
+
+def bot_stats_handler(bot, update):
+    """
+    Sends the owner of the bot how many times each command was used, how long they took, and what they cost in
+    renders, saves and uploads.
+    :param bot: The Telegram bot for handling messages.
+    :param update: The update data from the message, including the chat and user that sent it.
+    """
+    chat_id = update.message.chat.id
+
+    if OWNER_ID is None or str(update.message.from_user.id) != OWNER_ID:
+        send_message(bot, chat_id, "Only the owner of the bot can do that!")
+        return
+
+    send_long_message(bot, chat_id, [line + "\n" for line in METRICS.to_lines(get_outbound_stats())])
+
+
 def handle_error(bot, update, error):
     """
     Handle a Telegram or Python error. If a Telegram error, log it specically.
@@ -2215,7 +2610,7 @@ if __name__ == "__main__":
                 ("my_crowdsourced_points", 2, my_crowdsourced_points_aliases),
                 ("whos_crowdsourceable", 2, whos_crowdsourceable_aliases)]
     for c in commands:
-        func = locals()[c[0] + "_handler"]
+        func = METRICS.instrument(c[0], locals()[c[0] + "_handler"])
         if c[1] == 0:
             dispatcher.add_handler(CommandHandler(c[2], func, pass_args=True))
         elif c[1] == 1:
@@ -2225,14 +2620,25 @@ if __name__ == "__main__":
         elif c[1] == 3:
             dispatcher.add_handler(CommandHandler(c[2], func, pass_chat_data=True, pass_user_data=True))
 
+    dispatcher.add_handler(CallbackQueryHandler(METRICS.instrument("page", page_handler),
+                                                pattern="^" + CALLBACK_PREFIX + " "))
+    dispatcher.add_handler(CommandHandler("botstats", bot_stats_handler))
+
     dispatcher.add_error_handler(handle_error)
 
     logging.basicConfig(
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         level=logging.INFO, filename='logging.txt', filemode='a+')
+    METRICS.start_logging(METRICS_LOG_SECONDS, extra=get_outbound_stats)
 
     #updater.start_webhook(listen="0.0.0.0", port=PORT, url_path=TOKEN)
     #updater.bot.set_webhook("https://plot-yourself-bot.herokuapp.com/" + TOKEN)
 
     updater.start_polling()
+    # Load the drawing libraries in the background so the first plot doesn't wait on them (and render workers
+    # started after this inherit them).
+    threading.Thread(target=preload, daemon=True).start()
     updater.idle()
+    flush_pending_plots()
+    RENDER_POOL.shutdown()
+    OUTBOUND.shutdown()